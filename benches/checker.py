@@ -0,0 +1,65 @@
+"""Compares the per-URL cost of sqlite_robotstxt.RobotsChecker with one
+`select robotstxt_matches(?, ?, ?)` per URL, the way a crawler would call the
+extension without it.
+
+  make bench-python, or python3 benches/checker.py
+
+Set ROBOTSTXT_EXTENSION to benchmark another build of the extension.
+"""
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "bindings" / "python"))
+
+from sqlite_robotstxt import RobotsChecker  # noqa: E402
+
+EXT_PATH = os.environ.get("ROBOTSTXT_EXTENSION", str(ROOT / "dist" / "release" / "robotstxt0"))
+AGENT = "Twitterbot"
+URLS = [
+    f"https://www.google.com/{prefix}/{i}?q={i}"
+    for i in range(2_000)
+    for prefix in ["search", "groups", "maps", "books"]
+]
+
+
+def per_url_microseconds(check, urls, rounds=3):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        check(urls)
+        best = min(best, time.perf_counter() - start)
+    return best / len(urls) * 1e6
+
+
+def main():
+    robotstxt = (ROOT / "tests" / "examples" / "google.com.robots.txt").read_text("utf-8")
+    db = sqlite3.connect(":memory:")
+    db.enable_load_extension(True)
+    db.load_extension(EXT_PATH)
+
+    def scalar(urls):
+        return [
+            bool(db.execute("select robotstxt_matches(?, ?, ?)", [robotstxt, AGENT, url]).fetchone()[0])
+            for url in urls
+        ]
+
+    checker = RobotsChecker(robotstxt, AGENT, db=db)
+    assert scalar(URLS[:200]) == checker.allowed(URLS[:200])
+
+    print(f"{len(URLS)} URLs against google.com's robots.txt, best of 3")
+    print(f"{'scalar robotstxt_matches()':<32} {per_url_microseconds(scalar, URLS):>8.2f} µs/URL")
+    print(f"{'RobotsChecker.allowed()':<32} {per_url_microseconds(checker.allowed, URLS):>8.2f} µs/URL")
+    for batch_size in [1, 10, 100]:
+        batches = lambda urls: [
+            checker.allowed(urls[i : i + batch_size]) for i in range(0, len(urls), batch_size)
+        ]
+        label = f"  in batches of {batch_size}"
+        print(f"{label:<32} {per_url_microseconds(batches, URLS):>8.2f} µs/URL")
+
+
+if __name__ == "__main__":
+    main()
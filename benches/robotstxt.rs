@@ -0,0 +1,159 @@
+//! cargo bench
+//!
+//! Parses and matches the files in tests/examples, plus generated files that
+//! stress the slow paths: many rules, long lines and many user-agents.
+
+use criterion::{black_box, criterion_group, criterion_main, BenchmarkId, Criterion, Throughput};
+use sqlite_robotstxt::bench::{self, Cache, Compiled};
+use std::{fs, path::Path};
+
+const AGENT: &str = "Twitterbot";
+
+/// The robots.txt files of tests/examples, by file name.
+fn examples() -> Vec<(String, String)> {
+    let dir = Path::new(env!("CARGO_MANIFEST_DIR")).join("tests/examples");
+    let mut files: Vec<(String, String)> = fs::read_dir(dir)
+        .unwrap()
+        .filter_map(|entry| {
+            let path = entry.unwrap().path();
+            let name = path.file_name()?.to_str()?.to_owned();
+            name.ends_with(".robots.txt")
+                .then(|| (name, fs::read_to_string(&path).unwrap()))
+        })
+        .collect();
+    files.sort();
+    files
+}
+
+/// One `*` group with `count` rules: mostly literal prefixes, with some
+/// wildcard and `$`-anchored patterns mixed in.
+fn many_rules(count: usize) -> String {
+    let mut robotstxt = String::from("User-agent: *\n");
+    for i in 0..count {
+        match i % 10 {
+            0 => robotstxt.push_str(&format!("Disallow: /*.ext{}$\n", i)),
+            1 => robotstxt.push_str(&format!("Disallow: /search*q={}\n", i)),
+            2 => robotstxt.push_str(&format!("Allow: /section/{}/public\n", i)),
+            _ => robotstxt.push_str(&format!("Disallow: /section/{}/\n", i)),
+        }
+    }
+    robotstxt
+}
+
+/// Rules and comments with very long paths.
+fn long_lines(count: usize, len: usize) -> String {
+    let segment = "a".repeat(len);
+    let mut robotstxt = String::from("User-agent: *\n");
+    for i in 0..count {
+        robotstxt.push_str(&format!("# {}\nDisallow: /{}/{}\n", segment, i, segment));
+    }
+    robotstxt
+}
+
+/// `count` groups, each naming a few user-agents with a handful of rules.
+fn many_agents(count: usize) -> String {
+    let mut robotstxt = String::new();
+    for i in 0..count {
+        robotstxt.push_str(&format!(
+            "User-agent: bot{}\nUser-agent: crawler{}\nDisallow: /private/{}\nAllow: /private/{}/ok\nCrawl-delay: 1\n\n",
+            i, i, i, i
+        ));
+    }
+    robotstxt.push_str(&format!("User-agent: {}\nDisallow: /nope\n", AGENT));
+    robotstxt
+}
+
+fn corpus() -> Vec<(String, String)> {
+    let mut corpus = examples();
+    corpus.push(("many-rules-10k".to_owned(), many_rules(10_000)));
+    corpus.push(("long-lines".to_owned(), long_lines(200, 4096)));
+    corpus.push(("many-agents-2k".to_owned(), many_agents(2_000)));
+    corpus
+}
+
+/// Paths that hit, miss and nearly miss the rules of any corpus file.
+fn urls() -> Vec<String> {
+    let mut urls = vec![
+        "https://example.com/".to_owned(),
+        "https://example.com/search?q=robots".to_owned(),
+        "https://example.com/groups".to_owned(),
+        "https://example.com/w/index.php?title=Special:Search".to_owned(),
+        "https://example.com/private/12/ok".to_owned(),
+    ];
+    for i in (0..10_000).step_by(997) {
+        urls.push(format!("https://example.com/section/{}/page.html", i));
+        urls.push(format!("https://example.com/section/{}/public/index", i));
+        urls.push(format!("https://example.com/file.ext{}", i));
+    }
+    urls
+}
+
+fn parse(c: &mut Criterion) {
+    let mut group = c.benchmark_group("parse");
+    for (name, robotstxt) in corpus() {
+        group.throughput(Throughput::Bytes(robotstxt.len() as u64));
+        group.bench_with_input(BenchmarkId::new("utils::parse", &name), &robotstxt, |b, r| {
+            b.iter(|| bench::parse(black_box(r)))
+        });
+        group.bench_with_input(BenchmarkId::new("compile", &name), &robotstxt, |b, r| {
+            b.iter(|| Compiled::new(black_box(r)))
+        });
+    }
+    group.finish();
+}
+
+fn matches(c: &mut Criterion) {
+    let urls = urls();
+    let mut group = c.benchmark_group("matches");
+    group.throughput(Throughput::Elements(urls.len() as u64));
+    for (name, robotstxt) in corpus() {
+        let compiled = Compiled::new(&robotstxt);
+        let blob = compiled.to_blob();
+
+        // what robotstxt_matches() did before compiled rules existed
+        group.bench_with_input(BenchmarkId::new("reparse", &name), &robotstxt, |b, r| {
+            b.iter(|| {
+                for url in &urls {
+                    black_box(
+                        robotstxt::DefaultMatcher::default().one_agent_allowed_by_robots(
+                            r, AGENT, url,
+                        ),
+                    );
+                }
+            })
+        });
+        group.bench_function(BenchmarkId::new("linear", &name), |b| {
+            b.iter(|| {
+                for url in &urls {
+                    black_box(compiled.allowed_linear(AGENT, url));
+                }
+            })
+        });
+        group.bench_function(BenchmarkId::new("trie", &name), |b| {
+            b.iter(|| {
+                for url in &urls {
+                    black_box(compiled.allowed_trie(AGENT, url));
+                }
+            })
+        });
+        group.bench_function(BenchmarkId::new("blob", &name), |b| {
+            b.iter(|| {
+                for url in &urls {
+                    black_box(bench::blob_allowed(&blob, AGENT, url));
+                }
+            })
+        });
+        group.bench_with_input(BenchmarkId::new("cache", &name), &robotstxt, |b, r| {
+            let mut cache = Cache::default();
+            b.iter(|| {
+                for url in &urls {
+                    black_box(cache.allowed(r, AGENT, url));
+                }
+            })
+        });
+    }
+    group.finish();
+}
+
+criterion_group!(benches, parse, matches);
+criterion_main!(benches);
@@ -0,0 +1,151 @@
+"""Measures rows/sec of the extension's SQL functions and table functions,
+through SQLite, over tests/examples and generated large robots.txt files.
+
+  make bench-sql, or python3 benches/sql.py [--json results.json]
+
+Set ROBOTSTXT_EXTENSION to benchmark another build of the extension.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+EXT_PATH = os.environ.get("ROBOTSTXT_EXTENSION", str(ROOT / "dist" / "release" / "robotstxt0"))
+AGENT = "Twitterbot"
+MIN_SECONDS = 1.0
+
+
+def many_rules(count):
+    lines = ["User-agent: *"]
+    for i in range(count):
+        lines.append(
+            {
+                0: f"Disallow: /*.ext{i}$",
+                1: f"Disallow: /search*q={i}",
+                2: f"Allow: /section/{i}/public",
+            }.get(i % 10, f"Disallow: /section/{i}/")
+        )
+    return "\n".join(lines) + "\n"
+
+
+def long_lines(count, length):
+    segment = "a" * length
+    return "User-agent: *\n" + "".join(
+        f"# {segment}\nDisallow: /{i}/{segment}\n" for i in range(count)
+    )
+
+
+def many_agents(count):
+    return "".join(
+        f"User-agent: bot{i}\nUser-agent: crawler{i}\nDisallow: /private/{i}\nAllow: /private/{i}/ok\nCrawl-delay: 1\n\n"
+        for i in range(count)
+    ) + f"User-agent: {AGENT}\nDisallow: /nope\n"
+
+
+def corpus():
+    files = [
+        (path.name, path.read_text("utf-8"))
+        for path in sorted((ROOT / "tests" / "examples").glob("*.robots.txt"))
+    ]
+    files.append(("many-rules-10k", many_rules(10_000)))
+    files.append(("long-lines", long_lines(200, 4096)))
+    files.append(("many-agents-2k", many_agents(2_000)))
+    return files
+
+
+def urls(count=10_000):
+    base = [
+        "https://example.com/",
+        "https://example.com/search?q=robots",
+        "https://example.com/groups",
+        "https://example.com/w/index.php?title=Special:Search",
+        "https://example.com/private/12/ok",
+    ]
+    generated = [
+        url
+        for i in range(0, 10_000, 7)
+        for url in [
+            f"https://example.com/section/{i}/page.html",
+            f"https://example.com/section/{i}/public/index",
+            f"https://example.com/file.ext{i}",
+        ]
+    ]
+    return (base + generated)[:count]
+
+
+def rows_per_sec(db, sql, params):
+    """Runs sql until MIN_SECONDS have passed, returning rows/sec."""
+    rows = 0
+    start = time.perf_counter()
+    while True:
+        rows += len(db.execute(sql, params).fetchall())
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SECONDS:
+            return rows / elapsed
+
+
+BENCHMARKS = {
+    # the robots.txt is a bound parameter, so it's compiled once per statement
+    "robotstxt_matches": """
+      select robotstxt_matches(:robotstxt, :agent, value) from json_each(:urls)
+    """,
+    # a non-constant robots.txt argument goes through the connection's cache
+    "robotstxt_matches (cached)": """
+      select robotstxt_matches(:robotstxt || '', :agent, value) from json_each(:urls)
+    """,
+    "robotstxt_matches (compiled)": """
+      select robotstxt_matches(robotstxt_compile(:robotstxt), :agent, value) from json_each(:urls)
+    """,
+    # paths stored by robotstxt_path(), so only the match itself is measured
+    "robotstxt_matches_path": """
+      select robotstxt_matches_path(:robotstxt, :agent, value) from json_each(:paths)
+    """,
+    "robotstxt_matches_batch": """
+      select allowed from robotstxt_matches_batch(:robotstxt, :agent, :urls)
+    """,
+    "robotstxt_rules": """
+      select user_agent, source, rule_type, path from robotstxt_rules(:robotstxt)
+    """,
+    "robotstxt_user_agents": """
+      select name, source from robotstxt_user_agents(:robotstxt)
+    """,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    args = parser.parse_args()
+
+    db = sqlite3.connect(":memory:")
+    db.enable_load_extension(True)
+    db.load_extension(EXT_PATH)
+    version = db.execute("select robotstxt_version()").fetchone()[0]
+
+    params = {"agent": AGENT, "urls": json.dumps(urls())}
+    params["paths"] = db.execute(
+        "select json_group_array(robotstxt_path(value)) from json_each(?)", [params["urls"]]
+    ).fetchone()[0]
+    results = []
+    print(f"sqlite-robotstxt {version}, sqlite {sqlite3.sqlite_version}")
+    print(f"{'benchmark':<30} {'file':<32} {'rows/sec':>14}")
+    for name, sql in BENCHMARKS.items():
+        if args.filter and args.filter not in name:
+            continue
+        for file_name, robotstxt in corpus():
+            value = rows_per_sec(db, sql, {**params, "robotstxt": robotstxt})
+            results.append({"benchmark": name, "file": file_name, "rows_per_sec": value})
+            print(f"{name:<30} {file_name:<32} {value:>14,.0f}")
+
+    if args.json:
+        Path(args.json).write_text(
+            json.dumps({"version": version, "results": results}, indent=2)
+        )
+
+
+if __name__ == "__main__":
+    main()
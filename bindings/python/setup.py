@@ -46,6 +46,6 @@ setup(
     # pure-python package. The noop.c was added since the windows build
     # didn't seem to respect optional=True
     ext_modules=[Extension("noop", ["noop.c"], optional=True)],
-    extras_require={"test": ["pytest"]},
+    extras_require={"fetch": ["httpx"], "test": ["pytest", "httpx"]},
     python_requires=">=3.6",
 )
@@ -1,11 +1,220 @@
 from sqlite_robotstxt.version import __version_info__, __version__
 
+import hashlib
+import json
 import os
 import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
 def loadable_path():
   loadable_path = os.path.join(os.path.dirname(__file__), "robotstxt0")
   return os.path.normpath(loadable_path)
 
-def load(conn: sqlite3.Connection)  -> None:
+SHARED_CACHE_MAX_ENTRIES = 4096
+SHARED_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+def load(conn: sqlite3.Connection, shared_cache: bool = False)  -> None:
   conn.load_extension(loadable_path())
+  if shared_cache:
+    enable_shared_cache(conn)
+
+def enable_shared_cache(conn, max_entries=SHARED_CACHE_MAX_ENTRIES, max_bytes=SHARED_CACHE_MAX_BYTES):
+  """Turns on the process-wide cache of compiled robots.txt files, shared by
+  every connection with the extension loaded, unless it's already on. A
+  budget set earlier, by any connection, is kept.
+  """
+  stats = json.loads(conn.execute("select robotstxt_shared_cache_stats()").fetchone()[0])
+  if stats["max_entries"] == 0 or stats["max_bytes"] == 0:
+    conn.execute("select robotstxt_shared_cache_configure(?, ?)", [max_entries, max_bytes])
+
+_RULES_SQL = "select user_agent, source, rule_type, path from robotstxt_rules(?)"
+
+def bulk_rules(robotstxts, workers=None, chunk_size=256, extension_path=None):
+  """Yields (key, user_agent, source, rule_type, path) for every rule of every
+  (key, robotstxt) pair in robotstxts, in input order.
+
+  The files are parsed by robotstxt_rules() on a pool of threads, each with its
+  own in-memory connection. SQLite releases the GIL while the extension parses,
+  so parsing uses every core. robotstxts is consumed lazily, with at most a few
+  chunks per worker in flight. NULL robots.txt texts produce no rules. The
+  connections are closed once the generator finishes or is closed, and an
+  error parsing any chunk is raised when that chunk's rules are reached.
+  """
+  workers = workers or os.cpu_count() or 1
+  extension_path = extension_path or loadable_path()
+  local = threading.local()
+  connections = []
+  connections_lock = threading.Lock()
+
+  def parse_chunk(chunk):
+    conn = getattr(local, "conn", None)
+    if conn is None:
+      # closed from the generator's thread once the pool has shut down
+      conn = sqlite3.connect(":memory:", check_same_thread=False)
+      with connections_lock:
+        connections.append(conn)
+      conn.enable_load_extension(True)
+      conn.load_extension(extension_path)
+      conn.enable_load_extension(False)
+      local.conn = conn
+    rules = []
+    for key, robotstxt in chunk:
+      if robotstxt is None:
+        continue
+      for rule in conn.execute(_RULES_SQL, [robotstxt]):
+        rules.append((key, *rule))
+    return rules
+
+  robotstxts = iter(robotstxts)
+  try:
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+      pending = deque()
+      while True:
+        while len(pending) < workers * 2:
+          chunk = list(islice(robotstxts, chunk_size))
+          if not chunk:
+            break
+          pending.append(executor.submit(parse_chunk, chunk))
+        if not pending:
+          break
+        yield from pending.popleft().result()
+  finally:
+    for conn in connections:
+      conn.close()
+
+def _quote(name):
+  return '"' + name.replace('"', '""') + '"'
+
+def _content_hash(robotstxt, parser):
+  if robotstxt is None:
+    return None
+  if isinstance(robotstxt, str):
+    robotstxt = robotstxt.encode("utf-8", errors="surrogatepass")
+  # rules also depend on the extension version and the connection's limits,
+  # so changing either re-parses
+  return hashlib.sha256(parser.encode("utf-8") + b"\0" + robotstxt).hexdigest()
+
+def refresh_rules(db: sqlite3.Connection, source, key, rules_table, column="robotstxt"):
+  """Keeps rules_table in sync with the robotstxt_rules() of every row of the
+  source table, re-parsing only rows whose robots.txt content changed. Rows
+  of source are identified by its key column.
+
+  rules_table has the columns (<key>, user_agent, source, rule_type, path),
+  and a "<rules_table>_hashes" table records the SHA-256 of the content each
+  key's rules were built from, along with robotstxt_version() and the
+  connection's robotstxt_limits(). Changes are found and applied in a single
+  BEGIN IMMEDIATE transaction, so writes to source can't slip in between, and
+  only keys and hashes are held in memory. If db is already in a transaction,
+  they're applied in a savepoint of it instead. Table and column names are
+  quoted, so they can be any string. The extension must be loaded on db.
+
+  Returns a dict counting the "changed", "deleted" and "unchanged" rows.
+  """
+  index = _quote(f"{rules_table}_{key}")
+  hashes_table = _quote(f"{rules_table}_hashes")
+  rules_table, source, key, column = map(_quote, (rules_table, source, key, column))
+  nested = db.in_transaction
+  db.execute("savepoint refresh_rules" if nested else "begin immediate")
+  try:
+    db.execute(f"""
+      create table if not exists {rules_table}(
+        {key}, user_agent text, source int, rule_type text, path text
+      )
+    """)
+    db.execute(f"create index if not exists {index} on {rules_table}({key})")
+    db.execute(f"create table if not exists {hashes_table}(key primary key, content_hash text)")
+
+    parser = "\0".join(db.execute("select robotstxt_version(), robotstxt_limits()").fetchone())
+    previous = dict(db.execute(f"select key, content_hash from {hashes_table}"))
+    changed = []
+    unchanged = 0
+    for row_key, robotstxt in db.execute(f"select {key}, {column} from {source}"):
+      content_hash = _content_hash(robotstxt, parser)
+      if row_key in previous and previous.pop(row_key) == content_hash:
+        unchanged += 1
+      else:
+        changed.append((row_key, content_hash))
+    # whatever is left no longer exists in the source table
+    deleted = list(previous)
+
+    for row_key in deleted:
+      db.execute(f"delete from {rules_table} where {key} = ?", [row_key])
+      db.execute(f"delete from {hashes_table} where key = ?", [row_key])
+    for row_key, content_hash in changed:
+      db.execute(f"delete from {rules_table} where {key} = ?", [row_key])
+      if content_hash is not None:
+        db.execute(
+          f"""
+            insert into {rules_table}
+            select ?, user_agent, source, rule_type, path
+            from robotstxt_rules((select {column} from {source} where {key} = ?))
+          """,
+          [row_key, row_key],
+        )
+      db.execute(
+        f"insert or replace into {hashes_table}(key, content_hash) values (?, ?)",
+        [row_key, content_hash],
+      )
+    if nested:
+      db.execute("release refresh_rules")
+    else:
+      db.commit()
+  except BaseException:
+    if nested:
+      db.execute("rollback to refresh_rules")
+      db.execute("release refresh_rules")
+    else:
+      db.rollback()
+    raise
+  return {"changed": len(changed), "deleted": len(deleted), "unchanged": unchanged}
+
+class RobotsChecker:
+  """Checks URLs against one robots.txt file, without a SQL statement per URL.
+
+  allowed() matches a whole list of URLs with a single robotstxt_matches_batch()
+  query. The file is compiled once, with robotstxt_compile(), when the checker
+  is created. Later calls pass the compiled BLOB, which is read in place, so
+  they only pay for matching.
+
+  By default the checker opens its own in-memory connection and loads the
+  extension from extension_path, which defaults to loadable_path(). Pass db to
+  use a connection that already has the extension loaded instead.
+  """
+
+  _BATCH_SQL = "select allowed from robotstxt_matches_batch(?, ?, ?)"
+
+  def __init__(self, robotstxt, user_agent, db=None, extension_path=None):
+    if db is None:
+      db = sqlite3.connect(":memory:")
+      db.enable_load_extension(True)
+      db.load_extension(extension_path or loadable_path())
+      db.enable_load_extension(False)
+    self.db = db
+    self.robotstxt = robotstxt if robotstxt is not None else ""
+    self.user_agent = user_agent
+    self.compiled = db.execute("select robotstxt_compile(?)", [self.robotstxt]).fetchone()[0]
+
+  def allowed(self, urls, user_agent=None):
+    """Returns whether each of urls may be crawled, as a list of bools in the
+    same order. urls can be full URLs or paths."""
+    urls = list(urls)
+    if not urls:
+      return []
+    rows = self.db.execute(
+      self._BATCH_SQL,
+      [self.compiled, user_agent or self.user_agent, json.dumps(urls)],
+    )
+    return [bool(allowed) for (allowed,) in rows]
+
+  def is_allowed(self, url, user_agent=None):
+    return self.allowed([url], user_agent)[0]
+
+  def crawl_delay(self, user_agent=None):
+    """The Crawl-delay that applies to the user-agent in seconds, or None."""
+    return self.db.execute(
+      "select robotstxt_crawl_delay(?, ?)",
+      [self.compiled, user_agent or self.user_agent],
+    ).fetchone()[0]
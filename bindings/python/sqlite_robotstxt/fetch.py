@@ -0,0 +1,225 @@
+"""Concurrent robots.txt fetching into a SQLite table.
+
+Requires httpx, installed with `pip install sqlite-robotstxt[fetch]`.
+"""
+import asyncio
+import sqlite3
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, urlunsplit
+
+# RFC 9309 section 2.5: crawlers must parse at least 500 KiB
+DEFAULT_MAX_BYTES = 500 * 1024
+# RFC 9309 section 2.3.1.2: follow at least five consecutive redirects
+MAX_REDIRECTS = 5
+
+CREATE_TABLE_SQL = """
+create table if not exists "{table}"(
+  url text primary key,
+  robotstxt_url text,
+  status int,
+  robotstxt blob,
+  etag text,
+  last_modified text,
+  fetched_at text,
+  error text
+)
+"""
+
+UPSERT_SQL = """
+insert into "{table}"(url, robotstxt_url, status, robotstxt, etag, last_modified, fetched_at, error)
+values (?, ?, ?, ?, ?, ?, ?, ?)
+on conflict(url) do update set
+  robotstxt_url = excluded.robotstxt_url,
+  status = excluded.status,
+  robotstxt = excluded.robotstxt,
+  etag = excluded.etag,
+  last_modified = excluded.last_modified,
+  fetched_at = excluded.fetched_at,
+  error = excluded.error
+"""
+
+# a 304 keeps the stored response and only records that it was revalidated
+NOT_MODIFIED_SQL = """
+update "{table}" set fetched_at = ?, error = null where url = ?
+"""
+
+# a failed attempt keeps the last good robots.txt and its validators, and only
+# records the attempt's status and error
+FAILED_SQL = """
+insert into "{table}"(url, robotstxt_url, status, fetched_at, error)
+values (?, ?, ?, ?, ?)
+on conflict(url) do update set
+  status = excluded.status,
+  error = excluded.error
+"""
+
+def robotstxt_url(url: str) -> str:
+  """The robots.txt URL for the site of `url`. Bare hosts are assumed https."""
+  if "://" not in url:
+    url = "https://" + url
+  parts = urlsplit(url)
+  return urlunsplit((parts.scheme, parts.netloc, "/robots.txt", "", ""))
+
+def _host(url):
+  try:
+    return urlsplit(robotstxt_url(url)).netloc
+  except Exception:
+    # _fetch_one() records the error for this URL
+    return None
+
+async def _fetch_one(client, url, validators, max_bytes):
+  """Fetches the robots.txt of `url`, returning (kind, row). Errors are
+  returned as a "failed" row for `url`, never raised."""
+  import httpx
+
+  now = datetime.now(timezone.utc).isoformat()
+  target = url
+  try:
+    target = robotstxt_url(url)
+    etag, last_modified = validators.get(url, (None, None))
+    headers = {}
+    if etag:
+      headers["If-None-Match"] = etag
+    if last_modified:
+      headers["If-Modified-Since"] = last_modified
+
+    # a caller's client may not follow redirects by default
+    async with client.stream(
+      "GET", target, headers=headers, follow_redirects=True
+    ) as response:
+      if response.status_code == 304:
+        return "not_modified", (now, url)
+      if response.status_code >= 500:
+        return "failed", (url, target, response.status_code, now, None)
+      body = bytearray()
+      # RFC 9309 section 2.3.1.3: a 4xx means there are no rules, so its
+      # body (usually an error page) is stored as an empty robots.txt
+      if response.status_code < 400:
+        # larger files are truncated, which RFC 9309 allows past 500 KiB
+        async for chunk in response.aiter_bytes():
+          body.extend(chunk[: max_bytes - len(body)])
+          if len(body) >= max_bytes:
+            break
+      # stored as raw bytes, whatever the Content-Type says, so the
+      # extension decodes them like any other robots.txt BLOB
+      return "fetched", (
+        url,
+        str(response.url),
+        response.status_code,
+        bytes(body),
+        response.headers.get("etag"),
+        response.headers.get("last-modified"),
+        now,
+        None,
+      )
+  except httpx.TooManyRedirects:
+    # RFC 9309 lets crawlers treat this as an unavailable robots.txt
+    return "failed", (url, target, None, now, "too many redirects")
+  except Exception as e:
+    # network errors, and anything else wrong with this one URL, like an
+    # invalid URL, are recorded without stopping the other fetches
+    return "failed", (url, target, None, now, f"{type(e).__name__}: {e}")
+
+async def fetch_robotstxts(
+  db: sqlite3.Connection,
+  urls,
+  table="robotstxt_fetches",
+  concurrency=64,
+  per_host=2,
+  max_bytes=DEFAULT_MAX_BYTES,
+  timeout=10.0,
+  batch_size=500,
+  user_agent=None,
+  client=None,
+):
+  """Fetches the robots.txt file of every site URL in `urls` into `table`.
+
+  Up to `concurrency` requests run at once over one pooled HTTP client, and at
+  most `per_host` of them to the same host. Rows already in `table` are
+  revalidated with their ETag/Last-Modified, and 304 responses only update
+  `fetched_at`. Results are written in transactions of `batch_size` rows, on
+  a separate thread when `db` allows it (check_same_thread=False), so writes
+  never block the event loop. Bodies are stored as BLOBs of the bytes
+  received.
+
+  `status` is the final HTTP status after redirects, or NULL when no response
+  was received, with the reason in `error`. Per RFC 9309, 4xx statuses mean
+  "allow everything" and are stored with an empty body. Callers should treat
+  5xx or NULL as "disallow everything".
+  A 5xx status or an error doesn't replace a previously fetched robots.txt:
+  its body, ETag, Last-Modified and `fetched_at` are kept, and only `status`
+  and `error` describe the failed attempt.
+
+  Returns a dict counting the "fetched", "not_modified" and "failed" URLs.
+  """
+  import httpx
+
+  db.execute(CREATE_TABLE_SQL.format(table=table))
+  urls = list(dict.fromkeys(urls))
+  validators = {
+    url: (etag, last_modified)
+    for url, etag, last_modified in db.execute(
+      f'select url, etag, last_modified from "{table}" where etag is not null or last_modified is not null'
+    )
+  }
+
+  owns_client = client is None
+  if owns_client:
+    client = httpx.AsyncClient(
+      follow_redirects=True,
+      max_redirects=MAX_REDIRECTS,
+      timeout=timeout,
+      limits=httpx.Limits(max_connections=concurrency),
+      headers={"User-Agent": user_agent} if user_agent else None,
+    )
+
+  slots = asyncio.Semaphore(concurrency)
+  host_slots = defaultdict(lambda: asyncio.Semaphore(per_host))
+  pending = {"fetched": [], "not_modified": [], "failed": []}
+  counts = {"fetched": 0, "not_modified": 0, "failed": 0}
+
+  # one writer thread keeps the batches in order
+  loop = asyncio.get_running_loop()
+  writer = ThreadPoolExecutor(max_workers=1)
+  try:
+    await loop.run_in_executor(writer, db.execute, "select 1")
+  except sqlite3.ProgrammingError:
+    # db can only be used from this thread
+    writer.shutdown()
+    writer = None
+
+  def write(batch):
+    with db:
+      db.executemany(UPSERT_SQL.format(table=table), batch["fetched"])
+      db.executemany(NOT_MODIFIED_SQL.format(table=table), batch["not_modified"])
+      db.executemany(FAILED_SQL.format(table=table), batch["failed"])
+
+  async def flush():
+    batch = dict(pending)
+    for kind in pending:
+      pending[kind] = []
+    if writer is None:
+      write(batch)
+    else:
+      await loop.run_in_executor(writer, write, batch)
+
+  async def worker(url):
+    # waiting on a busy host doesn't hold one of the global slots
+    async with host_slots[_host(url)], slots:
+      kind, row = await _fetch_one(client, url, validators, max_bytes)
+    pending[kind].append(row)
+    counts[kind] += 1
+    if sum(len(rows) for rows in pending.values()) >= batch_size:
+      await flush()
+
+  try:
+    await asyncio.gather(*(worker(url) for url in urls))
+  finally:
+    await flush()
+    if writer is not None:
+      writer.shutdown()
+    if owns_client:
+      await client.aclose()
+  return counts
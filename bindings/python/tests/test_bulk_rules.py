@@ -0,0 +1,52 @@
+import sqlite3
+
+import pytest
+
+import sqlite_robotstxt
+
+
+def robotstxts(count):
+    return [
+        (f"site-{i}", f"User-agent: *\nDisallow: /{i}\n\nUser-agent: bot-{i}\nAllow: /{i}/public")
+        for i in range(count)
+    ]
+
+
+def test_bulk_rules_matches_single_connection():
+    files = robotstxts(50) + [("empty", None)]
+    db = sqlite3.connect(":memory:")
+    db.enable_load_extension(True)
+    sqlite_robotstxt.load(db)
+    db.enable_load_extension(False)
+    db.execute("create table files(key text, robotstxt text)")
+    db.executemany("insert into files values (?, ?)", files)
+    expected = db.execute(
+        """
+          select files.key, user_agent, source, rule_type, path
+          from files
+          join robotstxt_rules(files.robotstxt)
+          order by files.rowid
+        """
+    ).fetchall()
+
+    # many small chunks spread across the workers still come back in order
+    rules = list(sqlite_robotstxt.bulk_rules(files, workers=4, chunk_size=3))
+    assert rules == expected
+    assert [key for key, *_ in rules][:4] == ["site-0", "site-0", "site-1", "site-1"]
+
+
+def test_bulk_rules_lazy_close():
+    rules = sqlite_robotstxt.bulk_rules(robotstxts(100), workers=2, chunk_size=1)
+    assert next(rules)[0] == "site-0"
+    # closing early shuts the pool down without parsing everything
+    rules.close()
+
+
+def test_bulk_rules_errors():
+    files = robotstxts(10) + [("bad", {"not": "a robots.txt"})] + robotstxts(10)
+    rules = sqlite_robotstxt.bulk_rules(files, workers=2, chunk_size=4)
+    with pytest.raises(sqlite3.Error):
+        list(rules)
+
+    with pytest.raises(sqlite3.OperationalError):
+        list(sqlite_robotstxt.bulk_rules(robotstxts(1), extension_path="/nonexistent/robotstxt0"))
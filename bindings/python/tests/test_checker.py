@@ -0,0 +1,46 @@
+import sqlite3
+
+import sqlite_robotstxt
+from sqlite_robotstxt import RobotsChecker
+
+ROBOTSTXT = """
+User-agent: *
+Disallow: /private
+Allow: /private/public
+
+User-agent: slowbot
+Disallow: /
+Crawl-delay: 2.5
+"""
+
+
+def test_allowed():
+    checker = RobotsChecker(ROBOTSTXT, "mybot")
+    assert checker.allowed(
+        ["/", "/private/x", "https://example.com/private/public?q=1", "/private"]
+    ) == [True, False, True, False]
+    assert checker.allowed([]) == []
+    assert checker.allowed(["/", "/private/x"], user_agent="slowbot") == [False, False]
+    assert checker.is_allowed("/private/public")
+    assert not checker.is_allowed("/a", user_agent="SlowBot")
+
+
+def test_crawl_delay():
+    checker = RobotsChecker(ROBOTSTXT, "slowbot")
+    assert checker.crawl_delay() == 2.5
+    assert checker.crawl_delay(user_agent="mybot") is None
+
+
+def test_bytes_and_missing_robotstxt():
+    assert RobotsChecker(ROBOTSTXT.encode(), "mybot").allowed(["/private"]) == [False]
+    assert RobotsChecker(None, "mybot").allowed(["/private"]) == [True]
+
+
+def test_shared_connection():
+    db = sqlite3.connect(":memory:")
+    db.enable_load_extension(True)
+    sqlite_robotstxt.load(db)
+    checker = RobotsChecker(ROBOTSTXT, "mybot", db=db)
+    assert checker.db is db
+    assert checker.compiled == db.execute("select robotstxt_compile(?)", [ROBOTSTXT]).fetchone()[0]
+    assert checker.allowed(["/private/x"]) == [False]
@@ -0,0 +1,188 @@
+import asyncio
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from sqlite_robotstxt.fetch import fetch_robotstxts, robotstxt_url
+
+
+def serve(routes):
+    """Starts a local HTTP server answering GET requests from `routes`, a dict
+    of path -> (status, headers, body). Returns (base_url, requests, shutdown)."""
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append((self.path, dict(self.headers)))
+            status, headers, body = routes.get(self.path, (404, {}, b"not found"))
+            if callable(body):
+                status, headers, body = body(self.headers)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+
+    return f"http://127.0.0.1:{server.server_port}", requests, stop
+
+
+def test_robotstxt_url():
+    assert robotstxt_url("https://example.com/a/b?c") == "https://example.com/robots.txt"
+    assert robotstxt_url("example.com") == "https://example.com/robots.txt"
+    assert robotstxt_url("http://example.com:8080") == "http://example.com:8080/robots.txt"
+
+
+def test_fetch_robotstxts():
+    def conditional(headers):
+        if headers.get("If-None-Match") == '"v1"':
+            return 304, {}, b""
+        return 200, {"ETag": '"v1"'}, b"User-agent: *\nDisallow: /private"
+
+    ok, ok_requests, stop_ok = serve({"/robots.txt": (200, {}, conditional)})
+    missing, _, stop_missing = serve({})
+    broken, _, stop_broken = serve({"/robots.txt": (503, {}, b"down")})
+    big, _, stop_big = serve({"/robots.txt": (200, {}, b"#" * 5000)})
+    redirect, _, stop_redirect = serve(
+        {"/robots.txt": (301, {"Location": ok + "/robots.txt"}, b"")}
+    )
+    try:
+        # written from a separate thread
+        db = sqlite3.connect(":memory:", check_same_thread=False)
+        urls = [ok + "/home", missing, broken, big, redirect]
+        counts = asyncio.run(fetch_robotstxts(db, urls, max_bytes=1000, batch_size=2))
+        assert counts == {"fetched": 4, "not_modified": 0, "failed": 1}
+
+        rows = {
+            row[0]: row[1:]
+            for row in db.execute(
+                "select url, status, robotstxt, etag, error from robotstxt_fetches"
+            )
+        }
+        assert rows[ok + "/home"] == (200, b"User-agent: *\nDisallow: /private", '"v1"', None)
+        # a 4xx allows everything, whatever its body says
+        assert rows[missing][:2] == (404, b"")
+        assert rows[broken][0] == 503
+        assert len(rows[big][1]) == 1000
+        assert rows[redirect][:2] == (200, b"User-agent: *\nDisallow: /private")
+
+        # the second run revalidates with the stored ETag
+        counts = asyncio.run(fetch_robotstxts(db, [ok + "/home"]))
+        assert counts == {"fetched": 0, "not_modified": 1, "failed": 0}
+        assert ok_requests[-1][1].get("If-None-Match") == '"v1"'
+        assert db.execute(
+            "select robotstxt from robotstxt_fetches where url = ?", [ok + "/home"]
+        ).fetchone() == (b"User-agent: *\nDisallow: /private",)
+    finally:
+        for stop in [stop_ok, stop_missing, stop_broken, stop_big, stop_redirect]:
+            stop()
+
+
+def test_fetch_robotstxts_unreachable():
+    base, _, stop = serve({})
+    stop()
+    db = sqlite3.connect(":memory:")
+    asyncio.run(fetch_robotstxts(db, [base], table="fetches", timeout=2.0))
+    status, error = db.execute("select status, error from fetches").fetchone()
+    assert status is None
+    assert error
+
+
+def test_fetch_robotstxts_failure_keeps_last_good():
+    state = {"status": 200}
+
+    def flaky(headers):
+        if state["status"] == 200:
+            return 200, {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}, b"User-agent: *\nDisallow: /a"
+        return state["status"], {}, b"down"
+
+    base, _, stop = serve({"/robots.txt": (200, {}, flaky)})
+    try:
+        db = sqlite3.connect(":memory:")
+        asyncio.run(fetch_robotstxts(db, [base]))
+        good = db.execute(
+            "select robotstxt, etag, last_modified, fetched_at from robotstxt_fetches"
+        ).fetchone()
+
+        state["status"] = 503
+        counts = asyncio.run(fetch_robotstxts(db, [base]))
+        assert counts == {"fetched": 0, "not_modified": 0, "failed": 1}
+        assert db.execute(
+            "select robotstxt, etag, last_modified, fetched_at from robotstxt_fetches"
+        ).fetchone() == good
+        assert db.execute("select status, error from robotstxt_fetches").fetchone() == (503, None)
+    finally:
+        stop()
+
+    # the server is gone, so this attempt fails without a response
+    asyncio.run(fetch_robotstxts(db, [base], timeout=2.0))
+    status, robotstxt, error = db.execute(
+        "select status, robotstxt, error from robotstxt_fetches"
+    ).fetchone()
+    assert status is None
+    assert robotstxt == b"User-agent: *\nDisallow: /a"
+    assert error
+
+
+def test_fetch_robotstxts_invalid_url():
+    base, _, stop = serve({"/robots.txt": (200, {}, b"User-agent: *\nDisallow: /a")})
+    try:
+        db = sqlite3.connect(":memory:")
+        counts = asyncio.run(fetch_robotstxts(db, ["http://[invalid", base]))
+        assert counts == {"fetched": 1, "not_modified": 0, "failed": 1}
+        rows = dict(db.execute("select url, error from robotstxt_fetches"))
+        assert rows[base] is None
+        assert "Invalid IPv6 URL" in rows["http://[invalid"]
+    finally:
+        stop()
+
+
+def test_fetch_robotstxts_raw_bytes():
+    # not UTF-8, which the extension decodes as Latin-1
+    body = "User-agent: *\nDisallow: /caf\xe9".encode("latin-1")
+    base, _, stop = serve({"/robots.txt": (200, {}, body)})
+    try:
+        db = sqlite3.connect(":memory:")
+        asyncio.run(fetch_robotstxts(db, [base]))
+        assert db.execute("select robotstxt from robotstxt_fetches").fetchone() == (body,)
+    finally:
+        stop()
+
+
+def test_fetch_robotstxts_client_follows_redirects():
+    import httpx
+
+    ok, _, stop_ok = serve({"/robots.txt": (200, {}, b"User-agent: *\nDisallow: /a")})
+    redirect, _, stop_redirect = serve(
+        {"/robots.txt": (302, {"Location": ok + "/robots.txt"}, b"")}
+    )
+
+    async def fetch(db):
+        # httpx clients don't follow redirects by default
+        async with httpx.AsyncClient() as client:
+            return await fetch_robotstxts(db, [redirect], client=client)
+
+    try:
+        db = sqlite3.connect(":memory:")
+        assert asyncio.run(fetch(db))["fetched"] == 1
+        assert db.execute("select status, robotstxt from robotstxt_fetches").fetchone() == (
+            200,
+            b"User-agent: *\nDisallow: /a",
+        )
+    finally:
+        stop_ok()
+        stop_redirect()
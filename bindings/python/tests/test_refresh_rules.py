@@ -0,0 +1,107 @@
+import sqlite3
+
+import pytest
+
+import sqlite_robotstxt
+
+
+@pytest.fixture
+def db():
+    db = sqlite3.connect(":memory:")
+    db.enable_load_extension(True)
+    sqlite_robotstxt.load(db)
+    db.enable_load_extension(False)
+    db.execute("create table sites(handle text primary key, robotstxt text)")
+    db.executemany(
+        "insert into sites values (?, ?)",
+        [
+            ("a", "User-agent: *\nDisallow: /a"),
+            ("b", "User-agent: *\nDisallow: /b\nAllow: /b/public"),
+            ("c", None),
+        ],
+    )
+    return db
+
+
+def rules(db):
+    return db.execute(
+        "select handle, path from sites_rules order by handle, source"
+    ).fetchall()
+
+
+def test_refresh_rules(db):
+    counts = sqlite_robotstxt.refresh_rules(db, "sites", "handle", "sites_rules")
+    assert counts == {"changed": 3, "deleted": 0, "unchanged": 0}
+    assert rules(db) == [("a", "/a"), ("b", "/b"), ("b", "/b/public")]
+
+    counts = sqlite_robotstxt.refresh_rules(db, "sites", "handle", "sites_rules")
+    assert counts == {"changed": 0, "deleted": 0, "unchanged": 3}
+
+    db.execute("update sites set robotstxt = 'User-agent: *\nDisallow: /new' where handle = 'a'")
+    db.execute("update sites set robotstxt = 'User-agent: *\nDisallow: /c' where handle = 'c'")
+    db.execute("delete from sites where handle = 'b'")
+    counts = sqlite_robotstxt.refresh_rules(db, "sites", "handle", "sites_rules")
+    assert counts == {"changed": 2, "deleted": 1, "unchanged": 0}
+    assert rules(db) == [("a", "/new"), ("c", "/c")]
+
+
+def test_refresh_rules_limits(db):
+    sqlite_robotstxt.refresh_rules(db, "sites", "handle", "sites_rules")
+    db.execute("select robotstxt_limits_configure(500 * 1024, 2083 * 8 - 1, 1)")
+    counts = sqlite_robotstxt.refresh_rules(db, "sites", "handle", "sites_rules")
+    assert counts == {"changed": 2, "deleted": 0, "unchanged": 1}
+    assert rules(db) == [("a", "/a"), ("b", "/b")]
+
+
+def test_refresh_rules_quoting(db):
+    db.execute('create table "odd ""sites"""("the ""handle""", "robots txt")')
+    db.execute(
+        'insert into "odd ""sites""" values (?, ?)', ["x", "User-agent: *\nDisallow: /x"]
+    )
+    counts = sqlite_robotstxt.refresh_rules(
+        db, 'odd "sites"', 'the "handle"', 'odd "rules"', column="robots txt"
+    )
+    assert counts == {"changed": 1, "deleted": 0, "unchanged": 0}
+    assert db.execute('select "the ""handle""", path from "odd ""rules"""').fetchall() == [
+        ("x", "/x")
+    ]
+
+
+def test_refresh_rules_hashes_version(db):
+    sqlite_robotstxt.refresh_rules(db, "sites", "handle", "sites_rules")
+    version, limits = db.execute("select robotstxt_version(), robotstxt_limits()").fetchone()
+    robotstxt = db.execute("select robotstxt from sites where handle = 'a'").fetchone()[0]
+    assert db.execute(
+        "select content_hash from sites_rules_hashes where key = 'a'"
+    ).fetchone()[0] == sqlite_robotstxt._content_hash(robotstxt, f"{version}\0{limits}")
+
+
+def test_refresh_rules_single_transaction(tmp_path):
+    path = str(tmp_path / "sites.db")
+    db = sqlite3.connect(path, timeout=0)
+    db.enable_load_extension(True)
+    sqlite_robotstxt.load(db)
+    db.enable_load_extension(False)
+    db.execute("create table sites(handle text primary key, robotstxt text)")
+    db.execute("insert into sites values ('a', 'User-agent: *\nDisallow: /a')")
+    db.commit()
+
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("begin immediate")
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        sqlite_robotstxt.refresh_rules(db, "sites", "handle", "sites_rules")
+    writer.execute("rollback")
+
+    assert not db.in_transaction
+    counts = sqlite_robotstxt.refresh_rules(db, "sites", "handle", "sites_rules")
+    assert counts == {"changed": 1, "deleted": 0, "unchanged": 0}
+    assert not db.in_transaction
+
+
+def test_refresh_rules_in_transaction(db):
+    # the fixture's inserts left an implicit transaction open
+    assert db.in_transaction
+    sqlite_robotstxt.refresh_rules(db, "sites", "handle", "sites_rules")
+    assert db.in_transaction
+    db.rollback()
+    assert db.execute("select count(*) from sqlite_master where name = 'sites_rules'").fetchone()[0] == 0
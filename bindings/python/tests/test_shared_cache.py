@@ -0,0 +1,49 @@
+import json
+import sqlite3
+
+import sqlite_robotstxt
+
+ROBOTSTXT = """
+User-agent: *
+Disallow: /private
+# shared cache
+"""
+
+
+def connect(**kwargs):
+    conn = sqlite3.connect(":memory:")
+    conn.enable_load_extension(True)
+    sqlite_robotstxt.load(conn, **kwargs)
+    conn.enable_load_extension(False)
+    return conn
+
+
+def shared_stats(conn):
+    return json.loads(conn.execute("select robotstxt_shared_cache_stats()").fetchone()[0])
+
+
+def test_load_shared_cache():
+    a = connect(shared_cache=True)
+    try:
+        assert shared_stats(a)["max_entries"] == sqlite_robotstxt.SHARED_CACHE_MAX_ENTRIES
+        b = connect(shared_cache=True)
+        before = shared_stats(a)
+        for conn in [a, b]:
+            assert conn.execute(
+                "select robotstxt_matches(?, 'mybot', '/private/x')", [ROBOTSTXT]
+            ).fetchone()[0] == 0
+        after = shared_stats(b)
+        assert after["misses"] - before["misses"] == 1
+        assert after["hits"] - before["hits"] == 1
+    finally:
+        a.execute("select robotstxt_shared_cache_configure(0, 0)")
+
+
+def test_enable_shared_cache_keeps_budget():
+    conn = connect()
+    try:
+        conn.execute("select robotstxt_shared_cache_configure(10, 1000000)")
+        sqlite_robotstxt.enable_shared_cache(conn)
+        assert shared_stats(conn)["max_entries"] == 10
+    finally:
+        conn.execute("select robotstxt_shared_cache_configure(0, 0)")
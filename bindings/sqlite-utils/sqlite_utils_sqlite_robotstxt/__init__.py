@@ -7,5 +7,6 @@ from sqlite_utils_sqlite_robotstxt.version import __version_info__, __version__
 @hookimpl
 def prepare_connection(conn):
     conn.enable_load_extension(True)
-    sqlite_robotstxt.load(conn)
+    # connections share parsed robots.txt files through a process-wide cache
+    sqlite_robotstxt.load(conn, shared_cache=True)
     conn.enable_load_extension(False)
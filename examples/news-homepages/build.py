@@ -1,15 +1,18 @@
-import httpx
+import asyncio
 import sqlite3
+import sqlite_robotstxt
 import sqlite_xsv
+from sqlite_robotstxt.fetch import fetch_robotstxts
 from sys import argv
-from urllib.parse import urlparse
 
 
+EXTENSION_PATH = "../../dist/debug/robotstxt0"
+
 db = sqlite3.connect(argv[1])
 
 db.enable_load_extension(True)
 sqlite_xsv.load(db)
-db.load_extension("../../dist/debug/robotstxt0")
+db.load_extension(EXTENSION_PATH)
 db.enable_load_extension(False)
 
 db.executescript('''
@@ -34,34 +37,17 @@ select
 from temp.sites_csv;
 ''')
 
-BATCH_SIZE = 50
-
-initial = db.execute("select count(*) from sites where robotstxt is null").fetchone()[0]
-
-while True:
-  remaining = db.execute("select count(*) from sites where robotstxt is null").fetchone()[0]
-  done = initial - remaining
-  print(f"[{done}/{initial} {done/initial:.2%}]")
-
-  chunk = db.execute("select rowid, url from sites where robotstxt is null limit ?", [BATCH_SIZE]).fetchall()
-
-  if len(chunk) == 0:
-    break
+urls = [url for (url,) in db.execute("select url from sites")]
+counts = asyncio.run(fetch_robotstxts(db, urls))
+print(f"fetched {counts['fetched']}, not modified {counts['not_modified']}")
 
-  updates = []
-
-  for row in chunk:
-    rowid, url = row
-    robotstxt_url = urlparse(url)._replace(path="robots.txt").geturl()
-    try:
-      response = httpx.get(robotstxt_url, follow_redirects=True)
-      robotstxt = response.text
-    except Exception:
-      robotstxt = ''
-    updates.append((robotstxt, rowid))
-
-  db.executemany("update sites set robotstxt = ? where rowid = ?", updates)
-  db.commit()
+db.execute("""
+update sites set robotstxt = coalesce(
+  (select robotstxt from robotstxt_fetches where robotstxt_fetches.url = sites.url),
+  ''
+)
+""")
+db.commit()
 
 db.executescript("""
 
@@ -73,12 +59,15 @@ CREATE TABLE sites_robotstxt_rules(
   path TEXT,
   foreign key(handle) references sites(handle)
 );
-insert into sites_robotstxt_rules
-  select
-    sites.handle,
-    rules.*
-  from sites
-  join robotstxt_rules(sites.robotstxt) as rules
 """)
 
+# parse every site's robots.txt across all cores, in sites order
+db.executemany(
+  "insert into sites_robotstxt_rules values (?, ?, ?, ?, ?)",
+  sqlite_robotstxt.bulk_rules(
+    db.execute("select handle, robotstxt from sites order by rowid"),
+    extension_path=EXTENSION_PATH,
+  ),
+)
+
 db.commit()
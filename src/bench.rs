@@ -0,0 +1,71 @@
+//! Entry points for the benchmarks in `benches/`, which can't reach the
+//! crate-private parser, matchers and cache otherwise. Not a stable API.
+
+use crate::{
+    cache::RobotsCache,
+    compiled::{get_path_params_query, CompiledRobots},
+    compiled_blob::{self, CompiledRobotsView},
+    utils,
+};
+
+/// Parses `source` like `robotstxt_rules()` and `robotstxt_user_agents()`
+/// do, returning the number of user-agents found.
+pub fn parse(source: &str) -> usize {
+    utils::parse(source).user_agents.len()
+}
+
+/// A compiled robots.txt file, as kept in the connection's cache.
+pub struct Compiled(CompiledRobots);
+
+impl Compiled {
+    pub fn new(source: &str) -> Compiled {
+        Compiled(CompiledRobots::compile(source))
+    }
+
+    /// Same as `robotstxt_matches()`, which uses the trie for large files.
+    pub fn allowed(&self, user_agent: &str, url: &str) -> bool {
+        self.0.allowed(user_agent, url)
+    }
+
+    /// Always tests every rule, like files under the trie threshold.
+    pub fn allowed_linear(&self, user_agent: &str, url: &str) -> bool {
+        self.0
+            .verdict(user_agent, &get_path_params_query(url))
+            .allowed
+    }
+
+    /// Always matches through a trie, even under the threshold.
+    pub fn allowed_trie(&self, user_agent: &str, url: &str) -> bool {
+        self.0
+            .rule_trie(user_agent)
+            .allowed(&get_path_params_query(url))
+    }
+
+    /// The output of `robotstxt_compile()`.
+    pub fn to_blob(&self) -> Vec<u8> {
+        compiled_blob::encode(&self.0)
+    }
+}
+
+/// Same as `robotstxt_matches()` given the BLOB from `robotstxt_compile()`.
+pub fn blob_allowed(blob: &[u8], user_agent: &str, url: &str) -> bool {
+    CompiledRobotsView::new(blob)
+        .map(|view| view.allowed(user_agent, url))
+        .unwrap_or(true)
+}
+
+/// The per-connection cache behind `robotstxt_matches()` and friends.
+pub struct Cache(RobotsCache);
+
+impl Default for Cache {
+    fn default() -> Self {
+        Cache(RobotsCache::default())
+    }
+}
+
+impl Cache {
+    /// Looks up (or compiles) `source`, then matches like `robotstxt_matches()`.
+    pub fn allowed(&mut self, source: &str, user_agent: &str, url: &str) -> bool {
+        self.0.get_or_compile(source.as_bytes()).allowed(user_agent, url)
+    }
+}
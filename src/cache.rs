@@ -0,0 +1,350 @@
+use std::{
+    cell::RefCell,
+    collections::{hash_map::DefaultHasher, BTreeMap, HashMap},
+    ffi::c_void,
+    hash::{Hash, Hasher},
+    rc::Rc,
+    sync::Arc,
+    time::Instant,
+};
+
+use sqlite_loadable::prelude::*;
+use sqlite_loadable::{
+    api::{self, ValueType},
+    Error, Result,
+};
+
+use crate::{
+    compiled::{AgentTries, CompiledRobots},
+    compiled_blob::{is_compiled_blob, CompiledRobotsView},
+    limits::Limits,
+    robotstxt_stats::Stats,
+    shared_cache::shared_cache,
+};
+
+pub(crate) const DEFAULT_MAX_ENTRIES: usize = 1024;
+pub(crate) const DEFAULT_MAX_BYTES: usize = 64 * 1024 * 1024;
+
+/// Buckets robots.txt documents by their length and a hash of their contents.
+/// Different documents can share a key, so entries keep their source text and
+/// a lookup only hits when it is the same.
+#[derive(Debug, Clone, Copy, PartialEq, Eq, Hash)]
+pub(crate) struct CacheKey {
+    len: usize,
+    hash: u64,
+}
+
+impl CacheKey {
+    pub(crate) fn new(source: &str) -> CacheKey {
+        let mut hasher = DefaultHasher::new();
+        source.hash(&mut hasher);
+        CacheKey {
+            len: source.len(),
+            hash: hasher.finish(),
+        }
+    }
+
+    pub(crate) fn hash(&self) -> u64 {
+        self.hash
+    }
+}
+
+struct CacheEntry {
+    /// The text `robots` was compiled from, to tell apart texts with the
+    /// same key
+    source: Box<str>,
+    robots: Arc<CompiledRobots>,
+    /// `source.len()` plus `robots.size_bytes()`, as of `trie_bytes`
+    size: usize,
+    /// `robots.trie_bytes()` when `size` was last updated
+    trie_bytes: usize,
+    last_used: u64,
+}
+
+/// A per-connection LRU cache of compiled robots.txt files, bounded by both an
+/// entry count and an approximate byte budget.
+pub struct RobotsCache {
+    entries: HashMap<CacheKey, CacheEntry>,
+    /// `last_used` tick -> key, oldest first
+    recency: BTreeMap<u64, CacheKey>,
+    tick: u64,
+    bytes: usize,
+    pub(crate) max_entries: usize,
+    pub(crate) max_bytes: usize,
+    pub(crate) hits: u64,
+    pub(crate) misses: u64,
+    pub(crate) evictions: u64,
+    /// Misses answered by the process-wide cache instead of a parse
+    pub(crate) shared_hits: u64,
+    pub(crate) stats: Stats,
+    pub(crate) limits: Limits,
+}
+
+pub type SharedRobotsCache = Rc<RefCell<RobotsCache>>;
+
+impl Default for RobotsCache {
+    fn default() -> Self {
+        RobotsCache::new(DEFAULT_MAX_ENTRIES, DEFAULT_MAX_BYTES)
+    }
+}
+
+impl RobotsCache {
+    pub(crate) fn new(max_entries: usize, max_bytes: usize) -> RobotsCache {
+        RobotsCache {
+            entries: HashMap::new(),
+            recency: BTreeMap::new(),
+            tick: 0,
+            bytes: 0,
+            max_entries,
+            max_bytes,
+            hits: 0,
+            misses: 0,
+            evictions: 0,
+            shared_hits: 0,
+            stats: Stats::default(),
+            limits: Limits::default(),
+        }
+    }
+
+    pub(crate) fn len(&self) -> usize {
+        self.entries.len()
+    }
+
+    pub(crate) fn bytes(&self) -> usize {
+        self.bytes
+    }
+
+    /// Returns the compiled form of `source`, compiling and caching it on a
+    /// miss. The connection's limits are applied first, so oversized files
+    /// are only hashed and parsed up to the limits. When the process-wide
+    /// cache is enabled, a miss looks there before compiling.
+    pub(crate) fn get_or_compile(&mut self, source: &[u8]) -> Arc<CompiledRobots> {
+        let limited = self.limits.apply(source);
+        let source = limited.text.as_ref();
+        let key = CacheKey::new(source);
+        self.tick += 1;
+        if let Some(entry) = self
+            .entries
+            .get_mut(&key)
+            .filter(|entry| *entry.source == *source)
+        {
+            self.hits += 1;
+            self.recency.remove(&entry.last_used);
+            self.recency.insert(self.tick, key);
+            entry.last_used = self.tick;
+            let robots = entry.robots.clone();
+            // tries built since the last lookup count against the budget too
+            let trie_bytes = robots.trie_bytes();
+            if trie_bytes != entry.trie_bytes {
+                entry.size = entry.size - entry.trie_bytes + trie_bytes;
+                self.bytes = self.bytes - entry.trie_bytes + trie_bytes;
+                entry.trie_bytes = trie_bytes;
+                self.evict();
+            }
+            return robots;
+        }
+
+        self.misses += 1;
+        self.stats.record_limited(&limited);
+        let stats = &mut self.stats;
+        let mut compile = || {
+            let start = Instant::now();
+            let robots = CompiledRobots::compile(source);
+            stats.record_parse(source.len(), start.elapsed());
+            robots
+        };
+        let shared = shared_cache();
+        let robots = if shared.enabled() {
+            let (robots, hit) = shared.get_or_insert_with(key, source, compile);
+            self.shared_hits += hit as u64;
+            robots
+        } else {
+            Arc::new(compile())
+        };
+        let trie_bytes = robots.trie_bytes();
+        let size = source.len() + robots.rules_size_bytes() + trie_bytes;
+        // documents larger than the whole budget are never cached
+        if self.max_entries == 0 || size > self.max_bytes {
+            return robots;
+        }
+        let replaced = self.entries.insert(
+            key,
+            CacheEntry {
+                source: source.into(),
+                robots: robots.clone(),
+                size,
+                trie_bytes,
+                last_used: self.tick,
+            },
+        );
+        // a different text with the same key
+        if let Some(replaced) = replaced {
+            self.recency.remove(&replaced.last_used);
+            self.bytes -= replaced.size;
+        }
+        self.recency.insert(self.tick, key);
+        self.bytes += size;
+        self.evict();
+        robots
+    }
+
+    /// Changes the cache's budgets, evicting entries that no longer fit.
+    pub(crate) fn resize(&mut self, max_entries: usize, max_bytes: usize) {
+        self.max_entries = max_entries;
+        self.max_bytes = max_bytes;
+        self.evict();
+    }
+
+    /// Changes the limits applied to robots.txt texts. Cached files were
+    /// compiled under the old limits, so they are dropped.
+    pub(crate) fn set_limits(&mut self, limits: Limits) {
+        if limits != self.limits {
+            self.limits = limits;
+            self.entries.clear();
+            self.recency.clear();
+            self.bytes = 0;
+        }
+    }
+
+    /// Zeroes the counters of robotstxt_stats() and robotstxt_cache_stats(),
+    /// keeping the cached files.
+    pub(crate) fn reset_stats(&mut self) {
+        self.hits = 0;
+        self.misses = 0;
+        self.evictions = 0;
+        self.shared_hits = 0;
+        self.stats = Stats::default();
+    }
+
+    fn evict(&mut self) {
+        while self.entries.len() > self.max_entries || self.bytes > self.max_bytes {
+            let oldest = match self.recency.keys().next() {
+                Some(tick) => *tick,
+                None => break,
+            };
+            let key = self.recency.remove(&oldest).unwrap();
+            if let Some(entry) = self.entries.remove(&key) {
+                self.bytes -= entry.size;
+                self.evictions += 1;
+            }
+        }
+    }
+}
+
+unsafe extern "C" fn drop_auxdata(p: *mut c_void) {
+    drop(Box::from_raw(p.cast::<Arc<CompiledRobots>>()));
+}
+
+/// Returns the compiled form of the robots.txt text in `values[argument]`.
+/// Compiled BLOBs are read in place through `compiled_value()` instead, so
+/// callers check for them first.
+///
+/// When the argument is constant for the statement (a bound parameter or a
+/// literal), the compiled rules are attached to it as SQLite auxdata, so later
+/// rows skip both parsing and the cache lookup.
+pub(crate) fn compiled_argument(
+    context: *mut sqlite3_context,
+    values: &[*mut sqlite3_value],
+    argument: usize,
+    cache: &SharedRobotsCache,
+) -> Result<Arc<CompiledRobots>> {
+    let auxdata = api::auxdata_get(context, argument as i32) as *const Arc<CompiledRobots>;
+    if !auxdata.is_null() {
+        return Ok(unsafe { (*auxdata).clone() });
+    }
+    let value = values
+        .get(argument)
+        .ok_or_else(|| Error::new_message("expected robots.txt argument"))?;
+    let robots = match compiled_value(value, cache)? {
+        CompiledValue::Parsed(robots) => robots,
+        CompiledValue::Blob(_) => {
+            return Err(Error::new_message(
+                "compiled robots.txt BLOBs can't be used here",
+            ))
+        }
+    };
+    let auxdata = Box::into_raw(Box::new(robots.clone()));
+    api::auxdata_set(
+        context,
+        argument as i32,
+        auxdata.cast::<c_void>(),
+        Some(drop_auxdata),
+    );
+    Ok(robots)
+}
+
+unsafe extern "C" fn drop_blob_tries(p: *mut c_void) {
+    drop(Box::from_raw(p.cast::<Arc<AgentTries>>()));
+}
+
+/// Somewhere to keep the tries of the compiled BLOB in `values[argument]`,
+/// attached to it as SQLite auxdata. The first call returns `None`: SQLite
+/// only keeps auxdata when the argument is constant for the statement, so a
+/// BLOB that changes every row is never indexed for a single match.
+pub(crate) fn blob_tries(
+    context: *mut sqlite3_context,
+    argument: usize,
+) -> Option<Arc<AgentTries>> {
+    let auxdata = api::auxdata_get(context, argument as i32) as *const Arc<AgentTries>;
+    if !auxdata.is_null() {
+        return Some(unsafe { (*auxdata).clone() });
+    }
+    let tries = Box::into_raw(Box::new(Arc::new(AgentTries::default())));
+    api::auxdata_set(
+        context,
+        argument as i32,
+        tries.cast::<c_void>(),
+        Some(drop_blob_tries),
+    );
+    None
+}
+
+/// A robots.txt SQLite value, ready for matching.
+pub(crate) enum CompiledValue<'a> {
+    /// The text of a robots.txt file, as TEXT or BLOB, parsed through the cache
+    Parsed(Arc<CompiledRobots>),
+    /// The BLOB output of `robotstxt_compile()`, read in place
+    Blob(CompiledRobotsView<'a>),
+}
+
+/// Returns the compiled form of a robots.txt SQLite value. Compiled BLOBs are
+/// only validated, never copied.
+pub(crate) fn compiled_value<'a>(
+    value: &'a *mut sqlite3_value,
+    cache: &SharedRobotsCache,
+) -> Result<CompiledValue<'a>> {
+    if api::value_type(value) == ValueType::Blob && is_compiled_blob(api::value_blob(value)) {
+        let view = CompiledRobotsView::new(api::value_blob(value)).map_err(Error::new_message)?;
+        return Ok(CompiledValue::Blob(view));
+    }
+    // sqlite3_value_blob() reads TEXT values in place too
+    Ok(CompiledValue::Parsed(
+        cache.borrow_mut().get_or_compile(api::value_blob(value)),
+    ))
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn colliding_keys_compare_the_text() {
+        let mut cache = RobotsCache::default();
+        let other = cache.get_or_compile(b"User-agent: *\nAllow: /");
+        let source = "User-agent: *\nDisallow: /";
+        // file the cached entry under the key of a different text
+        let key = CacheKey::new(source);
+        let (_, entry) = cache.entries.drain().next().unwrap();
+        cache.recency.clear();
+        cache.recency.insert(entry.last_used, key);
+        cache.entries.insert(key, entry);
+
+        let robots = cache.get_or_compile(source.as_bytes());
+        assert!(!Arc::ptr_eq(&robots, &other));
+        assert!(!robots.allowed("a", "https://example.com/x"));
+        assert_eq!((cache.hits, cache.misses, cache.len()), (0, 2, 1));
+        assert_eq!(cache.recency.len(), 1);
+        let again = cache.get_or_compile(source.as_bytes());
+        assert!(Arc::ptr_eq(&again, &robots));
+    }
+}
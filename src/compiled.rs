@@ -0,0 +1,792 @@
+use robotstxt::RobotsParseHandler;
+use std::{
+    borrow::Cow,
+    collections::HashMap,
+    sync::{
+        atomic::{AtomicUsize, Ordering},
+        Arc, Mutex,
+    },
+};
+
+use crate::{
+    trie::RuleTrie,
+    utils::{escape_pattern, RobotsUserAgentRuleType},
+};
+
+/// From this many Allow/Disallow rules on, `allowed_path()` matches through a
+/// `RuleTrie` of each user-agent's rules instead of testing every pattern.
+pub(crate) const TRIE_MIN_RULES: usize = 256;
+/// How many user-agents' tries a `CompiledRobots` keeps before starting over.
+const MAX_AGENT_TRIES: usize = 16;
+
+/// A single Allow/Disallow pattern, already percent-normalized by the parser.
+#[derive(Debug, Clone)]
+pub(crate) struct CompiledRule {
+    pub(crate) rule_type: RobotsUserAgentRuleType,
+    pub(crate) pattern: String,
+    pub(crate) line_number: u32,
+    /// Whether `pattern` contains a `*`, so the slower wildcard match is needed.
+    pub(crate) wildcard: bool,
+}
+
+impl CompiledRule {
+    pub(crate) fn as_ref(&self) -> RuleRef<'_> {
+        RuleRef {
+            allow: matches!(self.rule_type, RobotsUserAgentRuleType::Allow),
+            pattern: self.pattern.as_bytes(),
+            wildcard: self.wildcard,
+            line_number: self.line_number,
+        }
+    }
+}
+
+/// A borrowed rule, from either a `CompiledRobots` or a compiled BLOB.
+#[derive(Debug, Clone, Copy)]
+pub(crate) struct RuleRef<'a> {
+    pub(crate) allow: bool,
+    pub(crate) pattern: &'a [u8],
+    pub(crate) wildcard: bool,
+    pub(crate) line_number: u32,
+}
+
+/// Consecutive `User-agent` lines and the rules that follow them, as grouped
+/// by Google's reference matcher.
+#[derive(Debug, Clone, Default)]
+pub(crate) struct CompiledGroup {
+    /// Whether one of the group's `User-agent` lines was `*`.
+    pub(crate) global: bool,
+    /// The product tokens of the group's non-`*` `User-agent` lines.
+    pub(crate) user_agents: Vec<String>,
+    pub(crate) rules: Vec<CompiledRule>,
+    /// The group's first valid `Crawl-delay`, in seconds.
+    pub(crate) crawl_delay: Option<f64>,
+}
+
+impl CompiledGroup {
+    pub(crate) fn matches_agent(&self, user_agent: &str) -> bool {
+        self.user_agents
+            .iter()
+            .any(|name| name.eq_ignore_ascii_case(user_agent))
+    }
+}
+
+/// A parsed robots.txt file, independent of any user-agent or URL, that can be
+/// matched against many times without re-parsing the source text.
+#[derive(Debug, Clone, Default)]
+pub(crate) struct CompiledRobots {
+    pub(crate) groups: Vec<CompiledGroup>,
+    pub(crate) sitemaps: Vec<CompiledSitemap>,
+    /// Total Allow/Disallow rules of `groups`, counted once when compiled.
+    rule_count: usize,
+    /// Each user-agent's rules as a trie, built on first use when the file
+    /// has at least `TRIE_MIN_RULES` rules.
+    pub(crate) tries: AgentTries,
+}
+
+/// The tries built for a robots.txt file, one per user-agent, and their
+/// approximate heap footprint. Clones start out empty.
+#[derive(Debug, Default)]
+pub(crate) struct AgentTries {
+    /// Lowercased user-agent and its trie. There are at most
+    /// `MAX_AGENT_TRIES`, so a scan finds one without allocating a key.
+    tries: Mutex<Vec<(String, Arc<RuleTrie>)>>,
+    bytes: AtomicUsize,
+}
+
+impl Clone for AgentTries {
+    fn clone(&self) -> Self {
+        AgentTries::default()
+    }
+}
+
+impl AgentTries {
+    /// The trie of `user_agent`, built by `build` unless it already was.
+    pub(crate) fn get_or_insert_with(
+        &self,
+        user_agent: &str,
+        build: impl FnOnce() -> RuleTrie,
+    ) -> Arc<RuleTrie> {
+        let mut tries = self.tries.lock().unwrap_or_else(|e| e.into_inner());
+        if let Some((_, trie)) = tries
+            .iter()
+            .find(|(agent, _)| agent.eq_ignore_ascii_case(user_agent))
+        {
+            return trie.clone();
+        }
+        let trie = Arc::new(build());
+        if tries.len() >= MAX_AGENT_TRIES {
+            tries.clear();
+            self.bytes.store(0, Ordering::Relaxed);
+        }
+        let key = user_agent.to_ascii_lowercase();
+        self.bytes.fetch_add(
+            std::mem::size_of::<(String, Arc<RuleTrie>)>() + key.capacity() + trie.size_bytes(),
+            Ordering::Relaxed,
+        );
+        tries.push((key, trie.clone()));
+        trie
+    }
+
+    /// Approximate heap footprint of the tries built so far.
+    pub(crate) fn bytes(&self) -> usize {
+        self.bytes.load(Ordering::Relaxed)
+    }
+}
+
+/// A rule of a robots.txt file kept as a table row, for
+/// `CompiledRobots::from_rule_rows()`.
+#[derive(Debug, Clone)]
+pub(crate) struct RuleRow<'a> {
+    pub(crate) user_agent: &'a str,
+    /// The rule's type and path, or `None` for a user-agent without rules
+    pub(crate) rule: Option<(RobotsUserAgentRuleType, &'a str)>,
+    pub(crate) line_number: u32,
+}
+
+#[derive(Debug, Clone)]
+pub(crate) struct CompiledSitemap {
+    pub(crate) url: String,
+    pub(crate) line_number: u32,
+}
+
+impl CompiledRobots {
+    pub(crate) fn compile(source: &str) -> CompiledRobots {
+        let mut builder = CompiledRobotsBuilder::default();
+        robotstxt::parse_robotstxt(source, &mut builder);
+        builder.build()
+    }
+
+    /// Builds the rules of a robots.txt file from rows like those of
+    /// robotstxt_rules(), without the text. Rows of the same user-agent form
+    /// one group, in the order the user-agents first appear, which matches
+    /// every URL the same way as the file the rows came from. A row without
+    /// a rule gives its user-agent a group of its own, so `*` rules no longer
+    /// apply to it.
+    pub(crate) fn from_rule_rows<'a>(rows: impl IntoIterator<Item = RuleRow<'a>>) -> CompiledRobots {
+        let mut agents: Vec<(&str, u32, Vec<RuleRow>)> = vec![];
+        let mut agent_indexes: HashMap<&str, usize> = HashMap::new();
+        for row in rows {
+            let index = *agent_indexes.entry(row.user_agent).or_insert_with(|| {
+                agents.push((row.user_agent, row.line_number, vec![]));
+                agents.len() - 1
+            });
+            agents[index].2.push(row);
+        }
+
+        let mut builder = CompiledRobotsBuilder::default();
+        for (user_agent, line_number, rows) in agents {
+            builder.handle_user_agent(line_number, user_agent);
+            for row in rows {
+                match row.rule {
+                    Some((RobotsUserAgentRuleType::Allow, path)) => {
+                        builder.handle_allow(row.line_number, &escape_pattern(path))
+                    }
+                    Some((RobotsUserAgentRuleType::Disallow, path)) => {
+                        builder.handle_disallow(row.line_number, &escape_pattern(path))
+                    }
+                    None => (),
+                }
+            }
+            // the next user-agent starts a new group, even if this one had no rules
+            builder.seen_separator = true;
+        }
+        builder.handle_robots_end();
+        builder.build()
+    }
+
+    /// Whether `user_agent` may crawl `url`, with the same semantics as
+    /// `robotstxt::DefaultMatcher::one_agent_allowed_by_robots`.
+    pub(crate) fn allowed(&self, user_agent: &str, url: &str) -> bool {
+        let path = get_path_params_query(url);
+        self.allowed_path(user_agent, &path)
+    }
+
+    pub(crate) fn allowed_path(&self, user_agent: &str, path: &str) -> bool {
+        if self.rule_count >= TRIE_MIN_RULES {
+            return self.rule_trie(user_agent).allowed(path);
+        }
+        self.verdict(user_agent, path).allowed
+    }
+
+    pub(crate) fn rule_count(&self) -> usize {
+        self.rule_count
+    }
+
+    /// The rules that apply to `user_agent`, indexed for matching many paths.
+    /// Tries are kept, so later calls for the same user-agent are lookups.
+    pub(crate) fn rule_trie(&self, user_agent: &str) -> Arc<RuleTrie> {
+        self.tries.get_or_insert_with(user_agent, || {
+            RuleTrie::for_groups(self.applicable_groups(user_agent).into_iter().map(
+                |(index, specific)| {
+                    (
+                        specific,
+                        self.groups[index].rules.iter().map(CompiledRule::as_ref),
+                    )
+                },
+            ))
+        })
+    }
+
+    /// Approximate heap footprint of the tries built so far. They're built
+    /// after a file is cached, so the caches check this on every hit.
+    pub(crate) fn trie_bytes(&self) -> usize {
+        self.tries.bytes()
+    }
+
+    pub(crate) fn verdict(&self, user_agent: &str, path: &str) -> Verdict<'_> {
+        self.verdict_for_groups(&self.applicable_groups(user_agent), path)
+    }
+
+    /// The indexes of the groups that apply to `user_agent`, each paired with
+    /// whether the group names it specifically.
+    pub(crate) fn applicable_groups(&self, user_agent: &str) -> Vec<(usize, bool)> {
+        self.groups
+            .iter()
+            .enumerate()
+            .filter_map(|(index, group)| {
+                let specific = group.matches_agent(user_agent);
+                (specific || group.global).then(|| (index, specific))
+            })
+            .collect()
+    }
+
+    /// The `Crawl-delay` that applies to `user_agent`, in seconds.
+    pub(crate) fn crawl_delay(&self, user_agent: &str) -> Option<f64> {
+        select_crawl_delay(self.applicable_groups(user_agent).into_iter().map(
+            |(index, specific)| (specific, self.groups[index].crawl_delay),
+        ))
+    }
+
+    /// Matches `path` against the groups from `applicable_groups()`, so that
+    /// checking many paths for one user-agent only selects groups once.
+    pub(crate) fn verdict_for_groups(&self, groups: &[(usize, bool)], path: &str) -> Verdict<'_> {
+        evaluate(
+            groups.iter().map(|(index, specific)| {
+                (
+                    *index,
+                    *specific,
+                    self.groups[*index].rules.iter().map(CompiledRule::as_ref),
+                )
+            }),
+            path,
+        )
+    }
+
+    /// Approximate heap footprint, including the tries built so far, used
+    /// for the caches' byte budgets.
+    pub(crate) fn size_bytes(&self) -> usize {
+        self.rules_size_bytes() + self.trie_bytes()
+    }
+
+    /// Approximate heap footprint of the parsed file alone.
+    pub(crate) fn rules_size_bytes(&self) -> usize {
+        let mut size = std::mem::size_of::<CompiledRobots>();
+        for group in &self.groups {
+            size += std::mem::size_of::<CompiledGroup>();
+            for name in &group.user_agents {
+                size += std::mem::size_of::<String>() + name.capacity();
+            }
+            for rule in &group.rules {
+                size += std::mem::size_of::<CompiledRule>() + rule.pattern.capacity();
+            }
+        }
+        for sitemap in &self.sitemaps {
+            size += std::mem::size_of::<CompiledSitemap>() + sitemap.url.capacity();
+        }
+        size
+    }
+}
+
+/// The outcome of matching a path against a robots.txt file.
+#[derive(Debug, Clone, Copy)]
+pub(crate) struct Verdict<'a> {
+    pub(crate) allowed: bool,
+    /// The Allow/Disallow rule that decided the outcome. `None` when no rule
+    /// with a non-empty pattern matched, so the path is allowed by default.
+    pub(crate) rule: Option<RuleRef<'a>>,
+    /// The index of the group that `rule` belongs to.
+    pub(crate) group: Option<usize>,
+    /// Whether any group named the user-agent specifically, in which case
+    /// groups for `*` were ignored.
+    pub(crate) specific: bool,
+}
+
+/// Decides whether `path` is allowed, given the groups that apply to the
+/// user-agent being checked. Each group comes with its index and whether it
+/// named that user-agent specifically (as opposed to only through `*`).
+///
+/// The longest matching pattern wins, Allow wins ties, and specific groups
+/// take precedence over global ones.
+pub(crate) fn evaluate<'a, G, R>(groups: G, path: &str) -> Verdict<'a>
+where
+    G: IntoIterator<Item = (usize, bool, R)>,
+    R: IntoIterator<Item = RuleRef<'a>>,
+{
+    let mut allow = MatchPriorities::default();
+    let mut disallow = MatchPriorities::default();
+    let mut ever_seen_specific_agent = false;
+
+    for (group, specific, rules) in groups {
+        ever_seen_specific_agent |= specific;
+        for rule in rules {
+            if !pattern_matches(path.as_bytes(), rule.pattern, rule.wildcard) {
+                continue;
+            }
+            let priorities = if rule.allow {
+                &mut allow
+            } else {
+                &mut disallow
+            };
+            priorities.update(specific, group, rule);
+        }
+    }
+
+    let decide = |allow: Option<(usize, RuleRef<'a>)>, disallow: Option<(usize, RuleRef<'a>)>| {
+        let (allowed, decisive) = if priority(disallow) > priority(allow) {
+            (false, disallow)
+        } else {
+            (true, allow)
+        };
+        Verdict {
+            allowed,
+            rule: decisive.map(|(_, rule)| rule),
+            group: decisive.map(|(group, _)| group),
+            specific: ever_seen_specific_agent,
+        }
+    };
+    if priority(allow.specific) > 0 || priority(disallow.specific) > 0 {
+        return decide(allow.specific, disallow.specific);
+    }
+    if !ever_seen_specific_agent && (priority(allow.global) > 0 || priority(disallow.global) > 0)
+    {
+        return decide(allow.global, disallow.global);
+    }
+    Verdict {
+        allowed: true,
+        rule: None,
+        group: None,
+        specific: ever_seen_specific_agent,
+    }
+}
+
+fn priority(matched: Option<(usize, RuleRef)>) -> i64 {
+    matched.map_or(-1, |(_, rule)| rule.pattern.len() as i64)
+}
+
+/// Highest priority (longest pattern) matching rules seen for one rule type,
+/// with the index of their group.
+#[derive(Default)]
+struct MatchPriorities<'a> {
+    specific: Option<(usize, RuleRef<'a>)>,
+    global: Option<(usize, RuleRef<'a>)>,
+}
+
+impl<'a> MatchPriorities<'a> {
+    fn update(&mut self, specific: bool, group: usize, rule: RuleRef<'a>) {
+        let current = if specific {
+            &mut self.specific
+        } else {
+            &mut self.global
+        };
+        if priority(*current) < rule.pattern.len() as i64 {
+            *current = Some((group, rule));
+        }
+    }
+}
+
+#[derive(Default)]
+struct CompiledRobotsBuilder {
+    groups: Vec<CompiledGroup>,
+    sitemaps: Vec<CompiledSitemap>,
+    current: Option<CompiledGroup>,
+    seen_separator: bool,
+}
+
+impl CompiledRobotsBuilder {
+    fn push_rule(&mut self, rule_type: RobotsUserAgentRuleType, line_number: u32, value: &str) {
+        // rules that appear before any User-agent line are ignored
+        if let Some(current) = self.current.as_mut() {
+            self.seen_separator = true;
+            current.rules.push(CompiledRule {
+                rule_type,
+                pattern: value.to_owned(),
+                line_number,
+                wildcard: value.contains('*'),
+            });
+        }
+    }
+
+    /// The compiled file, once the parser called `handle_robots_end()`.
+    fn build(self) -> CompiledRobots {
+        let rule_count = self.groups.iter().map(|group| group.rules.len()).sum();
+        CompiledRobots {
+            groups: self.groups,
+            sitemaps: self.sitemaps,
+            rule_count,
+            tries: AgentTries::default(),
+        }
+    }
+}
+
+impl RobotsParseHandler for CompiledRobotsBuilder {
+    fn handle_robots_start(&mut self) {}
+
+    fn handle_robots_end(&mut self) {
+        if let Some(current) = self.current.take() {
+            self.groups.push(current);
+        }
+    }
+
+    fn handle_user_agent(&mut self, _line_num: u32, user_agent: &str) {
+        if self.seen_separator || self.current.is_none() {
+            if let Some(prev) = self.current.take() {
+                self.groups.push(prev);
+            }
+            self.current = Some(CompiledGroup::default());
+            self.seen_separator = false;
+        }
+        let current = self.current.as_mut().unwrap();
+        if is_global_user_agent(user_agent) {
+            current.global = true;
+        } else {
+            current
+                .user_agents
+                .push(extract_user_agent(user_agent).to_owned());
+        }
+    }
+
+    fn handle_allow(&mut self, line_num: u32, value: &str) {
+        self.push_rule(RobotsUserAgentRuleType::Allow, line_num, value);
+        // Google-specific: "/dir/index.htm(l)" also allows "/dir/$"
+        if let Some(slash) = value.rfind('/') {
+            if value[slash..].starts_with("/index.htm") {
+                let pattern = format!("{}$", &value[..slash + 1]);
+                self.push_rule(RobotsUserAgentRuleType::Allow, line_num, &pattern);
+            }
+        }
+    }
+
+    fn handle_disallow(&mut self, line_num: u32, value: &str) {
+        self.push_rule(RobotsUserAgentRuleType::Disallow, line_num, value);
+    }
+
+    fn handle_sitemap(&mut self, line_num: u32, value: &str) {
+        self.sitemaps.push(CompiledSitemap {
+            url: value.to_owned(),
+            line_number: line_num,
+        });
+    }
+
+    fn handle_unknown_action(&mut self, _line_num: u32, action: &str, value: &str) {
+        if !action.eq_ignore_ascii_case("crawl-delay") {
+            return;
+        }
+        // delays before any User-agent line apply to no one
+        if let Some(current) = self.current.as_mut() {
+            if current.crawl_delay.is_none() {
+                current.crawl_delay = parse_crawl_delay(value);
+            }
+        }
+    }
+}
+
+/// Picks the crawl delay from the groups that apply to a user-agent, each
+/// given as whether it names the agent specifically and its delay. Like
+/// Allow/Disallow rules, specific groups replace the `*` groups entirely, and
+/// the first delay in file order wins.
+pub(crate) fn select_crawl_delay<I>(groups: I) -> Option<f64>
+where
+    I: IntoIterator<Item = (bool, Option<f64>)>,
+{
+    let mut ever_seen_specific = false;
+    let (mut specific_delay, mut global_delay) = (None, None);
+    for (specific, delay) in groups {
+        if specific {
+            ever_seen_specific = true;
+            specific_delay = specific_delay.or(delay);
+        } else {
+            global_delay = global_delay.or(delay);
+        }
+    }
+    if ever_seen_specific {
+        specific_delay
+    } else {
+        global_delay
+    }
+}
+
+/// Parses a `Crawl-delay` value: a non-negative number of seconds.
+pub(crate) fn parse_crawl_delay(value: &str) -> Option<f64> {
+    value
+        .trim()
+        .parse::<f64>()
+        .ok()
+        .filter(|delay| delay.is_finite() && *delay >= 0.0)
+}
+
+/// `*`, optionally followed by whitespace and anything else, is the global agent.
+pub(crate) fn is_global_user_agent(user_agent: &str) -> bool {
+    let bytes = user_agent.as_bytes();
+    bytes.first() == Some(&b'*') && (bytes.len() == 1 || bytes[1].is_ascii_whitespace())
+}
+
+/// The product token of a `User-agent` value: the leading `[a-zA-Z_-]` run.
+pub(crate) fn extract_user_agent(user_agent: &str) -> &str {
+    let end = user_agent
+        .find(|c: char| !(c.is_ascii_alphabetic() || c == '-' || c == '_'))
+        .unwrap_or(user_agent.len());
+    &user_agent[..end]
+}
+
+/// Extracts the path, params and query of `url`, dropping the scheme, host and
+/// fragment. Always starts with a `/`, and only copies `url` when a `/` has to
+/// be added.
+pub(crate) fn get_path_params_query(url: &str) -> Cow<'_, str> {
+    let bytes = url.as_bytes();
+    let find_path_start = |from: usize| {
+        bytes[from..]
+            .iter()
+            .position(|c| matches!(c, b'/' | b'?' | b';'))
+            .map(|position| position + from)
+    };
+    // initial two slashes are ignored
+    let search_start = if url.starts_with("//") { 2 } else { 0 };
+    let early_path = find_path_start(search_start);
+    let protocol_end = match url[search_start..].find("://") {
+        // if path, param or query starts before ://, :// doesn't indicate protocol
+        Some(position) if early_path.map_or(true, |early| early > position + search_start) => {
+            position + search_start + 3
+        }
+        _ => search_start,
+    };
+    let path_start = match find_path_start(protocol_end) {
+        Some(path_start) => path_start,
+        None => return Cow::Borrowed("/"),
+    };
+    let hash_position = url[search_start..].find('#').map(|p| p + search_start);
+    if matches!(hash_position, Some(hash) if hash < path_start) {
+        return Cow::Borrowed("/");
+    }
+    let path_end = hash_position.unwrap_or(url.len());
+    if bytes[path_start] != b'/' {
+        // prepend a slash if the result would start with e.g. '?'
+        return Cow::Owned(format!("/{}", &url[path_start..path_end]));
+    }
+    Cow::Borrowed(&url[path_start..path_end])
+}
+
+/// The part of a URL that a robots.txt file applies to: its scheme, host and
+/// port, per RFC 9309 section 2.3. Scheme and host are lowercased, and the
+/// port is filled in for http and https.
+#[derive(Debug, Clone, PartialEq, Eq)]
+pub(crate) struct UrlOrigin {
+    pub(crate) scheme: String,
+    pub(crate) host: String,
+    pub(crate) port: Option<u16>,
+}
+
+impl UrlOrigin {
+    /// The origin of an absolute URL like `https://user@Example.com:8443/a`,
+    /// or `None` when `url` has no scheme or host, or an invalid port.
+    pub(crate) fn parse(url: &str) -> Option<UrlOrigin> {
+        let url = url.trim();
+        let (scheme, rest) = url.split_once("://")?;
+        let valid_scheme = scheme.starts_with(|c: char| c.is_ascii_alphabetic())
+            && scheme
+                .chars()
+                .all(|c| c.is_ascii_alphanumeric() || matches!(c, '+' | '-' | '.'));
+        if !valid_scheme {
+            return None;
+        }
+        let scheme = scheme.to_ascii_lowercase();
+        let authority = &rest[..rest.find(['/', '?', '#', ';']).unwrap_or(rest.len())];
+        let host_port = authority.rsplit_once('@').map_or(authority, |(_, host)| host);
+        // the port follows the last ':', unless it's inside an IPv6 address
+        let (host, port) = match host_port.rfind(':') {
+            Some(colon) if !host_port[colon..].contains(']') => {
+                (&host_port[..colon], &host_port[colon + 1..])
+            }
+            _ => (host_port, ""),
+        };
+        let host = host.trim_end_matches('.').to_ascii_lowercase();
+        if host.is_empty() {
+            return None;
+        }
+        let port = if port.is_empty() {
+            match scheme.as_str() {
+                "http" => Some(80),
+                "https" => Some(443),
+                _ => None,
+            }
+        } else {
+            Some(port.parse().ok()?)
+        };
+        Some(UrlOrigin { scheme, host, port })
+    }
+}
+
+/// Whether `pattern` matches the start of `path`. `*` matches any sequence of
+/// characters, and a trailing `$` anchors the pattern to the end of the path.
+/// `wildcard` must be true if `pattern` contains a `*`.
+pub(crate) fn pattern_matches(path: &[u8], pattern: &[u8], wildcard: bool) -> bool {
+    // fast paths for the common wildcard-free patterns
+    if !wildcard {
+        return match pattern.split_last() {
+            Some((b'$', literal)) => path == literal,
+            _ => path.starts_with(pattern),
+        };
+    }
+
+    let (pattern, anchored) = match pattern.split_last() {
+        Some((b'$', rest)) => (rest, true),
+        _ => (pattern, false),
+    };
+    // Glob matching with backtracking to the most recent `*`, which is enough
+    // since an earlier `*` could only ever need to match less. Unanchored
+    // patterns behave as if they ended with an extra `*`.
+    let (mut p, mut t) = (0, 0);
+    let mut last_star: Option<(usize, usize)> = None;
+    loop {
+        if p == pattern.len() {
+            if !anchored || t == path.len() {
+                return true;
+            }
+        } else if pattern[p] == b'*' {
+            p += 1;
+            last_star = Some((p, t));
+            continue;
+        } else if t < path.len() && pattern[p] == path[t] {
+            p += 1;
+            t += 1;
+            continue;
+        }
+        match last_star {
+            Some((star_p, star_t)) if star_t < path.len() => {
+                last_star = Some((star_p, star_t + 1));
+                p = star_p;
+                t = star_t + 1;
+            }
+            _ => return false,
+        }
+    }
+}
+
+#[cfg(test)]
+pub(crate) mod tests {
+    use super::*;
+    use robotstxt::DefaultMatcher;
+
+    /// Exercises group separators, rules before any User-agent line, the
+    /// index.htm rule, `$` anchors and wildcards.
+    const EDGE_CASES: &str = "Disallow: /before-any-agent\n\
+        User-agent: FooBot\n\
+        User-agent: BarBot/1.0\n\
+        Disallow: /shared\n\
+        Allow: /shared/index.html\n\
+        Sitemap: https://example.com/sitemap.xml\n\
+        User-agent: FooBot\n\
+        Disallow: /foo-only$\n\
+        Allow: /*.gif$\n\
+        Disallow: /*/private/*\n\
+        \n\
+        User-agent: *\n\
+        Disallow: /\n\
+        Allow: /public/index.htm\n\
+        Allow: /$\n\
+        Disallow: /a%3cd\n\
+        Allow: /q?\n";
+
+    /// URLs that exercise `get_path_params_query`.
+    const URLS: &[&str] = &[
+        "http://example.com",
+        "http://example.com/",
+        "http://example.com/a;b?c=d#e",
+        "http://example.com#/shared",
+        "//example.com/shared/x",
+        "example.com?q",
+        "/shared/index.html#x",
+        "http://example.com/public/",
+        "http://example.com/img/x.GIF",
+        "http://example.com/a/private/b",
+        "http://example.com/q?x",
+    ];
+
+    /// The test documents: every file in tests/examples, plus `EDGE_CASES`.
+    pub(crate) fn example_robotstxts() -> Vec<(String, String)> {
+        let directory = concat!(env!("CARGO_MANIFEST_DIR"), "/tests/examples");
+        let mut files: Vec<(String, String)> = std::fs::read_dir(directory)
+            .unwrap()
+            .map(|entry| entry.unwrap().path())
+            .filter(|path| path.to_string_lossy().ends_with(".robots.txt"))
+            .map(|path| {
+                let bytes = std::fs::read(&path).unwrap();
+                (
+                    path.display().to_string(),
+                    String::from_utf8_lossy(&bytes).into_owned(),
+                )
+            })
+            .collect();
+        files.sort();
+        assert!(!files.is_empty(), "no robots.txt files in {}", directory);
+        files.push(("EDGE_CASES".to_owned(), EDGE_CASES.to_owned()));
+        files
+    }
+
+    /// A few of the file's own user-agents, plus agents it doesn't name.
+    fn agents(robots: &CompiledRobots) -> Vec<String> {
+        let mut agents: Vec<String> = vec![];
+        for name in robots.groups.iter().flat_map(|group| &group.user_agents) {
+            if agents.len() < 4 && !agents.iter().any(|a| a.eq_ignore_ascii_case(name)) {
+                agents.push(name.clone());
+            }
+        }
+        agents.extend(["Googlebot", "NoSuchBot", "barbot"].map(String::from));
+        agents
+    }
+
+    /// URLs around every rule of the file: the pattern itself, with
+    /// wildcards filled in and anchors dropped, and a few extensions of it.
+    fn urls(robots: &CompiledRobots) -> Vec<String> {
+        let mut urls: Vec<String> = URLS.iter().map(|url| url.to_string()).collect();
+        for group in &robots.groups {
+            for rule in &group.rules {
+                let path = rule.pattern.replace('*', "x");
+                let path = path.trim_end_matches('$');
+                for suffix in ["", "/", "index.html", "?q=1"] {
+                    urls.push(format!("http://example.com{}{}", path, suffix));
+                }
+            }
+        }
+        urls.sort();
+        urls.dedup();
+        urls
+    }
+
+    /// Checks `allowed(robots, user_agent, path)` against `DefaultMatcher`
+    /// for every example file, agent and URL.
+    pub(crate) fn assert_matches_reference(allowed: impl Fn(&CompiledRobots, &str, &str) -> bool) {
+        for (name, source) in example_robotstxts() {
+            let robots = CompiledRobots::compile(&source);
+            for agent in agents(&robots) {
+                for url in urls(&robots) {
+                    let expected =
+                        DefaultMatcher::default().one_agent_allowed_by_robots(&source, &agent, &url);
+                    let path = get_path_params_query(&url);
+                    assert_eq!(
+                        allowed(&robots, &agent, &path),
+                        expected,
+                        "{} disagrees with DefaultMatcher for {} {}",
+                        name,
+                        agent,
+                        url
+                    );
+                }
+            }
+        }
+    }
+
+    #[test]
+    fn evaluate_matches_default_matcher() {
+        assert_matches_reference(|robots, agent, path| robots.verdict(agent, path).allowed);
+    }
+}
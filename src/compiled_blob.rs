@@ -0,0 +1,442 @@
+//! A compact, versioned binary encoding of `CompiledRobots`, returned by
+//! `robotstxt_compile()` and accepted by `robotstxt_matches()` in place of the
+//! robots.txt text.
+//!
+//! All integers are little-endian u32s, and crawl delays little-endian f64s.
+//! The layout is:
+//!
+//! ```text
+//! header    magic "RTXC", version, group_count, agent_count, rule_count, sitemap_count
+//! groups    group_count   x (flags, agent_start, agent_count, rule_start, rule_count,
+//!                              crawl_delay)
+//! agents    agent_count   x (offset, length)
+//! rules     rule_count    x (flags, line_number, offset, length)
+//! sitemaps  sitemap_count x (line_number, offset, length)
+//! strings   the bytes of every agent, pattern and sitemap, referenced by offset
+//! ```
+//!
+//! A group's crawl delay is stored as the same f64 the text parser reads, so
+//! BLOB and text results match; the group's flags record whether it has one,
+//! and it is 0 when it doesn't. Rule lengths double as match priorities, and rule flags record the rule
+//! type, whether the pattern has a `*` wildcard and whether it ends with `$`.
+//! `CompiledRobotsView` validates the tables once and then reads everything in
+//! place, without copying or allocating.
+
+use crate::{
+    compiled::{
+        evaluate, get_path_params_query, select_crawl_delay, AgentTries, CompiledRobots, RuleRef,
+        Verdict, TRIE_MIN_RULES,
+    },
+    trie::RuleTrie,
+};
+
+pub(crate) const MAGIC: &[u8; 4] = b"RTXC";
+pub(crate) const VERSION: u32 = 3;
+
+const HEADER_SIZE: usize = 24;
+const GROUP_SIZE: usize = 28;
+const AGENT_SIZE: usize = 8;
+const RULE_SIZE: usize = 16;
+const SITEMAP_SIZE: usize = 12;
+
+const GROUP_GLOBAL: u32 = 1;
+const GROUP_CRAWL_DELAY: u32 = 2;
+const RULE_ALLOW: u32 = 1;
+const RULE_WILDCARD: u32 = 2;
+const RULE_ANCHORED: u32 = 4;
+
+/// Whether `bytes` looks like a compiled robots.txt BLOB, of any version.
+pub(crate) fn is_compiled_blob(bytes: &[u8]) -> bool {
+    bytes.starts_with(MAGIC)
+}
+
+fn push_u32(out: &mut Vec<u8>, value: usize) {
+    out.extend_from_slice(&(value as u32).to_le_bytes());
+}
+
+fn read_u32(bytes: &[u8], offset: usize) -> u32 {
+    u32::from_le_bytes(bytes[offset..offset + 4].try_into().unwrap())
+}
+
+fn read_f64(bytes: &[u8], offset: usize) -> f64 {
+    f64::from_le_bytes(bytes[offset..offset + 8].try_into().unwrap())
+}
+
+/// Encodes `robots` into the compiled BLOB format.
+pub(crate) fn encode(robots: &CompiledRobots) -> Vec<u8> {
+    let agent_count: usize = robots.groups.iter().map(|g| g.user_agents.len()).sum();
+    let rule_count: usize = robots.groups.iter().map(|g| g.rules.len()).sum();
+
+    let mut groups = Vec::with_capacity(robots.groups.len() * GROUP_SIZE);
+    let mut agents = Vec::with_capacity(agent_count * AGENT_SIZE);
+    let mut rules = Vec::with_capacity(rule_count * RULE_SIZE);
+    let mut sitemaps = Vec::with_capacity(robots.sitemaps.len() * SITEMAP_SIZE);
+    let mut strings: Vec<u8> = vec![];
+
+    let (mut agent_start, mut rule_start) = (0, 0);
+    for group in &robots.groups {
+        let mut flags = 0;
+        if group.global {
+            flags |= GROUP_GLOBAL;
+        }
+        if group.crawl_delay.is_some() {
+            flags |= GROUP_CRAWL_DELAY;
+        }
+        push_u32(&mut groups, flags as usize);
+        push_u32(&mut groups, agent_start);
+        push_u32(&mut groups, group.user_agents.len());
+        push_u32(&mut groups, rule_start);
+        push_u32(&mut groups, group.rules.len());
+        groups.extend_from_slice(&group.crawl_delay.unwrap_or(0.0).to_le_bytes());
+        agent_start += group.user_agents.len();
+        rule_start += group.rules.len();
+
+        for name in &group.user_agents {
+            push_u32(&mut agents, strings.len());
+            push_u32(&mut agents, name.len());
+            strings.extend_from_slice(name.as_bytes());
+        }
+        for rule in &group.rules {
+            let rule = rule.as_ref();
+            let mut flags = 0;
+            if rule.allow {
+                flags |= RULE_ALLOW;
+            }
+            if rule.wildcard {
+                flags |= RULE_WILDCARD;
+            }
+            if rule.pattern.last() == Some(&b'$') {
+                flags |= RULE_ANCHORED;
+            }
+            push_u32(&mut rules, flags as usize);
+            push_u32(&mut rules, rule.line_number as usize);
+            push_u32(&mut rules, strings.len());
+            push_u32(&mut rules, rule.pattern.len());
+            strings.extend_from_slice(rule.pattern);
+        }
+    }
+    for sitemap in &robots.sitemaps {
+        push_u32(&mut sitemaps, sitemap.line_number as usize);
+        push_u32(&mut sitemaps, strings.len());
+        push_u32(&mut sitemaps, sitemap.url.len());
+        strings.extend_from_slice(sitemap.url.as_bytes());
+    }
+
+    let mut out = Vec::with_capacity(
+        HEADER_SIZE + groups.len() + agents.len() + rules.len() + sitemaps.len() + strings.len(),
+    );
+    out.extend_from_slice(MAGIC);
+    push_u32(&mut out, VERSION as usize);
+    push_u32(&mut out, robots.groups.len());
+    push_u32(&mut out, agent_count);
+    push_u32(&mut out, rule_count);
+    push_u32(&mut out, robots.sitemaps.len());
+    out.extend_from_slice(&groups);
+    out.extend_from_slice(&agents);
+    out.extend_from_slice(&rules);
+    out.extend_from_slice(&sitemaps);
+    out.extend_from_slice(&strings);
+    out
+}
+
+/// A validated, borrowed view over a compiled robots.txt BLOB.
+#[derive(Clone, Copy)]
+pub(crate) struct CompiledRobotsView<'a> {
+    groups: &'a [u8],
+    agents: &'a [u8],
+    rules: &'a [u8],
+    sitemaps: &'a [u8],
+    strings: &'a [u8],
+    rule_count: usize,
+}
+
+/// A borrowed group of a `CompiledRobotsView`.
+#[derive(Clone, Copy)]
+pub(crate) struct GroupView<'a> {
+    view: CompiledRobotsView<'a>,
+    flags: u32,
+    agent_start: usize,
+    agent_count: usize,
+    rule_start: usize,
+    rule_count: usize,
+    crawl_delay: f64,
+}
+
+impl<'a> CompiledRobotsView<'a> {
+    /// Checks the header and that every table entry points inside the BLOB.
+    pub(crate) fn new(bytes: &'a [u8]) -> Result<CompiledRobotsView<'a>, String> {
+        let (view, agent_count, rule_count) = CompiledRobotsView::parse(bytes)?;
+        view.validate(agent_count, rule_count)?;
+        Ok(view)
+    }
+
+    /// Same as `new()`, for bytes that already passed it: only the header is
+    /// read, so a BLOB kept across many lookups is checked once.
+    pub(crate) fn from_validated(bytes: &'a [u8]) -> Result<CompiledRobotsView<'a>, String> {
+        Ok(CompiledRobotsView::parse(bytes)?.0)
+    }
+
+    /// Splits the BLOB into its tables, returning the agent and rule counts.
+    fn parse(bytes: &'a [u8]) -> Result<(CompiledRobotsView<'a>, usize, usize), String> {
+        if bytes.len() < HEADER_SIZE || !is_compiled_blob(bytes) {
+            return Err("not a compiled robots.txt blob".to_owned());
+        }
+        let version = read_u32(bytes, 4);
+        if version != VERSION {
+            return Err(format!(
+                "unsupported compiled robots.txt version {}, expected {}",
+                version, VERSION
+            ));
+        }
+        let group_count = read_u32(bytes, 8) as usize;
+        let agent_count = read_u32(bytes, 12) as usize;
+        let rule_count = read_u32(bytes, 16) as usize;
+        let sitemap_count = read_u32(bytes, 20) as usize;
+
+        let mut offset = HEADER_SIZE;
+        let mut table = |count: usize, size: usize| -> Result<&'a [u8], String> {
+            let end = count
+                .checked_mul(size)
+                .and_then(|len| len.checked_add(offset))
+                .filter(|end| *end <= bytes.len())
+                .ok_or_else(|| "truncated compiled robots.txt blob".to_owned())?;
+            let table = &bytes[offset..end];
+            offset = end;
+            Ok(table)
+        };
+        let groups = table(group_count, GROUP_SIZE)?;
+        let agents = table(agent_count, AGENT_SIZE)?;
+        let rules = table(rule_count, RULE_SIZE)?;
+        let sitemaps = table(sitemap_count, SITEMAP_SIZE)?;
+        let strings = &bytes[offset..];
+
+        let view = CompiledRobotsView {
+            groups,
+            agents,
+            rules,
+            sitemaps,
+            strings,
+            rule_count,
+        };
+        Ok((view, agent_count, rule_count))
+    }
+
+    fn validate(&self, agent_count: usize, rule_count: usize) -> Result<(), String> {
+        let corrupt = || Err("corrupt compiled robots.txt blob".to_owned());
+        let string_in_bounds = |offset: u32, len: u32| {
+            (offset as usize)
+                .checked_add(len as usize)
+                .map_or(false, |end| end <= self.strings.len())
+        };
+        let range_in_bounds = |start: usize, count: usize, total: usize| {
+            start.checked_add(count).map_or(false, |end| end <= total)
+        };
+        for group in self.groups() {
+            if !range_in_bounds(group.agent_start, group.agent_count, agent_count)
+                || !range_in_bounds(group.rule_start, group.rule_count, rule_count)
+            {
+                return corrupt();
+            }
+        }
+        for entry in self.agents.chunks_exact(AGENT_SIZE) {
+            if !string_in_bounds(read_u32(entry, 0), read_u32(entry, 4)) {
+                return corrupt();
+            }
+        }
+        for entry in self.rules.chunks_exact(RULE_SIZE) {
+            if !string_in_bounds(read_u32(entry, 8), read_u32(entry, 12)) {
+                return corrupt();
+            }
+        }
+        for entry in self.sitemaps.chunks_exact(SITEMAP_SIZE) {
+            if !string_in_bounds(read_u32(entry, 4), read_u32(entry, 8)) {
+                return corrupt();
+            }
+        }
+        Ok(())
+    }
+
+    fn string(&self, offset: u32, len: u32) -> &'a [u8] {
+        &self.strings[offset as usize..offset as usize + len as usize]
+    }
+
+    fn group_view(&self, entry: &[u8]) -> GroupView<'a> {
+        GroupView {
+            view: *self,
+            flags: read_u32(entry, 0),
+            agent_start: read_u32(entry, 4) as usize,
+            agent_count: read_u32(entry, 8) as usize,
+            rule_start: read_u32(entry, 12) as usize,
+            rule_count: read_u32(entry, 16) as usize,
+            crawl_delay: read_f64(entry, 20),
+        }
+    }
+
+    pub(crate) fn groups(&self) -> impl Iterator<Item = GroupView<'a>> + 'a {
+        let view = *self;
+        self.groups
+            .chunks_exact(GROUP_SIZE)
+            .map(move |entry| view.group_view(entry))
+    }
+
+    pub(crate) fn group(&self, index: usize) -> Option<GroupView<'a>> {
+        let start = index.checked_mul(GROUP_SIZE)?;
+        self.groups
+            .get(start..start.checked_add(GROUP_SIZE)?)
+            .map(|entry| self.group_view(entry))
+    }
+
+    /// Same as `CompiledRobots::applicable_groups`, reading the groups in place.
+    pub(crate) fn applicable_groups(&self, user_agent: &str) -> Vec<(usize, bool)> {
+        self.groups()
+            .enumerate()
+            .filter_map(|(index, group)| {
+                let specific = group.matches_agent(user_agent);
+                (specific || group.is_global()).then(|| (index, specific))
+            })
+            .collect()
+    }
+
+    /// Same as `CompiledRobots::verdict`, reading the rules in place.
+    pub(crate) fn verdict(&self, user_agent: &str, path: &str) -> Verdict<'a> {
+        self.verdict_for_groups(&self.applicable_groups(user_agent), path)
+    }
+
+    /// Same as `CompiledRobots::verdict_for_groups`, reading the rules in place.
+    pub(crate) fn verdict_for_groups(&self, groups: &[(usize, bool)], path: &str) -> Verdict<'a> {
+        evaluate(
+            groups.iter().filter_map(|(index, specific)| {
+                Some((*index, *specific, self.group(*index)?.rules()))
+            }),
+            path,
+        )
+    }
+
+    /// Same as `CompiledRobots::allowed`, reading the rules in place.
+    pub(crate) fn allowed(&self, user_agent: &str, url: &str) -> bool {
+        let path = get_path_params_query(url);
+        self.allowed_path(None, user_agent, &path)
+    }
+
+    pub(crate) fn rule_count(&self) -> usize {
+        self.rule_count
+    }
+
+    /// Same as `CompiledRobots::allowed_path`. A BLOB has nowhere to keep
+    /// tries, so files with `TRIE_MIN_RULES` rules or more only match through
+    /// one when the caller passes `tries` to keep them in.
+    pub(crate) fn allowed_path(
+        &self,
+        tries: Option<&AgentTries>,
+        user_agent: &str,
+        path: &str,
+    ) -> bool {
+        if let Some(tries) = tries.filter(|_| self.rule_count >= TRIE_MIN_RULES) {
+            return tries
+                .get_or_insert_with(user_agent, || self.rule_trie(user_agent))
+                .allowed(path);
+        }
+        evaluate(
+            self.groups().enumerate().filter_map(|(index, group)| {
+                let specific = group.matches_agent(user_agent);
+                (specific || group.is_global()).then(|| (index, specific, group.rules()))
+            }),
+            path,
+        )
+        .allowed
+    }
+
+    /// The rules that apply to `user_agent`, indexed for matching many paths.
+    pub(crate) fn rule_trie(&self, user_agent: &str) -> RuleTrie {
+        RuleTrie::for_groups(self.groups().filter_map(|group| {
+            let specific = group.matches_agent(user_agent);
+            (specific || group.is_global()).then(|| (specific, group.rules()))
+        }))
+    }
+
+    /// Same as `CompiledRobots::crawl_delay`, reading the groups in place.
+    pub(crate) fn crawl_delay(&self, user_agent: &str) -> Option<f64> {
+        select_crawl_delay(self.groups().filter_map(|group| {
+            let specific = group.matches_agent(user_agent);
+            (specific || group.is_global()).then(|| (specific, group.crawl_delay()))
+        }))
+    }
+}
+
+impl<'a> GroupView<'a> {
+    pub(crate) fn is_global(&self) -> bool {
+        self.flags & GROUP_GLOBAL != 0
+    }
+
+    pub(crate) fn crawl_delay(&self) -> Option<f64> {
+        (self.flags & GROUP_CRAWL_DELAY != 0).then(|| self.crawl_delay)
+    }
+
+    pub(crate) fn user_agents(&self) -> impl Iterator<Item = &'a [u8]> + 'a {
+        let view = self.view;
+        let start = self.agent_start * AGENT_SIZE;
+        let end = start + self.agent_count * AGENT_SIZE;
+        view.agents[start..end]
+            .chunks_exact(AGENT_SIZE)
+            .map(move |entry| view.string(read_u32(entry, 0), read_u32(entry, 4)))
+    }
+
+    pub(crate) fn matches_agent(&self, user_agent: &str) -> bool {
+        self.user_agents()
+            .any(|name| name.eq_ignore_ascii_case(user_agent.as_bytes()))
+    }
+
+    pub(crate) fn rules(&self) -> impl Iterator<Item = RuleRef<'a>> + 'a {
+        let view = self.view;
+        let start = self.rule_start * RULE_SIZE;
+        let end = start + self.rule_count * RULE_SIZE;
+        view.rules[start..end]
+            .chunks_exact(RULE_SIZE)
+            .map(move |entry| {
+                let flags = read_u32(entry, 0);
+                RuleRef {
+                    allow: flags & RULE_ALLOW != 0,
+                    pattern: view.string(read_u32(entry, 8), read_u32(entry, 12)),
+                    wildcard: flags & RULE_WILDCARD != 0,
+                    line_number: read_u32(entry, 4),
+                }
+            })
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn overflowing_group_ranges_are_corrupt() {
+        let robots = CompiledRobots::compile("User-agent: a\nDisallow: /x\n");
+        let mut blob = encode(&robots);
+        // the first group's agent_start and rule_start, near u32::MAX
+        for offset in [HEADER_SIZE + 4, HEADER_SIZE + 12] {
+            let mut corrupt = blob.clone();
+            corrupt[offset..offset + 4].copy_from_slice(&u32::MAX.to_le_bytes());
+            assert!(CompiledRobotsView::new(&corrupt).is_err());
+        }
+        assert!(CompiledRobotsView::new(&blob).is_ok());
+        blob.truncate(HEADER_SIZE + 1);
+        assert!(CompiledRobotsView::new(&blob).is_err());
+    }
+
+    #[test]
+    fn crawl_delays_round_trip_exactly() {
+        let robots = CompiledRobots::compile(
+            "User-agent: a\nCrawl-delay: 0.0001\nDisallow: /a\n\
+             User-agent: b\nCrawl-delay: 0\nDisallow: /b\n\
+             User-agent: c\nDisallow: /c",
+        );
+        let blob = encode(&robots);
+        let view = CompiledRobotsView::new(&blob).unwrap();
+        for user_agent in ["a", "b", "c"] {
+            assert_eq!(view.crawl_delay(user_agent), robots.crawl_delay(user_agent));
+        }
+        assert_eq!(view.crawl_delay("a"), Some(0.0001));
+        assert_eq!(view.crawl_delay("b"), Some(0.0));
+        assert_eq!(view.crawl_delay("c"), None);
+    }
+}
@@ -1,13 +1,50 @@
+#[doc(hidden)]
+pub mod bench;
+mod cache;
+mod compiled;
+mod compiled_blob;
+mod limits;
+mod robotstxt_corpus_stats;
+mod robotstxt_directives;
+mod robotstxt_index;
+mod robotstxt_matches_batch;
 mod robotstxt_rules;
+mod robotstxt_sitemaps;
+mod robotstxt_stats;
 mod robotstxt_user_agents;
+mod shared_cache;
+mod sql;
+mod trie;
 mod utils;
 
-use sqlite_loadable::{api, define_scalar_function, Error, Result};
-use sqlite_loadable::{define_table_function, prelude::*};
+use std::{cell::RefCell, rc::Rc, time::Instant};
 
-use robotstxt::DefaultMatcher;
+use sqlite_loadable::{
+    api::{self, ValueType},
+    define_scalar_function, define_scalar_function_with_aux, Error, Result,
+};
+use sqlite_loadable::{define_table_function, define_virtual_table_writeable, prelude::*};
 
-use crate::{robotstxt_rules::RulesTable, robotstxt_user_agents::UserAgentsTable};
+use serde_json::json;
+
+use crate::{
+    cache::{blob_tries, compiled_argument, RobotsCache, SharedRobotsCache},
+    compiled::{
+        get_path_params_query, CompiledRobots, RuleRow, UrlOrigin, Verdict, TRIE_MIN_RULES,
+    },
+    compiled_blob::{is_compiled_blob, CompiledRobotsView},
+    limits::Limits,
+    robotstxt_corpus_stats::CorpusStatsTable,
+    robotstxt_directives::DirectivesTable,
+    robotstxt_index::IndexTable,
+    robotstxt_matches_batch::MatchesBatchTable,
+    robotstxt_rules::RulesTable,
+    robotstxt_sitemaps::SitemapsTable,
+    robotstxt_stats::StatsTable,
+    robotstxt_user_agents::UserAgentsTable,
+    shared_cache::shared_cache,
+    utils::RobotsUserAgentRuleType,
+};
 // robotstxt_version() -> 'v0.1.0'
 pub fn robotstxt_version(
     context: *mut sqlite3_context,
@@ -16,17 +53,573 @@ pub fn robotstxt_version(
     api::result_text(context, format!("v{}", env!("CARGO_PKG_VERSION")))?;
     Ok(())
 }
+/// Whether `user_agent` may crawl `path`, a path already extracted from a URL,
+/// under the robots.txt in `values[0]`.
+fn path_allowed(
+    context: *mut sqlite3_context,
+    values: &[*mut sqlite3_value],
+    cache: &SharedRobotsCache,
+    user_agent: &str,
+    path: &str,
+) -> Result<bool> {
+    let robotstxt = values
+        .get(0)
+        .ok_or_else(|| Error::new_message("expected robotstxt argument"))?;
+
+    // output of robotstxt_compile(), matched in place
+    if api::value_type(robotstxt) == ValueType::Blob && is_compiled_blob(api::value_blob(robotstxt))
+    {
+        let view = CompiledRobotsView::new(api::value_blob(robotstxt)).map_err(Error::new_message)?;
+        let tries = (view.rule_count() >= TRIE_MIN_RULES)
+            .then(|| blob_tries(context, 0))
+            .flatten();
+        let start = Instant::now();
+        let allowed = view.allowed_path(tries.as_deref(), user_agent, path);
+        cache.borrow_mut().stats.record_matches(1, start.elapsed());
+        return Ok(allowed);
+    }
+
+    let robots = compiled_argument(context, values, 0, cache)?;
+    let start = Instant::now();
+    let allowed = robots.allowed_path(user_agent, path);
+    cache.borrow_mut().stats.record_matches(1, start.elapsed());
+    Ok(allowed)
+}
+
 pub fn robotstxt_matches(
     context: *mut sqlite3_context,
     values: &[*mut sqlite3_value],
+    cache: &SharedRobotsCache,
+) -> Result<()> {
+    let useragent = api::value_text(
+        values
+            .get(1)
+            .ok_or_else(|| Error::new_message("expected user_agent argument"))?,
+    )?;
+    let url = api::value_text(
+        values
+            .get(2)
+            .ok_or_else(|| Error::new_message("expected url argument"))?,
+    )?;
+    let allowed = path_allowed(context, values, cache, useragent, &get_path_params_query(url))?;
+    api::result_bool(context, allowed);
+    Ok(())
+}
+
+// robotstxt_path('https://example.com/a/b?c=d#e') -> '/a/b?c=d'
+pub fn robotstxt_path(context: *mut sqlite3_context, values: &[*mut sqlite3_value]) -> Result<()> {
+    let url = api::value_text(
+        values
+            .get(0)
+            .ok_or_else(|| Error::new_message("expected url argument"))?,
+    )?;
+    api::result_text(context, get_path_params_query(url).as_ref())?;
+    Ok(())
+}
+
+// robotstxt_matches_path(robotstxt, user_agent, robotstxt_path(url))
+pub fn robotstxt_matches_path(
+    context: *mut sqlite3_context,
+    values: &[*mut sqlite3_value],
+    cache: &SharedRobotsCache,
+) -> Result<()> {
+    let useragent = api::value_text(
+        values
+            .get(1)
+            .ok_or_else(|| Error::new_message("expected user_agent argument"))?,
+    )?;
+    let path = api::value_text(
+        values
+            .get(2)
+            .ok_or_else(|| Error::new_message("expected path argument"))?,
+    )?;
+    if !path.starts_with('/') {
+        return Err(Error::new_message(
+            "path must start with '/', use robotstxt_path() to get the path of a URL",
+        ));
+    }
+    let allowed = path_allowed(context, values, cache, useragent, path)?;
+    api::result_bool(context, allowed);
+    Ok(())
+}
+
+// robotstxt_matches_url(robotstxt, user_agent, url, robotstxt_url), NULL when
+// url isn't on the scheme, host and port that robotstxt_url was fetched from
+pub fn robotstxt_matches_url(
+    context: *mut sqlite3_context,
+    values: &[*mut sqlite3_value],
+    cache: &SharedRobotsCache,
+) -> Result<()> {
+    let useragent = api::value_text(
+        values
+            .get(1)
+            .ok_or_else(|| Error::new_message("expected user_agent argument"))?,
+    )?;
+    let url = api::value_text(
+        values
+            .get(2)
+            .ok_or_else(|| Error::new_message("expected url argument"))?,
+    )?;
+    let robotstxt_url = api::value_text(
+        values
+            .get(3)
+            .ok_or_else(|| Error::new_message("expected robotstxt_url argument"))?,
+    )?;
+    let robotstxt_origin = UrlOrigin::parse(robotstxt_url).ok_or_else(|| {
+        Error::new_message(format!(
+            "robotstxt_url must be an absolute URL, like https://example.com/robots.txt, not {:?}",
+            robotstxt_url
+        ))
+    })?;
+    if UrlOrigin::parse(url).as_ref() != Some(&robotstxt_origin) {
+        api::result_null(context);
+        return Ok(());
+    }
+    let allowed = path_allowed(context, values, cache, useragent, &get_path_params_query(url))?;
+    api::result_bool(context, allowed);
+    Ok(())
+}
+
+/// Checks `url` against every user-agent in the JSON array `values[1]`, with
+/// a single parse of the robots.txt in `values[0]`. Verdicts are returned in
+/// the order of the array.
+fn agent_verdicts(
+    context: *mut sqlite3_context,
+    values: &[*mut sqlite3_value],
+    cache: &SharedRobotsCache,
+) -> Result<Vec<(String, bool)>> {
+    let robotstxt = values
+        .get(0)
+        .ok_or_else(|| Error::new_message("expected robotstxt argument"))?;
+    let user_agents = api::value_text(
+        values
+            .get(1)
+            .ok_or_else(|| Error::new_message("expected user_agents argument"))?,
+    )?;
+    let url = api::value_text(
+        values
+            .get(2)
+            .ok_or_else(|| Error::new_message("expected url argument"))?,
+    )?;
+    let user_agents: Vec<String> = serde_json::from_str(user_agents).map_err(|e| {
+        Error::new_message(format!("user_agents is not a JSON array of strings: {}", e))
+    })?;
+    let path = get_path_params_query(url);
+
+    if api::value_type(robotstxt) == ValueType::Blob && is_compiled_blob(api::value_blob(robotstxt))
+    {
+        let view = CompiledRobotsView::new(api::value_blob(robotstxt)).map_err(Error::new_message)?;
+        let tries = (view.rule_count() >= TRIE_MIN_RULES)
+            .then(|| blob_tries(context, 0))
+            .flatten();
+        let start = Instant::now();
+        let verdicts: Vec<(String, bool)> = user_agents
+            .into_iter()
+            .map(|user_agent| {
+                let allowed = view.allowed_path(tries.as_deref(), &user_agent, &path);
+                (user_agent, allowed)
+            })
+            .collect();
+        cache
+            .borrow_mut()
+            .stats
+            .record_matches(verdicts.len(), start.elapsed());
+        return Ok(verdicts);
+    }
+    let robots = compiled_argument(context, values, 0, cache)?;
+    let start = Instant::now();
+    let verdicts: Vec<(String, bool)> = user_agents
+        .into_iter()
+        .map(|user_agent| {
+            let allowed = robots.allowed_path(&user_agent, &path);
+            (user_agent, allowed)
+        })
+        .collect();
+    cache
+        .borrow_mut()
+        .stats
+        .record_matches(verdicts.len(), start.elapsed());
+    Ok(verdicts)
+}
+
+// robotstxt_matches_any(robotstxt, '["bot", "legacybot"]', url) -> 1 or 0
+pub fn robotstxt_matches_any(
+    context: *mut sqlite3_context,
+    values: &[*mut sqlite3_value],
+    cache: &SharedRobotsCache,
+) -> Result<()> {
+    let verdicts = agent_verdicts(context, values, cache)?;
+    api::result_bool(context, verdicts.iter().any(|(_, allowed)| *allowed));
+    Ok(())
+}
+
+// robotstxt_allowed_agents(robotstxt, '["bot", "legacybot"]', url) -> '["bot"]'
+pub fn robotstxt_allowed_agents(
+    context: *mut sqlite3_context,
+    values: &[*mut sqlite3_value],
+    cache: &SharedRobotsCache,
+) -> Result<()> {
+    let verdicts = agent_verdicts(context, values, cache)?;
+    api::result_json(
+        context,
+        verdicts
+            .into_iter()
+            .filter(|(_, allowed)| *allowed)
+            .map(|(user_agent, _)| user_agent)
+            .collect(),
+    )?;
+    Ok(())
+}
+
+// robotstxt_crawl_delay(robotstxt, user_agent) -> seconds or NULL
+pub fn robotstxt_crawl_delay(
+    context: *mut sqlite3_context,
+    values: &[*mut sqlite3_value],
+    cache: &SharedRobotsCache,
+) -> Result<()> {
+    let robotstxt = values
+        .get(0)
+        .ok_or_else(|| Error::new_message("expected robotstxt argument"))?;
+    let user_agent = api::value_text(
+        values
+            .get(1)
+            .ok_or_else(|| Error::new_message("expected user_agent argument"))?,
+    )?;
+
+    let crawl_delay = if api::value_type(robotstxt) == ValueType::Blob
+        && is_compiled_blob(api::value_blob(robotstxt))
+    {
+        let view = CompiledRobotsView::new(api::value_blob(robotstxt)).map_err(Error::new_message)?;
+        view.crawl_delay(user_agent)
+    } else {
+        compiled_argument(context, values, 0, cache)?.crawl_delay(user_agent)
+    };
+    match crawl_delay {
+        Some(delay) => api::result_double(context, delay),
+        None => api::result_null(context),
+    }
+    Ok(())
+}
+
+// robotstxt_match_details(robotstxt, user_agent, url) -> '{"allowed": 0, "rule": {...}, ...}'
+pub fn robotstxt_match_details(
+    context: *mut sqlite3_context,
+    values: &[*mut sqlite3_value],
+    cache: &SharedRobotsCache,
+) -> Result<()> {
+    let robotstxt = values
+        .get(0)
+        .ok_or_else(|| Error::new_message("expected robotstxt argument"))?;
+    let useragent = api::value_text(
+        values
+            .get(1)
+            .ok_or_else(|| Error::new_message("expected user_agent argument"))?,
+    )?;
+    let url = api::value_text(
+        values
+            .get(2)
+            .ok_or_else(|| Error::new_message("expected url argument"))?,
+    )?;
+    let path = get_path_params_query(url);
+
+    let group_json = |index: usize, user_agents: Vec<String>, global: bool| {
+        json!({
+            "index": index,
+            "user_agents": user_agents,
+            "global": global,
+        })
+    };
+    // output of robotstxt_compile(), matched in place
+    if api::value_type(robotstxt) == ValueType::Blob && is_compiled_blob(api::value_blob(robotstxt))
+    {
+        let view = CompiledRobotsView::new(api::value_blob(robotstxt)).map_err(Error::new_message)?;
+        let verdict = view.verdict(useragent, &path);
+        let group = verdict.group.and_then(|index| {
+            let group = view.group(index)?;
+            let user_agents = group
+                .user_agents()
+                .map(|name| String::from_utf8_lossy(name).into_owned())
+                .collect();
+            Some(group_json(index, user_agents, group.is_global()))
+        });
+        return result_match_details(context, &path, verdict, group);
+    }
+
+    let robots = compiled_argument(context, values, 0, cache)?;
+    let verdict = robots.verdict(useragent, &path);
+    let group = verdict.group.map(|index| {
+        let group = &robots.groups[index];
+        group_json(index, group.user_agents.clone(), group.global)
+    });
+    result_match_details(context, &path, verdict, group)
+}
+
+fn result_match_details(
+    context: *mut sqlite3_context,
+    path: &str,
+    verdict: Verdict,
+    group: Option<serde_json::Value>,
+) -> Result<()> {
+    let rule = verdict.rule.map(|rule| {
+        json!({
+            "line": rule.line_number,
+            "type": if rule.allow { "allow" } else { "disallow" },
+            "pattern": String::from_utf8_lossy(rule.pattern),
+            "priority": rule.pattern.len(),
+        })
+    });
+    api::result_json(
+        context,
+        json!({
+            "allowed": verdict.allowed,
+            "path": path,
+            "specific": verdict.specific,
+            "rule": rule,
+            "group": group,
+        }),
+    )?;
+    Ok(())
+}
+
+// robotstxt_compile(robotstxt) -> compiled BLOB, usable in place of the text
+pub fn robotstxt_compile(
+    context: *mut sqlite3_context,
+    values: &[*mut sqlite3_value],
+    cache: &SharedRobotsCache,
+) -> Result<()> {
+    let robotstxt = api::value_blob(
+        values
+            .get(0)
+            .ok_or_else(|| Error::new_message("expected robots.txt argument"))?,
+    );
+    let limited = cache.borrow().limits.apply(robotstxt);
+    let robots = CompiledRobots::compile(&limited.text);
+    api::result_blob(context, compiled_blob::encode(&robots).as_slice());
+    Ok(())
+}
+
+/// Reads the JSON array of `[user_agent, rule_type, path, source]` rows given
+/// to robotstxt_group_compile(). `source` is optional and defaults to the
+/// row's position, and a NULL rule_type and path stand for a user-agent
+/// without rules.
+fn rule_rows(rows: &[serde_json::Value]) -> Result<Vec<RuleRow<'_>>> {
+    rows.iter()
+        .enumerate()
+        .map(|(index, row)| {
+            let invalid = || {
+                Error::new_message(format!(
+                    "row {} of rules must be an array of user_agent, rule_type, path and an optional source, not {}",
+                    index + 1,
+                    row
+                ))
+            };
+            let fields = row.as_array().ok_or_else(invalid)?;
+            if fields.len() != 3 && fields.len() != 4 {
+                return Err(invalid());
+            }
+            let user_agent = fields[0].as_str().ok_or_else(invalid)?;
+            let rule = match (&fields[1], &fields[2]) {
+                (serde_json::Value::Null, serde_json::Value::Null) => None,
+                (serde_json::Value::String(rule_type), serde_json::Value::String(path)) => {
+                    let rule_type = if rule_type.eq_ignore_ascii_case("allow") {
+                        RobotsUserAgentRuleType::Allow
+                    } else if rule_type.eq_ignore_ascii_case("disallow") {
+                        RobotsUserAgentRuleType::Disallow
+                    } else {
+                        return Err(Error::new_message(format!(
+                            "row {} of rules has rule_type {:?}, expected 'allow' or 'disallow'",
+                            index + 1,
+                            rule_type
+                        )));
+                    };
+                    Some((rule_type, path.as_str()))
+                }
+                _ => return Err(invalid()),
+            };
+            let line_number = match fields.get(3) {
+                None | Some(serde_json::Value::Null) => index as u32 + 1,
+                Some(source) => source
+                    .as_u64()
+                    .and_then(|source| u32::try_from(source).ok())
+                    .ok_or_else(invalid)?,
+            };
+            Ok(RuleRow {
+                user_agent,
+                rule,
+                line_number,
+            })
+        })
+        .collect()
+}
+
+// robotstxt_group_compile(json_group_array(json_array(user_agent, rule_type, path)))
+// -> the same BLOB as robotstxt_compile(), built from rule rows
+pub fn robotstxt_group_compile(
+    context: *mut sqlite3_context,
+    values: &[*mut sqlite3_value],
+) -> Result<()> {
+    let rules = api::value_text(
+        values
+            .get(0)
+            .ok_or_else(|| Error::new_message("expected rules argument"))?,
+    )?;
+    let rows: Vec<serde_json::Value> = serde_json::from_str(rules)
+        .map_err(|e| Error::new_message(format!("rules is not a JSON array: {}", e)))?;
+    let robots = CompiledRobots::from_rule_rows(rule_rows(&rows)?);
+    api::result_blob(context, compiled_blob::encode(&robots).as_slice());
+    Ok(())
+}
+
+// robotstxt_cache_configure(max_entries, max_bytes)
+pub fn robotstxt_cache_configure(
+    context: *mut sqlite3_context,
+    values: &[*mut sqlite3_value],
+    cache: &SharedRobotsCache,
+) -> Result<()> {
+    let max_entries = api::value_int64(
+        values
+            .get(0)
+            .ok_or_else(|| Error::new_message("expected max_entries argument"))?,
+    );
+    let max_bytes = api::value_int64(
+        values
+            .get(1)
+            .ok_or_else(|| Error::new_message("expected max_bytes argument"))?,
+    );
+    if max_entries < 0 || max_bytes < 0 {
+        return Err(Error::new_message(
+            "max_entries and max_bytes must not be negative",
+        ));
+    }
+    cache
+        .borrow_mut()
+        .resize(max_entries as usize, max_bytes as usize);
+    api::result_bool(context, true);
+    Ok(())
+}
+
+// robotstxt_limits_configure(max_bytes, max_line_length, max_rules), 0 for no limit
+pub fn robotstxt_limits_configure(
+    context: *mut sqlite3_context,
+    values: &[*mut sqlite3_value],
+    cache: &SharedRobotsCache,
+) -> Result<()> {
+    let limit = |index: usize, name: &str| -> Result<usize> {
+        let value = api::value_int64(
+            values
+                .get(index)
+                .ok_or_else(|| Error::new_message(format!("expected {} argument", name)))?,
+        );
+        if value < 0 {
+            return Err(Error::new_message(format!("{} must not be negative", name)));
+        }
+        Ok(value as usize)
+    };
+    let limits = Limits {
+        max_bytes: limit(0, "max_bytes")?,
+        max_line_length: limit(1, "max_line_length")?,
+        max_rules: limit(2, "max_rules")?,
+    };
+    cache.borrow_mut().set_limits(limits);
+    api::result_bool(context, true);
+    Ok(())
+}
+
+// robotstxt_limits() -> '{"max_bytes": 512000, "max_line_length": 16663, "max_rules": 0}'
+pub fn robotstxt_limits(
+    context: *mut sqlite3_context,
+    _values: &[*mut sqlite3_value],
+    cache: &SharedRobotsCache,
 ) -> Result<()> {
-    let robotstxt = api::value_text(values.get(0).ok_or_else(|| Error::new_message("TODO"))?)?;
-    let useragent = api::value_text(values.get(1).ok_or_else(|| Error::new_message("TODO"))?)?;
-    let url = api::value_text(values.get(2).ok_or_else(|| Error::new_message("TODO"))?)?;
+    let limits = cache.borrow().limits;
+    api::result_json(
+        context,
+        json!({
+            "max_bytes": limits.max_bytes,
+            "max_line_length": limits.max_line_length,
+            "max_rules": limits.max_rules,
+        }),
+    )?;
+    Ok(())
+}
 
-    let mut matcher = DefaultMatcher::default();
-    let result = matcher.one_agent_allowed_by_robots(robotstxt, useragent, url);
-    api::result_bool(context, result);
+// robotstxt_cache_stats() -> '{"entries": 1, "hits": 9, ...}'
+pub fn robotstxt_cache_stats(
+    context: *mut sqlite3_context,
+    _values: &[*mut sqlite3_value],
+    cache: &SharedRobotsCache,
+) -> Result<()> {
+    let cache = cache.borrow();
+    api::result_json(
+        context,
+        json!({
+            "entries": cache.len(),
+            "bytes": cache.bytes(),
+            "max_entries": cache.max_entries,
+            "max_bytes": cache.max_bytes,
+            "hits": cache.hits,
+            "misses": cache.misses,
+            "evictions": cache.evictions,
+            "shared_hits": cache.shared_hits,
+        }),
+    )?;
+    Ok(())
+}
+
+// robotstxt_shared_cache_configure(max_entries, max_bytes), 0 and 0 to disable
+pub fn robotstxt_shared_cache_configure(
+    context: *mut sqlite3_context,
+    values: &[*mut sqlite3_value],
+) -> Result<()> {
+    let max_entries = api::value_int64(
+        values
+            .get(0)
+            .ok_or_else(|| Error::new_message("expected max_entries argument"))?,
+    );
+    let max_bytes = api::value_int64(
+        values
+            .get(1)
+            .ok_or_else(|| Error::new_message("expected max_bytes argument"))?,
+    );
+    if max_entries < 0 || max_bytes < 0 {
+        return Err(Error::new_message(
+            "max_entries and max_bytes must not be negative",
+        ));
+    }
+    shared_cache().resize(max_entries as usize, max_bytes as usize);
+    api::result_bool(context, true);
+    Ok(())
+}
+
+// robotstxt_shared_cache_stats() -> '{"entries": 1, "hits": 9, ...}', for the whole process
+pub fn robotstxt_shared_cache_stats(
+    context: *mut sqlite3_context,
+    _values: &[*mut sqlite3_value],
+) -> Result<()> {
+    let stats = shared_cache().stats();
+    api::result_json(
+        context,
+        json!({
+            "entries": stats.entries,
+            "bytes": stats.bytes,
+            "max_entries": stats.max_entries,
+            "max_bytes": stats.max_bytes,
+            "hits": stats.hits,
+            "misses": stats.misses,
+            "evictions": stats.evictions,
+        }),
+    )?;
+    Ok(())
+}
+
+// robotstxt_stats_reset() -> 1, zeroing the counters of robotstxt_stats()
+pub fn robotstxt_stats_reset(
+    context: *mut sqlite3_context,
+    _values: &[*mut sqlite3_value],
+    cache: &SharedRobotsCache,
+) -> Result<()> {
+    cache.borrow_mut().reset_stats();
+    api::result_bool(context, true);
     Ok(())
 }
 
@@ -49,6 +642,8 @@ Source: {}
 
 #[sqlite_entrypoint]
 pub fn sqlite3_robotstxt_init(db: *mut sqlite3) -> Result<()> {
+    let cache: SharedRobotsCache = Rc::new(RefCell::new(RobotsCache::default()));
+
     define_scalar_function(
         db,
         "robotstxt_version",
@@ -63,16 +658,153 @@ pub fn sqlite3_robotstxt_init(db: *mut sqlite3) -> Result<()> {
         robotstxt_debug,
         FunctionFlags::UTF8 | FunctionFlags::DETERMINISTIC,
     )?;
-    define_scalar_function(
+    // The limits only change the results for files that exceed them, so the
+    // functions that parse robots.txt text stay DETERMINISTIC. Indexes and
+    // generated columns built before robotstxt_limits_configure() need a
+    // REINDEX if oversized files are affected.
+    define_scalar_function_with_aux(
         db,
         "robotstxt_matches",
         3,
         robotstxt_matches,
         FunctionFlags::UTF8 | FunctionFlags::DETERMINISTIC,
+        cache.clone(),
+    )?;
+    define_scalar_function_with_aux(
+        db,
+        "robotstxt_matches_path",
+        3,
+        robotstxt_matches_path,
+        FunctionFlags::UTF8 | FunctionFlags::DETERMINISTIC,
+        cache.clone(),
+    )?;
+    define_scalar_function_with_aux(
+        db,
+        "robotstxt_matches_url",
+        4,
+        robotstxt_matches_url,
+        FunctionFlags::UTF8 | FunctionFlags::DETERMINISTIC,
+        cache.clone(),
+    )?;
+    define_scalar_function(
+        db,
+        "robotstxt_path",
+        1,
+        robotstxt_path,
+        FunctionFlags::UTF8 | FunctionFlags::DETERMINISTIC,
+    )?;
+    define_scalar_function_with_aux(
+        db,
+        "robotstxt_match_details",
+        3,
+        robotstxt_match_details,
+        FunctionFlags::UTF8 | FunctionFlags::DETERMINISTIC,
+        cache.clone(),
+    )?;
+    define_scalar_function_with_aux(
+        db,
+        "robotstxt_matches_any",
+        3,
+        robotstxt_matches_any,
+        FunctionFlags::UTF8 | FunctionFlags::DETERMINISTIC,
+        cache.clone(),
+    )?;
+    define_scalar_function_with_aux(
+        db,
+        "robotstxt_allowed_agents",
+        3,
+        robotstxt_allowed_agents,
+        FunctionFlags::UTF8 | FunctionFlags::DETERMINISTIC,
+        cache.clone(),
+    )?;
+    define_scalar_function_with_aux(
+        db,
+        "robotstxt_crawl_delay",
+        2,
+        robotstxt_crawl_delay,
+        FunctionFlags::UTF8 | FunctionFlags::DETERMINISTIC,
+        cache.clone(),
+    )?;
+    define_scalar_function_with_aux(
+        db,
+        "robotstxt_compile",
+        1,
+        robotstxt_compile,
+        FunctionFlags::UTF8 | FunctionFlags::DETERMINISTIC,
+        cache.clone(),
+    )?;
+    define_scalar_function(
+        db,
+        "robotstxt_group_compile",
+        1,
+        robotstxt_group_compile,
+        FunctionFlags::UTF8 | FunctionFlags::DETERMINISTIC,
+    )?;
+    define_scalar_function_with_aux(
+        db,
+        "robotstxt_cache_configure",
+        2,
+        robotstxt_cache_configure,
+        FunctionFlags::UTF8,
+        cache.clone(),
+    )?;
+    define_scalar_function_with_aux(
+        db,
+        "robotstxt_cache_stats",
+        0,
+        robotstxt_cache_stats,
+        FunctionFlags::UTF8,
+        cache.clone(),
+    )?;
+    define_scalar_function_with_aux(
+        db,
+        "robotstxt_limits_configure",
+        3,
+        robotstxt_limits_configure,
+        FunctionFlags::UTF8,
+        cache.clone(),
+    )?;
+    define_scalar_function_with_aux(
+        db,
+        "robotstxt_limits",
+        0,
+        robotstxt_limits,
+        FunctionFlags::UTF8,
+        cache.clone(),
+    )?;
+    // the shared cache is process-wide, so only top-level SQL may resize or
+    // empty it, never a view, trigger or schema entry of an untrusted database
+    define_scalar_function(
+        db,
+        "robotstxt_shared_cache_configure",
+        2,
+        robotstxt_shared_cache_configure,
+        FunctionFlags::UTF8 | FunctionFlags::DIRECTONLY,
+    )?;
+    define_scalar_function(
+        db,
+        "robotstxt_shared_cache_stats",
+        0,
+        robotstxt_shared_cache_stats,
+        FunctionFlags::UTF8,
+    )?;
+    define_scalar_function_with_aux(
+        db,
+        "robotstxt_stats_reset",
+        0,
+        robotstxt_stats_reset,
+        FunctionFlags::UTF8,
+        cache.clone(),
     )?;
 
-    define_table_function::<UserAgentsTable>(db, "robotstxt_user_agents", None)?;
-    define_table_function::<RulesTable>(db, "robotstxt_rules", None)?;
+    define_table_function::<UserAgentsTable>(db, "robotstxt_user_agents", Some(cache.clone()))?;
+    define_table_function::<RulesTable>(db, "robotstxt_rules", Some(cache.clone()))?;
+    define_table_function::<SitemapsTable>(db, "robotstxt_sitemaps", Some(cache.clone()))?;
+    define_table_function::<DirectivesTable>(db, "robotstxt_directives", Some(cache.clone()))?;
+    define_virtual_table_writeable::<IndexTable>(db, "robotstxt_index", Some(cache.clone()))?;
+    define_table_function::<StatsTable>(db, "robotstxt_stats", Some(cache.clone()))?;
+    define_table_function::<CorpusStatsTable>(db, "robotstxt_corpus_stats", Some(cache.clone()))?;
+    define_table_function::<MatchesBatchTable>(db, "robotstxt_matches_batch", Some(cache))?;
     Ok(())
 }
 
@@ -0,0 +1,136 @@
+//! Bounds on the robots.txt text handed to the parsers, so that a huge or
+//! hostile file costs no more than a normal one.
+//!
+//! RFC 9309 asks crawlers to parse at least the first 500 KiB of a
+//! robots.txt file, and Google ignores anything after that, so the default
+//! limit cuts the text there. Bodies that are HTML pages, typically error
+//! pages served in place of a missing robots.txt, are treated as empty.
+
+use std::borrow::Cow;
+
+use crate::utils::{
+    decode_robotstxt, floor_char_boundary, rules_prefix_len, MAX_LINE_LENGTH, UTF8_BOM,
+};
+
+pub(crate) const DEFAULT_MAX_BYTES: usize = 500 * 1024;
+
+/// The limits applied to every robots.txt text. A limit of 0 disables it.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub(crate) struct Limits {
+    pub(crate) max_bytes: usize,
+    /// Longer lines are cut, like the parser already does past
+    /// `MAX_LINE_LENGTH` bytes.
+    pub(crate) max_line_length: usize,
+    /// Allow/Disallow lines after this many are ignored.
+    pub(crate) max_rules: usize,
+}
+
+impl Default for Limits {
+    fn default() -> Self {
+        Limits {
+            max_bytes: DEFAULT_MAX_BYTES,
+            max_line_length: MAX_LINE_LENGTH,
+            max_rules: 0,
+        }
+    }
+}
+
+/// A robots.txt text with `Limits` applied.
+pub(crate) struct Limited<'a> {
+    pub(crate) text: Cow<'a, str>,
+    /// Whether anything was cut by a limit
+    pub(crate) truncated: bool,
+    /// Whether the text was an HTML page, and so replaced with nothing
+    pub(crate) html: bool,
+}
+
+impl Limits {
+    /// Cuts the bytes of a robots.txt file down to the limits and decodes
+    /// them. Only the first `max_bytes` are ever looked at, and the text is
+    /// only copied when it isn't valid UTF-8 or a line needs to be shortened
+    /// below the parser's own line limit.
+    pub(crate) fn apply<'a>(&self, source: &'a [u8]) -> Limited<'a> {
+        if looks_like_html(source) {
+            return Limited {
+                text: Cow::Borrowed(""),
+                truncated: false,
+                html: true,
+            };
+        }
+        let mut bytes = source;
+        if self.max_bytes > 0 && bytes.len() > self.max_bytes {
+            // don't leave half of a UTF-8 character at the end
+            let mut end = self.max_bytes;
+            while end > self.max_bytes.saturating_sub(3) && bytes[end] & 0xc0 == 0x80 {
+                end -= 1;
+            }
+            bytes = &bytes[..end];
+        }
+        let mut truncated = bytes.len() < source.len();
+        let mut text = decode_robotstxt(bytes);
+        if self.max_rules > 0 {
+            if let Some(len) = rules_prefix_len(&text, self.max_rules) {
+                text = match text {
+                    Cow::Borrowed(text) => Cow::Borrowed(&text[..len]),
+                    Cow::Owned(mut text) => {
+                        text.truncate(len);
+                        Cow::Owned(text)
+                    }
+                };
+                truncated = true;
+            }
+        }
+        if self.max_line_length > 0 && self.max_line_length < MAX_LINE_LENGTH {
+            if let Some(shortened) = truncate_lines(&text, self.max_line_length) {
+                text = Cow::Owned(shortened);
+                truncated = true;
+            }
+        }
+        Limited {
+            text,
+            truncated,
+            html: false,
+        }
+    }
+}
+
+/// Whether `source` starts like an HTML document. Only the first few bytes
+/// after leading whitespace are checked.
+pub(crate) fn looks_like_html(source: &[u8]) -> bool {
+    let start = source.strip_prefix(UTF8_BOM).unwrap_or(source);
+    let start = match start.iter().position(|byte| !byte.is_ascii_whitespace()) {
+        Some(position) => &start[position..],
+        None => return false,
+    };
+    ["<!doctype html", "<html", "<head", "<body"]
+        .iter()
+        .any(|prefix| {
+            start.len() >= prefix.len()
+                && start[..prefix.len()].eq_ignore_ascii_case(prefix.as_bytes())
+        })
+}
+
+/// A copy of `source` with every line cut to `max_line_length` bytes, or
+/// `None` when no line is that long.
+fn truncate_lines(source: &str, max_line_length: usize) -> Option<String> {
+    let too_long = source
+        .split(|c| c == '\n' || c == '\r')
+        .any(|line| line.len() > max_line_length);
+    if !too_long {
+        return None;
+    }
+    let mut shortened = String::with_capacity(source.len());
+    let mut rest = source;
+    loop {
+        let end = rest.find(|c| c == '\n' || c == '\r').unwrap_or(rest.len());
+        let line = &rest[..end];
+        shortened.push_str(&line[..floor_char_boundary(line, max_line_length)]);
+        match rest[end..].chars().next() {
+            Some(terminator) => {
+                shortened.push(terminator);
+                rest = &rest[end + 1..];
+            }
+            None => return Some(shortened),
+        }
+    }
+}
@@ -0,0 +1,470 @@
+//! select * from robotstxt_corpus_stats((select json_group_array(robotstxt) from sites))
+//! select * from robotstxt_corpus_stats((select json_group_array(robotstxt) from sites), '["GPTBot", "CCBot"]')
+//!
+//! Statistics over every robots.txt file in a JSON array, computed in one pass
+//! without materializing the rules of each file: how each user-agent is
+//! treated, how often each Allow/Disallow pattern appears, and how large the
+//! groups are. The corpus is passed as data rather than as a query to run, so
+//! the table function never executes SQL of its own.
+
+use sqlite_loadable::prelude::*;
+use sqlite_loadable::{
+    api,
+    table::{BestIndexError, ConstraintOperator, IndexInfo, VTab, VTabArguments, VTabCursor},
+    Error, Result,
+};
+
+use crate::{cache::SharedRobotsCache, compiled::CompiledRobots, utils::RobotsUserAgentRuleType};
+use std::{
+    collections::{HashMap, HashSet},
+    mem,
+    os::raw::c_int,
+    time::Instant,
+};
+
+static CREATE_SQL: &str = "CREATE TABLE x(statistic text, value, count int, fully_blocked int, partially_blocked int, allowed int, corpus hidden, user_agents hidden)";
+enum Columns {
+    Statistic,
+    Value,
+    Count,
+    FullyBlocked,
+    PartiallyBlocked,
+    Allowed,
+    Corpus,
+    UserAgents,
+}
+fn column(index: i32) -> Option<Columns> {
+    match index {
+        0 => Some(Columns::Statistic),
+        1 => Some(Columns::Value),
+        2 => Some(Columns::Count),
+        3 => Some(Columns::FullyBlocked),
+        4 => Some(Columns::PartiallyBlocked),
+        5 => Some(Columns::Allowed),
+        6 => Some(Columns::Corpus),
+        7 => Some(Columns::UserAgents),
+        _ => None,
+    }
+}
+
+const IDX_USER_AGENTS: i32 = 1;
+
+/// How many distinct values each statistic counts exactly. Values first seen
+/// after that are counted together in a row with a NULL value, which keeps
+/// memory bounded however large the corpus is.
+pub(crate) const MAX_VALUES: usize = 100_000;
+
+/// How many bytes of distinct values each statistic keeps, so that a few
+/// thousand huge patterns can't use more memory than `MAX_VALUES` short ones.
+pub(crate) const MAX_VALUE_BYTES: usize = 16 * 1024 * 1024;
+
+/// The heap size of a counted value.
+trait ValueBytes {
+    fn value_bytes(&self) -> usize;
+}
+
+impl ValueBytes for String {
+    fn value_bytes(&self) -> usize {
+        self.len()
+    }
+}
+
+impl ValueBytes for (&'static str, String) {
+    fn value_bytes(&self) -> usize {
+        self.1.len()
+    }
+}
+
+impl ValueBytes for i64 {
+    fn value_bytes(&self) -> usize {
+        0
+    }
+}
+
+/// How the files of a corpus treat one user-agent.
+#[derive(Debug, Clone, Copy, Default)]
+struct AgentCounts {
+    files: u64,
+    /// `/` is disallowed
+    fully_blocked: u64,
+    /// `/` is allowed, but some non-empty Disallow rule applies
+    partially_blocked: u64,
+    /// No Disallow rule applies
+    allowed: u64,
+}
+
+/// Counts per distinct key, up to `MAX_VALUES` keys and `MAX_VALUE_BYTES` of
+/// them, with the rest counted in `other`.
+struct BoundedCounts<K, V> {
+    counts: HashMap<K, V>,
+    bytes: usize,
+    other: Option<V>,
+}
+
+impl<K: std::hash::Hash + Eq, V: Default> Default for BoundedCounts<K, V> {
+    fn default() -> Self {
+        BoundedCounts {
+            counts: HashMap::new(),
+            bytes: 0,
+            other: None,
+        }
+    }
+}
+
+impl<K: std::hash::Hash + Eq + ValueBytes, V: Default> BoundedCounts<K, V> {
+    fn entry(&mut self, key: K) -> &mut V {
+        if !self.counts.contains_key(&key) {
+            let bytes = key.value_bytes();
+            if self.counts.len() >= MAX_VALUES || self.bytes + bytes > MAX_VALUE_BYTES {
+                return self.other.get_or_insert_with(V::default);
+            }
+            self.bytes += bytes;
+        }
+        self.counts.entry(key).or_default()
+    }
+
+    /// The counted keys, most counted first by `order`, then the others.
+    fn into_sorted(self, order: impl Fn(&V) -> u64) -> Vec<(Option<K>, V)>
+    where
+        K: Ord,
+    {
+        let mut counts: Vec<(K, V)> = self.counts.into_iter().collect();
+        counts.sort_by(|(a_key, a), (b_key, b)| order(b).cmp(&order(a)).then(a_key.cmp(b_key)));
+        counts
+            .into_iter()
+            .map(|(key, value)| (Some(key), value))
+            .chain(self.other.map(|value| (None, value)))
+            .collect()
+    }
+}
+
+/// The statistics gathered so far over a corpus.
+#[derive(Default)]
+struct CorpusStats {
+    files: u64,
+    truncated: u64,
+    html_rejected: u64,
+    agents: BoundedCounts<String, AgentCounts>,
+    patterns: BoundedCounts<(&'static str, String), u64>,
+    group_rules: BoundedCounts<i64, u64>,
+    group_agents: BoundedCounts<i64, u64>,
+}
+
+impl CorpusStats {
+    /// Adds one file. `user_agents` are the agents to check in every file;
+    /// without them, every agent the file names is checked, plus `*`.
+    fn add(&mut self, robots: &CompiledRobots, user_agents: Option<&[String]>) {
+        self.files += 1;
+
+        match user_agents {
+            Some(user_agents) => {
+                for user_agent in user_agents {
+                    let groups = robots.applicable_groups(user_agent);
+                    let treatment = treatment(robots, &groups);
+                    treatment(self.agents.entry(user_agent.clone()));
+                }
+            }
+            None => {
+                // how the file treats agents it doesn't name
+                let global: Vec<(usize, bool)> = robots
+                    .groups
+                    .iter()
+                    .enumerate()
+                    .filter(|(_, group)| group.global)
+                    .map(|(index, _)| (index, false))
+                    .collect();
+                treatment(robots, &global)(self.agents.entry("*".to_owned()));
+
+                let mut seen = HashSet::new();
+                for group in &robots.groups {
+                    for user_agent in &group.user_agents {
+                        let user_agent = user_agent.to_ascii_lowercase();
+                        if !seen.insert(user_agent.clone()) {
+                            continue;
+                        }
+                        let groups = robots.applicable_groups(&user_agent);
+                        treatment(robots, &groups)(self.agents.entry(user_agent));
+                    }
+                }
+            }
+        }
+
+        let mut seen = HashSet::new();
+        for group in &robots.groups {
+            for rule in &group.rules {
+                let rule_type = match rule.rule_type {
+                    RobotsUserAgentRuleType::Allow => "allow",
+                    RobotsUserAgentRuleType::Disallow => "disallow",
+                };
+                if seen.insert((rule_type, rule.pattern.as_str())) {
+                    *self.patterns.entry((rule_type, rule.pattern.clone())) += 1;
+                }
+            }
+            *self.group_rules.entry(group.rules.len() as i64) += 1;
+            let agents = group.user_agents.len() + group.global as usize;
+            *self.group_agents.entry(agents as i64) += 1;
+        }
+    }
+
+    fn into_rows(self) -> Vec<Row> {
+        let mut rows = vec![
+            Row::count("files", None, self.files),
+            Row::count("truncated", None, self.truncated),
+            Row::count("html_rejected", None, self.html_rejected),
+        ];
+        for (user_agent, counts) in self.agents.into_sorted(|counts| counts.files) {
+            rows.push(Row {
+                statistic: "agent",
+                value: user_agent.map(Value::Text),
+                count: counts.files,
+                agent: Some(counts),
+            });
+        }
+        for (pattern, count) in self.patterns.into_sorted(|count| *count) {
+            let (statistic, value) = match pattern {
+                Some((rule_type, pattern)) => (rule_type, Some(Value::Text(pattern))),
+                None => ("pattern", None),
+            };
+            rows.push(Row::count(statistic, value, count));
+        }
+        for (size, count) in self.group_rules.into_sorted(|count| *count) {
+            rows.push(Row::count("group_rules", size.map(Value::Integer), count));
+        }
+        for (size, count) in self.group_agents.into_sorted(|count| *count) {
+            rows.push(Row::count("group_agents", size.map(Value::Integer), count));
+        }
+        rows
+    }
+}
+
+/// Classifies how `groups` of `robots` treat an agent, returning a function
+/// that adds that to the agent's counts.
+fn treatment(robots: &CompiledRobots, groups: &[(usize, bool)]) -> impl Fn(&mut AgentCounts) {
+    let fully_blocked = !robots.verdict_for_groups(groups, "/").allowed;
+    // in Google's matcher an empty Disallow pattern never blocks anything
+    let has_disallow = groups
+        .iter()
+        .any(|(index, specific)| {
+            // specific groups replace the * groups
+            (*specific || groups.iter().all(|(_, specific)| !specific))
+                && robots.groups[*index].rules.iter().any(|rule| {
+                    matches!(rule.rule_type, RobotsUserAgentRuleType::Disallow)
+                        && !rule.pattern.is_empty()
+                })
+        });
+    move |counts: &mut AgentCounts| {
+        counts.files += 1;
+        if fully_blocked {
+            counts.fully_blocked += 1;
+        } else if has_disallow {
+            counts.partially_blocked += 1;
+        } else {
+            counts.allowed += 1;
+        }
+    }
+}
+
+enum Value {
+    Text(String),
+    Integer(i64),
+}
+
+struct Row {
+    statistic: &'static str,
+    value: Option<Value>,
+    count: u64,
+    /// Only for `agent` rows
+    agent: Option<AgentCounts>,
+}
+
+impl Row {
+    fn count(statistic: &'static str, value: Option<Value>, count: u64) -> Row {
+        Row {
+            statistic,
+            value,
+            count,
+            agent: None,
+        }
+    }
+}
+
+#[repr(C)]
+pub struct CorpusStatsTable {
+    base: sqlite3_vtab,
+    cache: SharedRobotsCache,
+}
+
+impl<'vtab> VTab<'vtab> for CorpusStatsTable {
+    type Aux = SharedRobotsCache;
+    type Cursor = CorpusStatsCursor;
+
+    fn connect(
+        _db: *mut sqlite3,
+        aux: Option<&Self::Aux>,
+        _args: VTabArguments,
+    ) -> Result<(String, CorpusStatsTable)> {
+        let base: sqlite3_vtab = unsafe { mem::zeroed() };
+        let cache = aux
+            .ok_or_else(|| Error::new_message("robotstxt_corpus_stats requires a cache"))?
+            .clone();
+        let vtab = CorpusStatsTable { base, cache };
+        Ok((CREATE_SQL.to_owned(), vtab))
+    }
+    fn destroy(&self) -> Result<()> {
+        Ok(())
+    }
+
+    fn best_index(&self, mut info: IndexInfo) -> core::result::Result<(), BestIndexError> {
+        let (mut has_corpus, mut idx_num) = (false, 0);
+        for mut constraint in info.constraints() {
+            let argv_index = match column(constraint.column_idx()) {
+                Some(Columns::Corpus) => 1,
+                Some(Columns::UserAgents) => 2,
+                _ => continue,
+            };
+            if constraint.usable() && constraint.op() == Some(ConstraintOperator::EQ) {
+                constraint.set_omit(true);
+                constraint.set_argv_index(argv_index);
+                if argv_index == 1 {
+                    has_corpus = true;
+                } else {
+                    idx_num |= IDX_USER_AGENTS;
+                }
+            } else {
+                return Err(BestIndexError::Constraint);
+            }
+        }
+        if !has_corpus {
+            return Err(BestIndexError::Error);
+        }
+        info.set_estimated_cost(1000000.0);
+        info.set_estimated_rows(10000);
+        info.set_idxnum(idx_num);
+        Ok(())
+    }
+
+    fn open(&mut self) -> Result<CorpusStatsCursor> {
+        Ok(CorpusStatsCursor::new(self.cache.clone()))
+    }
+}
+
+#[repr(C)]
+pub struct CorpusStatsCursor {
+    /// Base class. Must be first
+    base: sqlite3_vtab_cursor,
+    cache: SharedRobotsCache,
+    rowid: i64,
+    rows: Vec<Row>,
+}
+impl CorpusStatsCursor {
+    fn new(cache: SharedRobotsCache) -> CorpusStatsCursor {
+        let base: sqlite3_vtab_cursor = unsafe { mem::zeroed() };
+        CorpusStatsCursor {
+            base,
+            cache,
+            rowid: 0,
+            rows: vec![],
+        }
+    }
+}
+
+impl VTabCursor for CorpusStatsCursor {
+    fn filter(
+        &mut self,
+        idx_num: c_int,
+        _idx_str: Option<&str>,
+        values: &[*mut sqlite3_value],
+    ) -> Result<()> {
+        let corpus = api::value_text(
+            values
+                .get(0)
+                .ok_or_else(|| Error::new_message("expected corpus argument"))?,
+        )?;
+        // NULLs count as empty files, like they do everywhere else
+        let corpus: Vec<Option<String>> = serde_json::from_str(corpus).map_err(|e| {
+            Error::new_message(format!("corpus is not a JSON array of strings: {}", e))
+        })?;
+        let user_agents: Option<Vec<String>> = if idx_num & IDX_USER_AGENTS != 0 {
+            let user_agents = api::value_text(
+                values
+                    .get(1)
+                    .ok_or_else(|| Error::new_message("expected user_agents argument"))?,
+            )?;
+            Some(serde_json::from_str(user_agents).map_err(|e| {
+                Error::new_message(format!("user_agents is not a JSON array of strings: {}", e))
+            })?)
+        } else {
+            None
+        };
+
+        let limits = self.cache.borrow().limits;
+        let mut stats = CorpusStats::default();
+        for robotstxt in &corpus {
+            let limited = limits.apply(robotstxt.as_deref().unwrap_or("").as_bytes());
+            stats.truncated += limited.truncated as u64;
+            stats.html_rejected += limited.html as u64;
+            let start = Instant::now();
+            let robots = CompiledRobots::compile(&limited.text);
+            let mut cache = self.cache.borrow_mut();
+            cache.stats.record_limited(&limited);
+            cache.stats.record_parse(limited.text.len(), start.elapsed());
+            drop(cache);
+            stats.add(&robots, user_agents.as_deref());
+        }
+        self.rows = stats.into_rows();
+        self.rowid = 0;
+        Ok(())
+    }
+
+    fn next(&mut self) -> Result<()> {
+        self.rowid += 1;
+        Ok(())
+    }
+
+    fn eof(&self) -> bool {
+        self.rowid as usize >= self.rows.len()
+    }
+
+    fn column(&self, context: *mut sqlite3_context, i: c_int) -> Result<()> {
+        let row = &self.rows[self.rowid as usize];
+        let agent_count = |count: fn(&AgentCounts) -> u64| match &row.agent {
+            Some(agent) => api::result_int64(context, count(agent) as i64),
+            None => api::result_null(context),
+        };
+        match column(i) {
+            Some(Columns::Statistic) => api::result_text(context, row.statistic)?,
+            Some(Columns::Value) => match &row.value {
+                Some(Value::Text(value)) => api::result_text(context, value)?,
+                Some(Value::Integer(value)) => api::result_int64(context, *value),
+                None => api::result_null(context),
+            },
+            Some(Columns::Count) => api::result_int64(context, row.count as i64),
+            Some(Columns::FullyBlocked) => agent_count(|agent| agent.fully_blocked),
+            Some(Columns::PartiallyBlocked) => agent_count(|agent| agent.partially_blocked),
+            Some(Columns::Allowed) => agent_count(|agent| agent.allowed),
+            _ => (),
+        }
+        Ok(())
+    }
+
+    fn rowid(&self) -> Result<i64> {
+        Ok(self.rowid)
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn bounded_counts_cap_value_bytes() {
+        let mut counts: BoundedCounts<String, u64> = BoundedCounts::default();
+        let huge = MAX_VALUE_BYTES / 2 + 1;
+        *counts.entry("a".repeat(huge)) += 1;
+        *counts.entry("b".repeat(huge)) += 1;
+        *counts.entry("a".repeat(huge)) += 1;
+        assert_eq!(counts.counts.len(), 1);
+        assert_eq!(counts.bytes, huge);
+        assert_eq!(counts.other, Some(1));
+    }
+}
@@ -0,0 +1,244 @@
+//! select * from robotstxt_directives(:robotstxt)
+//! Lists the lines of a robots.txt file that aren't User-agent, Allow,
+//! Disallow or Sitemap, like Crawl-delay, Host or Request-rate.
+
+use sqlite_loadable::prelude::*;
+use sqlite_loadable::{
+    api,
+    table::{BestIndexError, ConstraintOperator, IndexInfo, VTab, VTabArguments, VTabCursor},
+    Error, Result,
+};
+
+use crate::cache::SharedRobotsCache;
+use crate::utils::{range_in, GroupLine, GroupLines, GroupLinesState, RobotsLineKind};
+use serde_json::Value;
+use std::{mem, ops::Range, os::raw::c_int, time::Instant};
+
+static CREATE_SQL: &str = "CREATE TABLE x(directive text, value text, source int, group_index int, user_agents text, robotstxt hidden)";
+enum Columns {
+    Directive,
+    Value,
+    Source,
+    GroupIndex,
+    UserAgents,
+    Robotstxt,
+}
+fn column(index: i32) -> Option<Columns> {
+    match index {
+        0 => Some(Columns::Directive),
+        1 => Some(Columns::Value),
+        2 => Some(Columns::Source),
+        3 => Some(Columns::GroupIndex),
+        4 => Some(Columns::UserAgents),
+        5 => Some(Columns::Robotstxt),
+        _ => None,
+    }
+}
+
+#[repr(C)]
+pub struct DirectivesTable {
+    base: sqlite3_vtab,
+    cache: SharedRobotsCache,
+}
+
+impl<'vtab> VTab<'vtab> for DirectivesTable {
+    type Aux = SharedRobotsCache;
+    type Cursor = DirectivesCursor;
+
+    fn connect(
+        _db: *mut sqlite3,
+        aux: Option<&Self::Aux>,
+        _args: VTabArguments,
+    ) -> Result<(String, DirectivesTable)> {
+        let base: sqlite3_vtab = unsafe { mem::zeroed() };
+        let cache = aux
+            .ok_or_else(|| Error::new_message("robotstxt_directives requires a cache"))?
+            .clone();
+        let vtab = DirectivesTable { base, cache };
+        Ok((CREATE_SQL.to_owned(), vtab))
+    }
+    fn destroy(&self) -> Result<()> {
+        Ok(())
+    }
+
+    fn best_index(&self, mut info: IndexInfo) -> core::result::Result<(), BestIndexError> {
+        let mut has_robotstxt = false;
+        for mut constraint in info.constraints() {
+            if let Some(Columns::Robotstxt) = column(constraint.column_idx()) {
+                if constraint.usable() && constraint.op() == Some(ConstraintOperator::EQ) {
+                    constraint.set_omit(true);
+                    constraint.set_argv_index(1);
+                    has_robotstxt = true;
+                } else {
+                    return Err(BestIndexError::Constraint);
+                }
+            }
+        }
+        if !has_robotstxt {
+            return Err(BestIndexError::Error);
+        }
+        info.set_estimated_cost(1000.0);
+        info.set_estimated_rows(10);
+        info.set_idxnum(1);
+
+        Ok(())
+    }
+
+    fn open(&mut self) -> Result<DirectivesCursor> {
+        Ok(DirectivesCursor::new(self.cache.clone()))
+    }
+}
+
+/// The directive the cursor is currently on. Strings are byte ranges into
+/// the cursor's copy of the robots.txt text.
+struct CurrentDirective {
+    line_number: u32,
+    key: Range<usize>,
+    value: Range<usize>,
+    group_index: Option<u32>,
+}
+
+#[repr(C)]
+pub struct DirectivesCursor {
+    /// Base class. Must be first
+    base: sqlite3_vtab_cursor,
+    cache: SharedRobotsCache,
+    rowid: i64,
+    robotstxt: String,
+    lines: GroupLinesState,
+    /// The `User-agent` values of the current group, all of them, including
+    /// those after the current directive
+    group_user_agents: Vec<Range<usize>>,
+    current: Option<CurrentDirective>,
+}
+impl DirectivesCursor {
+    fn new(cache: SharedRobotsCache) -> DirectivesCursor {
+        let base: sqlite3_vtab_cursor = unsafe { mem::zeroed() };
+        DirectivesCursor {
+            base,
+            cache,
+            rowid: 0,
+            robotstxt: String::new(),
+            lines: GroupLinesState::default(),
+            group_user_agents: vec![],
+            current: None,
+        }
+    }
+
+    /// Reads lines until the next unrecognized directive or the end of the
+    /// file. Like rules, directives don't end a group of `User-agent` lines.
+    fn advance(&mut self) {
+        let source = self.robotstxt.as_str();
+        let mut lines = GroupLines::resume(source, self.lines);
+        self.current = None;
+        while let Some(GroupLine {
+            line,
+            group_index,
+            starts_group,
+        }) = lines.next()
+        {
+            if starts_group {
+                // a directive may come before some of its group's User-agent
+                // lines, so they're all read up front
+                self.group_user_agents.clear();
+                self.group_user_agents.push(range_in(source, &line.value));
+                self.group_user_agents.extend(
+                    lines
+                        .rest_of_group_user_agents()
+                        .map(|user_agent| range_in(source, user_agent)),
+                );
+            }
+            if line.kind == RobotsLineKind::Unknown && !line.key.is_empty() {
+                self.current = Some(CurrentDirective {
+                    line_number: line.line_number,
+                    key: range_in(source, line.key),
+                    value: range_in(source, &line.value),
+                    group_index,
+                });
+                break;
+            }
+        }
+        self.lines = lines.state();
+    }
+}
+
+impl VTabCursor for DirectivesCursor {
+    fn filter(
+        &mut self,
+        _idx_num: c_int,
+        _idx_str: Option<&str>,
+        values: &[*mut sqlite3_value],
+    ) -> Result<()> {
+        let start = Instant::now();
+        let robotstxt = api::value_blob(
+            values
+                .get(0)
+                .ok_or_else(|| Error::new_message("expected robotstxt argument"))?,
+        );
+        self.robotstxt.clear();
+        let limited = self.cache.borrow().limits.apply(robotstxt);
+        self.cache.borrow_mut().stats.record_limited(&limited);
+        self.robotstxt.push_str(&limited.text);
+        self.lines = GroupLinesState::default();
+        self.group_user_agents.clear();
+        self.rowid = 0;
+        self.advance();
+        let parsed = self.robotstxt.len();
+        self.cache
+            .borrow_mut()
+            .stats
+            .record_parse(parsed, start.elapsed());
+        Ok(())
+    }
+
+    fn next(&mut self) -> Result<()> {
+        self.rowid += 1;
+        let start = Instant::now();
+        self.advance();
+        self.cache
+            .borrow_mut()
+            .stats
+            .record_parse_time(start.elapsed());
+        Ok(())
+    }
+
+    fn eof(&self) -> bool {
+        self.current.is_none()
+    }
+
+    fn column(&self, context: *mut sqlite3_context, i: c_int) -> Result<()> {
+        let directive = self.current.as_ref().unwrap();
+        match column(i) {
+            Some(Columns::Directive) => api::result_text(
+                context,
+                self.robotstxt[directive.key.clone()].to_ascii_lowercase().as_str(),
+            )?,
+            Some(Columns::Value) => {
+                api::result_text(context, &self.robotstxt[directive.value.clone()])?
+            }
+            Some(Columns::Source) => api::result_int64(context, directive.line_number.into()),
+            Some(Columns::GroupIndex) => match directive.group_index {
+                Some(index) => api::result_int64(context, index.into()),
+                None => api::result_null(context),
+            },
+            Some(Columns::UserAgents) => match directive.group_index {
+                Some(_) => api::result_json(
+                    context,
+                    Value::Array(
+                        self.group_user_agents
+                            .iter()
+                            .map(|range| Value::from(&self.robotstxt[range.clone()]))
+                            .collect(),
+                    ),
+                )?,
+                None => api::result_null(context),
+            },
+            _ => (),
+        }
+        Ok(())
+    }
+
+    fn rowid(&self) -> Result<i64> {
+        Ok(self.rowid)
+    }
+}
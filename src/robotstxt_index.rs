@@ -0,0 +1,441 @@
+//! create virtual table robots using robotstxt_index(agent='MyBot');
+//! insert into robots(host, robotstxt) values ('example.com', :robotstxt);
+//! select allowed from robots where host = 'example.com' and path = '/a/b';
+//!
+//! Each host's robots.txt is stored compiled in a "<name>_hosts" shadow table,
+//! so it survives across connections. Lookups load the rules that apply to
+//! the table's agent into a `RuleTrie`, which is kept in memory for later
+//! lookups on the same host. A kept trie is only reused while the host's row
+//! still has the same rowid and compiled BLOB, so rolled back transactions and
+//! writes from other connections are picked up on the next lookup.
+//!
+//! sqlite-loadable doesn't expose xShadowName, so "<name>_hosts" isn't
+//! registered as a shadow table: even with SQLITE_DBCONFIG_DEFENSIVE on, it
+//! can be written directly. Rows written that way are validated like any other
+//! compiled BLOB when they're read, but should be treated as untrusted input.
+
+use sqlite_loadable::prelude::*;
+use sqlite_loadable::{
+    api::{self, ValueType},
+    table::{
+        BestIndexError, ConstraintOperator, IndexInfo, UpdateOperation, VTab, VTabArguments,
+        VTabCursor, VTabWriteable,
+    },
+    Error, Result,
+};
+
+use crate::{
+    cache::SharedRobotsCache,
+    compiled::{get_path_params_query, CompiledRobots},
+    compiled_blob::{self, is_compiled_blob, CompiledRobotsView},
+    sql::{self, Statement},
+    trie::RuleTrie,
+};
+use std::{cell::RefCell, collections::HashMap, mem, os::raw::c_int, rc::Rc};
+
+static CREATE_SQL: &str = "CREATE TABLE x(host text, robotstxt text, allowed int, path hidden)";
+enum Columns {
+    Host,
+    Robotstxt,
+    Allowed,
+    Path,
+}
+fn column(index: i32) -> Option<Columns> {
+    match index {
+        0 => Some(Columns::Host),
+        1 => Some(Columns::Robotstxt),
+        2 => Some(Columns::Allowed),
+        3 => Some(Columns::Path),
+        _ => None,
+    }
+}
+
+const IDX_HOST: i32 = 1;
+const IDX_PATH: i32 = 2;
+
+/// Hosts whose tries are kept in memory, per table.
+const MAX_CACHED_TRIES: usize = 4096;
+
+/// A host's trie, along with the row it was built from.
+struct CachedTrie {
+    rowid: i64,
+    compiled: Box<[u8]>,
+    trie: Rc<RuleTrie>,
+}
+
+type TrieCache = Rc<RefCell<HashMap<String, CachedTrie>>>;
+
+/// Parses the `agent='MyBot'` argument of `create virtual table`.
+fn parse_agent(arguments: &[String]) -> Result<String> {
+    for argument in arguments {
+        if let Some((key, value)) = argument.split_once('=') {
+            if key.trim().eq_ignore_ascii_case("agent") {
+                let value = value.trim();
+                let unquoted = ['\'', '"']
+                    .into_iter()
+                    .find_map(|quote| value.strip_prefix(quote)?.strip_suffix(quote))
+                    .unwrap_or(value);
+                return Ok(unquoted.to_owned());
+            }
+        }
+    }
+    Err(Error::new_message(
+        "robotstxt_index requires an agent, like robotstxt_index(agent='MyBot')",
+    ))
+}
+
+fn normalize_host(host: &str) -> String {
+    host.trim().to_ascii_lowercase()
+}
+
+#[repr(C)]
+pub struct IndexTable {
+    base: sqlite3_vtab,
+    db: *mut sqlite3,
+    /// `"schema"."name_hosts"`, quoted for SQL
+    hosts_table: String,
+    agent: String,
+    tries: TrieCache,
+    cache: SharedRobotsCache,
+}
+
+impl IndexTable {
+    fn new(
+        db: *mut sqlite3,
+        aux: Option<&SharedRobotsCache>,
+        args: VTabArguments,
+    ) -> Result<IndexTable> {
+        let base: sqlite3_vtab = unsafe { mem::zeroed() };
+        let cache = aux
+            .ok_or_else(|| Error::new_message("robotstxt_index requires a cache"))?
+            .clone();
+        let agent = parse_agent(&args.arguments)?;
+        let hosts_table = format!(
+            "\"{}\".\"{}_hosts\"",
+            args.database_name.replace('"', "\"\""),
+            args.table_name.replace('"', "\"\"")
+        );
+        Ok(IndexTable {
+            base,
+            db,
+            hosts_table,
+            agent,
+            tries: Rc::new(RefCell::new(HashMap::new())),
+            cache,
+        })
+    }
+
+    fn insert(&mut self, values: &[*mut sqlite3_value]) -> Result<i64> {
+        let host = values
+            .get(0)
+            .filter(|value| api::value_type(value) != ValueType::Null)
+            .ok_or_else(|| Error::new_message("robotstxt_index requires a host"))?;
+        let host = normalize_host(api::value_text(host)?);
+        let robotstxt = values
+            .get(1)
+            .filter(|value| api::value_type(value) != ValueType::Null)
+            .ok_or_else(|| Error::new_message("robotstxt_index requires a robotstxt"))?;
+        let compiled = if api::value_type(robotstxt) == ValueType::Blob
+            && is_compiled_blob(api::value_blob(robotstxt))
+        {
+            CompiledRobotsView::new(api::value_blob(robotstxt)).map_err(Error::new_message)?;
+            api::value_blob(robotstxt).to_vec()
+        } else {
+            let limited = self.cache.borrow().limits.apply(api::value_blob(robotstxt));
+            compiled_blob::encode(&CompiledRobots::compile(&limited.text))
+        };
+
+        // a host that's already indexed has its rules replaced
+        let mut stmt = Statement::prepare(
+            self.db,
+            &format!(
+                "insert or replace into {}(host, compiled) values (?, ?) returning rowid",
+                self.hosts_table
+            ),
+        )?;
+        stmt.bind_text(1, &host)?;
+        stmt.bind_blob(2, &compiled)?;
+        let rowid = if stmt.step()? {
+            stmt.column_int64(0)
+        } else {
+            return Err(Error::new_message("robotstxt_index insert returned no rowid"));
+        };
+        self.tries.borrow_mut().remove(&host);
+        Ok(rowid)
+    }
+
+    fn delete(&mut self, rowid: i64) -> Result<()> {
+        let mut stmt = Statement::prepare(
+            self.db,
+            &format!("delete from {} where rowid = ? returning host", self.hosts_table),
+        )?;
+        stmt.bind_int64(1, rowid)?;
+        while stmt.step()? {
+            self.tries.borrow_mut().remove(stmt.column_text(0)?);
+        }
+        Ok(())
+    }
+}
+
+impl<'vtab> VTab<'vtab> for IndexTable {
+    type Aux = SharedRobotsCache;
+    type Cursor = IndexCursor;
+
+    fn create(
+        db: *mut sqlite3,
+        aux: Option<&Self::Aux>,
+        args: VTabArguments,
+    ) -> Result<(String, IndexTable)> {
+        let vtab = IndexTable::new(db, aux, args)?;
+        sql::execute(
+            db,
+            &format!(
+                "create table {}(host text primary key, compiled blob not null)",
+                vtab.hosts_table
+            ),
+        )?;
+        Ok((CREATE_SQL.to_owned(), vtab))
+    }
+
+    fn connect(
+        db: *mut sqlite3,
+        aux: Option<&Self::Aux>,
+        args: VTabArguments,
+    ) -> Result<(String, IndexTable)> {
+        let vtab = IndexTable::new(db, aux, args)?;
+        Ok((CREATE_SQL.to_owned(), vtab))
+    }
+
+    fn destroy(&self) -> Result<()> {
+        sql::execute(self.db, &format!("drop table if exists {}", self.hosts_table))
+    }
+
+    fn best_index(&self, mut info: IndexInfo) -> core::result::Result<(), BestIndexError> {
+        let mut host = None;
+        let mut path = None;
+        for constraint in info.constraints() {
+            if !constraint.usable() || constraint.op() != Some(ConstraintOperator::EQ) {
+                continue;
+            }
+            match column(constraint.column_idx()) {
+                Some(Columns::Host) if host.is_none() => host = Some(constraint),
+                Some(Columns::Path) if path.is_none() => path = Some(constraint),
+                _ => (),
+            }
+        }
+        let mut idx_num = 0;
+        let mut argv_index = 0;
+        for (constraint, flag) in [(host, IDX_HOST), (path, IDX_PATH)] {
+            if let Some(mut constraint) = constraint {
+                argv_index += 1;
+                constraint.set_argv_index(argv_index);
+                constraint.set_omit(true);
+                idx_num |= flag;
+            }
+        }
+        if idx_num & IDX_HOST != 0 {
+            info.set_estimated_cost(10.0);
+            info.set_estimated_rows(1);
+        } else {
+            info.set_estimated_cost(100000.0);
+            info.set_estimated_rows(100000);
+        }
+        info.set_idxnum(idx_num);
+        Ok(())
+    }
+
+    fn open(&mut self) -> Result<IndexCursor> {
+        Ok(IndexCursor::new(
+            self.db,
+            self.hosts_table.clone(),
+            self.agent.clone(),
+            self.tries.clone(),
+        ))
+    }
+}
+
+impl<'vtab> VTabWriteable<'vtab> for IndexTable {
+    fn update(&'vtab mut self, operation: UpdateOperation<'_>, p_rowid: *mut i64) -> Result<()> {
+        match operation {
+            UpdateOperation::Delete(rowid) => self.delete(api::value_int64(&rowid)),
+            UpdateOperation::Insert { values, .. } => {
+                let rowid = self.insert(values)?;
+                unsafe {
+                    *p_rowid = rowid;
+                }
+                Ok(())
+            }
+            UpdateOperation::Update { .. } => Err(Error::new_message(
+                "robotstxt_index doesn't support UPDATE, INSERT the host again to replace its rules",
+            )),
+        }
+    }
+}
+
+/// The host the cursor is currently on.
+struct CurrentHost {
+    rowid: i64,
+    host: String,
+    allowed: Option<bool>,
+}
+
+#[repr(C)]
+pub struct IndexCursor {
+    /// Base class. Must be first
+    base: sqlite3_vtab_cursor,
+    db: *mut sqlite3,
+    hosts_table: String,
+    agent: String,
+    tries: TrieCache,
+    stmt: Option<Statement>,
+    /// The host bound to `stmt`, which SQLite reads in place until the
+    /// statement is done. Declared after `stmt` so it's dropped last.
+    host: Option<String>,
+    /// The path to check on every host, from `where path = ?`
+    path: Option<String>,
+    current: Option<CurrentHost>,
+}
+
+impl IndexCursor {
+    fn new(db: *mut sqlite3, hosts_table: String, agent: String, tries: TrieCache) -> IndexCursor {
+        let base: sqlite3_vtab_cursor = unsafe { mem::zeroed() };
+        IndexCursor {
+            base,
+            db,
+            hosts_table,
+            agent,
+            tries,
+            stmt: None,
+            host: None,
+            path: None,
+            current: None,
+        }
+    }
+
+    fn trie(&self, rowid: i64, host: &str, compiled: &[u8]) -> Result<Rc<RuleTrie>> {
+        if let Some(cached) = self.tries.borrow().get(host) {
+            if cached.rowid == rowid && *cached.compiled == *compiled {
+                return Ok(cached.trie.clone());
+            }
+        }
+        let view = CompiledRobotsView::new(compiled).map_err(Error::new_message)?;
+        let trie = Rc::new(view.rule_trie(&self.agent));
+        let mut tries = self.tries.borrow_mut();
+        if tries.len() >= MAX_CACHED_TRIES {
+            tries.clear();
+        }
+        tries.insert(
+            host.to_owned(),
+            CachedTrie {
+                rowid,
+                compiled: compiled.into(),
+                trie: trie.clone(),
+            },
+        );
+        Ok(trie)
+    }
+
+    fn advance(&mut self) -> Result<()> {
+        let stmt = match self.stmt.as_mut() {
+            Some(stmt) => stmt,
+            None => {
+                self.current = None;
+                return Ok(());
+            }
+        };
+        if !stmt.step()? {
+            self.current = None;
+            self.stmt = None;
+            return Ok(());
+        }
+        let stmt = self.stmt.as_ref().unwrap();
+        let rowid = stmt.column_int64(0);
+        let host = stmt.column_text(1)?.to_owned();
+        let allowed = match &self.path {
+            Some(path) => Some(self.trie(rowid, &host, stmt.column_blob(2))?.allowed(path)),
+            None => None,
+        };
+        self.current = Some(CurrentHost {
+            rowid,
+            host,
+            allowed,
+        });
+        Ok(())
+    }
+}
+
+impl VTabCursor for IndexCursor {
+    fn filter(
+        &mut self,
+        idx_num: c_int,
+        _idx_str: Option<&str>,
+        values: &[*mut sqlite3_value],
+    ) -> Result<()> {
+        // finalize the previous scan before replacing the host it's bound to
+        self.stmt = None;
+        let mut arguments = values.iter();
+        self.host = if idx_num & IDX_HOST != 0 {
+            let value = arguments
+                .next()
+                .ok_or_else(|| Error::new_message("expected host argument"))?;
+            Some(normalize_host(api::value_text(value)?))
+        } else {
+            None
+        };
+        self.path = if idx_num & IDX_PATH != 0 {
+            let value = arguments
+                .next()
+                .ok_or_else(|| Error::new_message("expected path argument"))?;
+            Some(get_path_params_query(api::value_text(value)?).into_owned())
+        } else {
+            None
+        };
+
+        // the compiled rules are only read when checking a path
+        let columns = if self.path.is_some() {
+            "rowid, host, compiled"
+        } else {
+            "rowid, host"
+        };
+        let sql = match &self.host {
+            Some(_) => format!("select {} from {} where host = ?", columns, self.hosts_table),
+            None => format!("select {} from {}", columns, self.hosts_table),
+        };
+        let mut stmt = Statement::prepare(self.db, &sql)?;
+        if let Some(host) = &self.host {
+            stmt.bind_text(1, host)?;
+        }
+        self.stmt = Some(stmt);
+        self.advance()
+    }
+
+    fn next(&mut self) -> Result<()> {
+        self.advance()
+    }
+
+    fn eof(&self) -> bool {
+        self.current.is_none()
+    }
+
+    fn column(&self, context: *mut sqlite3_context, i: c_int) -> Result<()> {
+        let current = self.current.as_ref().unwrap();
+        match column(i) {
+            Some(Columns::Host) => api::result_text(context, current.host.as_str())?,
+            Some(Columns::Allowed) => match current.allowed {
+                Some(allowed) => api::result_bool(context, allowed),
+                None => api::result_null(context),
+            },
+            Some(Columns::Path) => match &self.path {
+                Some(path) => api::result_text(context, path.as_str())?,
+                None => api::result_null(context),
+            },
+            // only used to insert rules, robots.txt text isn't kept
+            Some(Columns::Robotstxt) | None => api::result_null(context),
+        }
+        Ok(())
+    }
+
+    fn rowid(&self) -> Result<i64> {
+        Ok(self.current.as_ref().map_or(0, |current| current.rowid))
+    }
+}
@@ -0,0 +1,264 @@
+//! select * from robotstxt_matches_batch(:robotstxt, :user_agent, :urls)
+//! where :urls is a JSON array of URLs, or one URL per line.
+
+use sqlite_loadable::prelude::*;
+use sqlite_loadable::{
+    api,
+    table::{BestIndexError, ConstraintOperator, IndexInfo, VTab, VTabArguments, VTabCursor},
+    Error, Result,
+};
+
+use crate::{
+    cache::{compiled_value, CompiledValue, SharedRobotsCache},
+    compiled::{get_path_params_query, CompiledRobots},
+    compiled_blob::CompiledRobotsView,
+    utils::RobotsUserAgentRuleType,
+};
+use std::{mem, os::raw::c_int, sync::Arc, time::Instant};
+
+static CREATE_SQL: &str = "CREATE TABLE x(url text, allowed int, matching_rule_line int, matching_rule_type text, robotstxt hidden, user_agent hidden, urls hidden)";
+enum Columns {
+    Url,
+    Allowed,
+    MatchingRuleLine,
+    MatchingRuleType,
+    Robotstxt,
+    UserAgent,
+    Urls,
+}
+fn column(index: i32) -> Option<Columns> {
+    match index {
+        0 => Some(Columns::Url),
+        1 => Some(Columns::Allowed),
+        2 => Some(Columns::MatchingRuleLine),
+        3 => Some(Columns::MatchingRuleType),
+        4 => Some(Columns::Robotstxt),
+        5 => Some(Columns::UserAgent),
+        6 => Some(Columns::Urls),
+        _ => None,
+    }
+}
+
+/// Splits the `urls` argument: a JSON array of strings, or one URL per line.
+fn parse_urls(urls: &str) -> Result<Vec<String>> {
+    if urls.trim_start().starts_with('[') {
+        return serde_json::from_str(urls)
+            .map_err(|e| Error::new_message(format!("urls is not a JSON array of strings: {}", e)));
+    }
+    Ok(urls
+        .lines()
+        .map(str::trim)
+        .filter(|url| !url.is_empty())
+        .map(str::to_owned)
+        .collect())
+}
+
+#[repr(C)]
+pub struct MatchesBatchTable {
+    base: sqlite3_vtab,
+    cache: SharedRobotsCache,
+}
+
+impl<'vtab> VTab<'vtab> for MatchesBatchTable {
+    type Aux = SharedRobotsCache;
+    type Cursor = MatchesBatchCursor;
+
+    fn connect(
+        _db: *mut sqlite3,
+        aux: Option<&Self::Aux>,
+        _args: VTabArguments,
+    ) -> Result<(String, MatchesBatchTable)> {
+        let base: sqlite3_vtab = unsafe { mem::zeroed() };
+        let cache = aux
+            .ok_or_else(|| Error::new_message("robotstxt_matches_batch requires a cache"))?
+            .clone();
+        let vtab = MatchesBatchTable { base, cache };
+        Ok((CREATE_SQL.to_owned(), vtab))
+    }
+    fn destroy(&self) -> Result<()> {
+        Ok(())
+    }
+
+    fn best_index(&self, mut info: IndexInfo) -> core::result::Result<(), BestIndexError> {
+        let (mut has_robotstxt, mut has_user_agent, mut has_urls) = (false, false, false);
+        for mut constraint in info.constraints() {
+            let (argv_index, seen) = match column(constraint.column_idx()) {
+                Some(Columns::Robotstxt) => (1, &mut has_robotstxt),
+                Some(Columns::UserAgent) => (2, &mut has_user_agent),
+                Some(Columns::Urls) => (3, &mut has_urls),
+                _ => continue,
+            };
+            if constraint.usable() && constraint.op() == Some(ConstraintOperator::EQ) {
+                constraint.set_omit(true);
+                constraint.set_argv_index(argv_index);
+                *seen = true;
+            } else {
+                return Err(BestIndexError::Constraint);
+            }
+        }
+        if !(has_robotstxt && has_user_agent && has_urls) {
+            return Err(BestIndexError::Error);
+        }
+        info.set_estimated_cost(100000.0);
+        info.set_estimated_rows(100000);
+        info.set_idxnum(1);
+
+        Ok(())
+    }
+
+    fn open(&mut self) -> Result<MatchesBatchCursor> {
+        Ok(MatchesBatchCursor::new(self.cache.clone()))
+    }
+}
+
+/// The rules the cursor matches URLs against.
+enum BatchRobots {
+    Parsed(Arc<CompiledRobots>),
+    /// A copy of a compiled BLOB, already validated, since SQLite values
+    /// only live until `filter()` returns. The buffer is reused across filters.
+    Blob(Vec<u8>),
+}
+
+/// The verdict for the cursor's current URL.
+struct CurrentMatch {
+    allowed: bool,
+    rule: Option<(u32, RobotsUserAgentRuleType)>,
+}
+
+#[repr(C)]
+pub struct MatchesBatchCursor {
+    /// Base class. Must be first
+    base: sqlite3_vtab_cursor,
+    cache: SharedRobotsCache,
+    rowid: i64,
+    robots: Option<BatchRobots>,
+    /// groups of `robots` that apply to the requested user-agent
+    groups: Vec<(usize, bool)>,
+    urls: Vec<String>,
+    current: Option<CurrentMatch>,
+}
+impl MatchesBatchCursor {
+    fn new(cache: SharedRobotsCache) -> MatchesBatchCursor {
+        let base: sqlite3_vtab_cursor = unsafe { mem::zeroed() };
+        MatchesBatchCursor {
+            base,
+            cache,
+            rowid: 0,
+            robots: None,
+            groups: vec![],
+            urls: vec![],
+            current: None,
+        }
+    }
+
+    fn evaluate_current(&mut self) {
+        self.current = self.evaluate(self.rowid as usize);
+    }
+
+    fn evaluate(&self, index: usize) -> Option<CurrentMatch> {
+        let url = self.urls.get(index)?;
+        let start = Instant::now();
+        let path = get_path_params_query(url);
+        let verdict = match self.robots.as_ref()? {
+            BatchRobots::Parsed(robots) => robots.verdict_for_groups(&self.groups, &path),
+            BatchRobots::Blob(blob) => CompiledRobotsView::from_validated(blob)
+                .ok()?
+                .verdict_for_groups(&self.groups, &path),
+        };
+        self.cache
+            .borrow_mut()
+            .stats
+            .record_matches(1, start.elapsed());
+        Some(CurrentMatch {
+            allowed: verdict.allowed,
+            rule: verdict.rule.map(|rule| {
+                let rule_type = if rule.allow {
+                    RobotsUserAgentRuleType::Allow
+                } else {
+                    RobotsUserAgentRuleType::Disallow
+                };
+                (rule.line_number, rule_type)
+            }),
+        })
+    }
+}
+
+impl VTabCursor for MatchesBatchCursor {
+    fn filter(
+        &mut self,
+        _idx_num: c_int,
+        _idx_str: Option<&str>,
+        values: &[*mut sqlite3_value],
+    ) -> Result<()> {
+        let robotstxt = values
+            .get(0)
+            .ok_or_else(|| Error::new_message("expected robotstxt argument"))?;
+        let user_agent = api::value_text(
+            values
+                .get(1)
+                .ok_or_else(|| Error::new_message("expected user_agent argument"))?,
+        )?;
+        let urls = api::value_text(
+            values
+                .get(2)
+                .ok_or_else(|| Error::new_message("expected urls argument"))?,
+        )?;
+        self.robots = match compiled_value(robotstxt, &self.cache)? {
+            CompiledValue::Parsed(robots) => {
+                self.groups = robots.applicable_groups(user_agent);
+                Some(BatchRobots::Parsed(robots))
+            }
+            CompiledValue::Blob(view) => {
+                self.groups = view.applicable_groups(user_agent);
+                let mut blob = match self.robots.take() {
+                    Some(BatchRobots::Blob(blob)) => blob,
+                    _ => vec![],
+                };
+                blob.clear();
+                blob.extend_from_slice(api::value_blob(robotstxt));
+                Some(BatchRobots::Blob(blob))
+            }
+        };
+        self.urls = parse_urls(urls)?;
+        self.rowid = 0;
+        self.evaluate_current();
+        Ok(())
+    }
+
+    fn next(&mut self) -> Result<()> {
+        self.rowid += 1;
+        self.evaluate_current();
+        Ok(())
+    }
+
+    fn eof(&self) -> bool {
+        self.current.is_none()
+    }
+
+    fn column(&self, context: *mut sqlite3_context, i: c_int) -> Result<()> {
+        let current = self.current.as_ref().unwrap();
+        match column(i) {
+            Some(Columns::Url) => {
+                api::result_text(context, self.urls[self.rowid as usize].as_str())?
+            }
+            Some(Columns::Allowed) => api::result_bool(context, current.allowed),
+            Some(Columns::MatchingRuleLine) => match &current.rule {
+                Some((line_number, _)) => api::result_int64(context, (*line_number).into()),
+                None => api::result_null(context),
+            },
+            Some(Columns::MatchingRuleType) => match &current.rule {
+                Some((_, RobotsUserAgentRuleType::Allow)) => api::result_text(context, "allow")?,
+                Some((_, RobotsUserAgentRuleType::Disallow)) => {
+                    api::result_text(context, "disallow")?
+                }
+                None => api::result_null(context),
+            },
+            _ => (),
+        }
+        Ok(())
+    }
+
+    fn rowid(&self) -> Result<i64> {
+        Ok(self.rowid)
+    }
+}
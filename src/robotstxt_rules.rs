@@ -3,21 +3,25 @@
 
 use sqlite_loadable::prelude::*;
 use sqlite_loadable::{
-    api,
+    api::{self, ValueType},
     table::{BestIndexError, ConstraintOperator, IndexInfo, VTab, VTabArguments, VTabCursor},
     Error, Result,
 };
 
-use crate::utils::{parse, RobotsInfo};
-use std::{mem, os::raw::c_int};
+use crate::cache::SharedRobotsCache;
+use crate::utils::{
+    range_in, RobotsLineKind, RobotsLines, RobotsLinesState, RobotsUserAgentRuleType,
+};
+use std::{borrow::Cow, mem, ops::Range, os::raw::c_int, time::Instant};
 static CREATE_SQL: &str =
-    "CREATE TABLE x(user_agent text, source int, rule_type text, path text, robotstxt hidden)";
+    "CREATE TABLE x(user_agent text, source int, rule_type text, path text, robotstxt hidden, agent hidden)";
 enum Columns {
     UserAgent,
     Source,
     RuleType,
     Path,
     Robotstxt,
+    Agent,
 }
 fn column(index: i32) -> Option<Columns> {
     match index {
@@ -26,26 +30,117 @@ fn column(index: i32) -> Option<Columns> {
         2 => Some(Columns::RuleType),
         3 => Some(Columns::Path),
         4 => Some(Columns::Robotstxt),
+        5 => Some(Columns::Agent),
         _ => None,
     }
 }
 
+const IDX_ROBOTSTXT: i32 = 1;
+const IDX_USER_AGENT_EQ: i32 = 2;
+const IDX_USER_AGENT_LIKE: i32 = 4;
+const IDX_RULE_TYPE_EQ: i32 = 8;
+const IDX_AGENT: i32 = 16;
+
+/// Typical number of rules in a robots.txt file, for query planning.
+const ESTIMATED_RULES: f64 = 1000.0;
+
+/// Case-insensitive SQL LIKE, where `%` matches any sequence of characters
+/// and `_` matches any single character.
+fn like_matches(pattern: &str, value: &str) -> bool {
+    let pattern: Vec<char> = pattern.chars().collect();
+    let value: Vec<char> = value.chars().collect();
+    let eq = |a: char, b: char| a == '_' || a.eq_ignore_ascii_case(&b);
+    // same backtracking approach as pattern_matches() in compiled.rs
+    let (mut p, mut v) = (0, 0);
+    let mut last_percent: Option<(usize, usize)> = None;
+    loop {
+        if p < pattern.len() && pattern[p] == '%' {
+            p += 1;
+            last_percent = Some((p, v));
+            continue;
+        }
+        if p == pattern.len() && v == value.len() {
+            return true;
+        }
+        if p < pattern.len() && v < value.len() && eq(pattern[p], value[v]) {
+            p += 1;
+            v += 1;
+            continue;
+        }
+        match last_percent {
+            Some((percent_p, percent_v)) if percent_v < value.len() => {
+                last_percent = Some((percent_p, percent_v + 1));
+                p = percent_p;
+                v = percent_v + 1;
+            }
+            _ => return false,
+        }
+    }
+}
+
+/// Constraints on `user_agent` and `rule_type`, checked while parsing.
+#[derive(Default)]
+struct RulesFilter {
+    /// Compared exactly, like SQL's `=`, which SQLite checks again
+    user_agent_eq: Option<String>,
+    user_agent_like: Option<String>,
+    rule_type: Option<String>,
+    /// The `agent` argument, compared case-insensitively as RFC 9309 requires
+    /// for user-agents
+    agent: Option<String>,
+    /// A NULL `agent` or `rule_type` argument, which no row equals
+    null: bool,
+}
+
+impl RulesFilter {
+    fn user_agent(&self, user_agent: &str) -> bool {
+        self.user_agent_eq
+            .as_ref()
+            .map_or(true, |eq| eq == user_agent)
+            && self
+                .agent
+                .as_ref()
+                .map_or(true, |agent| agent.eq_ignore_ascii_case(user_agent))
+            && self
+                .user_agent_like
+                .as_ref()
+                .map_or(true, |like| like_matches(like, user_agent))
+    }
+
+    fn rule_type(&self, rule_type: &RobotsUserAgentRuleType) -> bool {
+        self.rule_type
+            .as_ref()
+            .map_or(true, |expected| expected == rule_type_name(rule_type))
+    }
+}
+
+fn rule_type_name(rule_type: &RobotsUserAgentRuleType) -> &'static str {
+    match rule_type {
+        RobotsUserAgentRuleType::Allow => "allow",
+        RobotsUserAgentRuleType::Disallow => "disallow",
+    }
+}
+
 #[repr(C)]
 pub struct RulesTable {
     base: sqlite3_vtab,
+    cache: SharedRobotsCache,
 }
 
 impl<'vtab> VTab<'vtab> for RulesTable {
-    type Aux = ();
+    type Aux = SharedRobotsCache;
     type Cursor = RulesCursor;
 
     fn connect(
         _db: *mut sqlite3,
-        _aux: Option<&Self::Aux>,
+        aux: Option<&Self::Aux>,
         _args: VTabArguments,
     ) -> Result<(String, RulesTable)> {
         let base: sqlite3_vtab = unsafe { mem::zeroed() };
-        let vtab = RulesTable { base };
+        let cache = aux
+            .ok_or_else(|| Error::new_message("robotstxt_rules requires a cache"))?
+            .clone();
+        let vtab = RulesTable { base, cache };
         // TODO db.config(VTabConfig::Innocuous)?;
         Ok((CREATE_SQL.to_owned(), vtab))
     }
@@ -54,135 +149,273 @@ impl<'vtab> VTab<'vtab> for RulesTable {
     }
 
     fn best_index(&self, mut info: IndexInfo) -> core::result::Result<(), BestIndexError> {
-        let mut has_robotstxt = false;
-        for mut constraint in info.constraints() {
-            if let Some(Columns::Robotstxt) = column(constraint.column_idx()) {
-                if constraint.usable() && constraint.op() == Some(ConstraintOperator::EQ) {
-                    constraint.set_omit(true);
-                    constraint.set_argv_index(1);
-                    has_robotstxt = true;
-                } else {
-                    return Err(BestIndexError::Constraint);
+        let mut robotstxt = None;
+        let mut user_agent_eq = None;
+        let mut user_agent_like = None;
+        let mut rule_type_eq = None;
+        let mut agent = None;
+        for constraint in info.constraints() {
+            let usable = constraint.usable();
+            match (column(constraint.column_idx()), constraint.op()) {
+                (Some(Columns::Robotstxt), Some(ConstraintOperator::EQ)) if usable => {
+                    robotstxt = Some(constraint)
+                }
+                (Some(Columns::Robotstxt), _) => return Err(BestIndexError::Constraint),
+                (Some(Columns::Agent), Some(ConstraintOperator::EQ)) if usable => {
+                    agent = Some(constraint)
+                }
+                (Some(Columns::Agent), _) => return Err(BestIndexError::Constraint),
+                (Some(Columns::UserAgent), Some(ConstraintOperator::EQ))
+                    if usable && user_agent_eq.is_none() =>
+                {
+                    user_agent_eq = Some(constraint)
                 }
+                (Some(Columns::UserAgent), Some(ConstraintOperator::LIKE))
+                    if usable && user_agent_like.is_none() =>
+                {
+                    user_agent_like = Some(constraint)
+                }
+                (Some(Columns::RuleType), Some(ConstraintOperator::EQ))
+                    if usable && rule_type_eq.is_none() =>
+                {
+                    rule_type_eq = Some(constraint)
+                }
+                _ => (),
             }
         }
-        if !has_robotstxt {
-            return Err(BestIndexError::Error);
+        let mut robotstxt = robotstxt.ok_or(BestIndexError::Error)?;
+        robotstxt.set_omit(true);
+        robotstxt.set_argv_index(1);
+
+        // Filters are passed to xFilter after the robotstxt argument, in this
+        // order. They only skip rows SQLite would reject anyway, but `=` and
+        // LIKE on user_agent aren't omitted so that SQLite still applies the
+        // column's collation and PRAGMA case_sensitive_like. An IN list on
+        // user_agent is run by SQLite as one `=` lookup per value.
+        let mut idx_num = IDX_ROBOTSTXT;
+        let mut argv_index = 1;
+        let mut estimated_rows = ESTIMATED_RULES;
+        for (constraint, flag, omit, selectivity) in [
+            (user_agent_eq, IDX_USER_AGENT_EQ, false, 0.01),
+            (user_agent_like, IDX_USER_AGENT_LIKE, false, 0.1),
+            (rule_type_eq, IDX_RULE_TYPE_EQ, true, 0.5),
+            (agent, IDX_AGENT, true, 0.01),
+        ] {
+            if let Some(mut constraint) = constraint {
+                argv_index += 1;
+                constraint.set_argv_index(argv_index);
+                constraint.set_omit(omit);
+                idx_num |= flag;
+                estimated_rows *= selectivity;
+            }
         }
-        info.set_estimated_cost(100000.0);
-        info.set_estimated_rows(100000);
-        info.set_idxnum(1);
+        // every row costs a line of parsing, even those filtered out
+        info.set_estimated_cost(ESTIMATED_RULES + estimated_rows);
+        info.set_estimated_rows((estimated_rows as i64).max(1));
+        info.set_idxnum(idx_num);
 
         Ok(())
     }
 
     fn open(&mut self) -> Result<RulesCursor> {
-        Ok(RulesCursor::new())
+        Ok(RulesCursor::new(self.cache.clone()))
     }
 }
 
+/// The rule the cursor is currently on. Strings are byte ranges into the
+/// cursor's copy of the robots.txt text, unless the path had to be escaped.
+struct CurrentRule {
+    line_number: u32,
+    rule_type: RobotsUserAgentRuleType,
+    path: RulePath,
+}
+
+enum RulePath {
+    Borrowed(Range<usize>),
+    Escaped(String),
+}
+
 #[repr(C)]
 pub struct RulesCursor {
     /// Base class. Must be first
     base: sqlite3_vtab_cursor,
+    cache: SharedRobotsCache,
     rowid: i64,
-    useragent_rowid: usize,
-    rule_rowid: usize,
-    info: Option<RobotsInfo>,
+    robotstxt: String,
+    lines: RobotsLinesState,
+    filter: RulesFilter,
+    /// The `User-agent` values of the current group that pass `filter`,
+    /// which every rule of the group is listed under
+    group_user_agents: Vec<Range<usize>>,
+    /// Whether any `User-agent` line was seen, filtered out or not
+    in_group: bool,
+    /// Whether a rule was seen since the group's last `User-agent` line, so
+    /// the next `User-agent` line starts a new group
+    seen_separator: bool,
+    current: Option<CurrentRule>,
+    /// Index into `group_user_agents` for the current row
+    user_agent_index: usize,
 }
 impl RulesCursor {
-    fn new() -> RulesCursor {
+    fn new(cache: SharedRobotsCache) -> RulesCursor {
         let base: sqlite3_vtab_cursor = unsafe { mem::zeroed() };
         RulesCursor {
             base,
+            cache,
             rowid: 0,
-            useragent_rowid: 0,
-            rule_rowid: 0,
-            info: None,
+            robotstxt: String::new(),
+            lines: RobotsLinesState::default(),
+            filter: RulesFilter::default(),
+            group_user_agents: vec![],
+            in_group: false,
+            seen_separator: false,
+            current: None,
+            user_agent_index: 0,
+        }
+    }
+
+    /// Moves to the current rule's next user-agent, or else reads lines until
+    /// the next Allow/Disallow rule or the end of the file.
+    fn advance(&mut self) {
+        if self.current.is_some() && self.user_agent_index + 1 < self.group_user_agents.len() {
+            self.user_agent_index += 1;
+            return;
+        }
+        let source = self.robotstxt.as_str();
+        let mut lines = RobotsLines::resume(source, self.lines);
+        self.current = None;
+        self.user_agent_index = 0;
+        for line in lines.by_ref() {
+            let rule_type = match line.kind {
+                RobotsLineKind::UserAgent => {
+                    if self.seen_separator {
+                        self.group_user_agents.clear();
+                        self.seen_separator = false;
+                    }
+                    self.in_group = true;
+                    if self.filter.user_agent(&line.value) {
+                        self.group_user_agents.push(range_in(source, &line.value));
+                    }
+                    continue;
+                }
+                RobotsLineKind::Allow => RobotsUserAgentRuleType::Allow,
+                RobotsLineKind::Disallow => RobotsUserAgentRuleType::Disallow,
+                _ => continue,
+            };
+            // rules before the first User-agent line apply to no one
+            if !self.in_group {
+                continue;
+            }
+            self.seen_separator = true;
+            if self.group_user_agents.is_empty() || !self.filter.rule_type(&rule_type) {
+                continue;
+            }
+            let path = match line.value {
+                Cow::Borrowed(value) => RulePath::Borrowed(range_in(source, value)),
+                Cow::Owned(value) => RulePath::Escaped(value),
+            };
+            self.current = Some(CurrentRule {
+                line_number: line.line_number,
+                rule_type,
+                path,
+            });
+            break;
         }
+        self.lines = lines.state();
     }
 }
 
 impl VTabCursor for RulesCursor {
     fn filter(
         &mut self,
-        _idx_num: c_int,
+        idx_num: c_int,
         _idx_str: Option<&str>,
         values: &[*mut sqlite3_value],
     ) -> Result<()> {
-        let robotstxt = api::value_text(values.get(0).ok_or_else(|| Error::new_message("TODO"))?)
-            .map_err(|_| Error::new_message("TODO"))?;
-        let info = parse(robotstxt);
-        self.rowid = 0;
-        self.useragent_rowid = 0;
-        self.rule_rowid = 0;
-        while let Some(user_agent) = info.user_agents.get(self.useragent_rowid) {
-            if user_agent.rules.get(self.rule_rowid).is_none() {
-                self.useragent_rowid += 1;
-            } else {
-                break;
+        let start = Instant::now();
+        let robotstxt = api::value_blob(
+            values
+                .get(0)
+                .ok_or_else(|| Error::new_message("expected robotstxt argument"))?,
+        );
+        let mut arguments = values.iter().skip(1);
+        let mut null = false;
+        let mut next_argument = |flag: i32| -> Result<Option<String>> {
+            if idx_num & flag == 0 {
+                return Ok(None);
             }
+            let value = arguments
+                .next()
+                .ok_or_else(|| Error::new_message("missing robotstxt_rules constraint value"))?;
+            null |= api::value_type(value) == ValueType::Null;
+            Ok(Some(api::value_text(value)?.to_owned()))
+        };
+        let user_agent_eq = next_argument(IDX_USER_AGENT_EQ)?;
+        let user_agent_like = next_argument(IDX_USER_AGENT_LIKE)?;
+        let rule_type = next_argument(IDX_RULE_TYPE_EQ)?;
+        let agent = next_argument(IDX_AGENT)?;
+        self.filter = RulesFilter {
+            user_agent_eq,
+            user_agent_like,
+            rule_type,
+            agent,
+            null,
+        };
+        self.robotstxt.clear();
+        let limited = self.cache.borrow().limits.apply(robotstxt);
+        self.cache.borrow_mut().stats.record_limited(&limited);
+        self.robotstxt.push_str(&limited.text);
+        self.lines = RobotsLinesState::default();
+        self.group_user_agents.clear();
+        self.in_group = false;
+        self.seen_separator = false;
+        self.current = None;
+        self.rowid = 0;
+        if !self.filter.null {
+            self.advance();
         }
-        self.info = Some(info);
+        let parsed = self.robotstxt.len();
+        self.cache
+            .borrow_mut()
+            .stats
+            .record_parse(parsed, start.elapsed());
         Ok(())
     }
 
     fn next(&mut self) -> Result<()> {
         self.rowid += 1;
-        let info = self.info.as_ref().unwrap();
-        let user_agent = info.user_agents.get(self.useragent_rowid);
-        let user_agent = match user_agent {
-            None => return Ok(()),
-            Some(user_agent) => user_agent,
-        };
-        match user_agent.rules.get(self.rule_rowid + 1) {
-            Some(_) => {
-                self.rule_rowid += 1;
-            }
-            None => {
-                self.useragent_rowid += 1;
-                self.rule_rowid = 0;
-
-                // the next user agent may not have any rules defined - so find
-                // the next one that does
-                while let Some(user_agent) = info.user_agents.get(self.useragent_rowid) {
-                    if user_agent.rules.get(self.rule_rowid).is_none() {
-                        self.useragent_rowid += 1;
-                    } else {
-                        break;
-                    }
-                }
-            }
-        }
-
+        let start = Instant::now();
+        self.advance();
+        self.cache
+            .borrow_mut()
+            .stats
+            .record_parse_time(start.elapsed());
         Ok(())
     }
 
     fn eof(&self) -> bool {
-        return self
-            .info
-            .as_ref()
-            .unwrap()
-            .user_agents
-            .get(self.useragent_rowid)
-            .is_none();
+        self.current.is_none()
     }
 
     fn column(&self, context: *mut sqlite3_context, i: c_int) -> Result<()> {
-        let user_agents = &self.info.as_ref().unwrap().user_agents;
-        let info = user_agents.get(self.useragent_rowid).unwrap();
-        let rule = info.rules.get(self.rule_rowid).unwrap();
+        let rule = self.current.as_ref().unwrap();
         match column(i) {
-            //Some(Columns::Name) => api::result_text(context, current.name.clone())?,
-            Some(Columns::UserAgent) => api::result_text(context, info.name.as_str())?,
+            Some(Columns::UserAgent) => {
+                let user_agent = self.group_user_agents[self.user_agent_index].clone();
+                api::result_text(context, &self.robotstxt[user_agent])?
+            }
             Some(Columns::Source) => api::result_int64(context, rule.line_number.into()),
-            Some(Columns::RuleType) => match rule.rule_type {
-                crate::utils::RobotsUserAgentRuleType::Allow => api::result_text(context, "allow")?,
-                crate::utils::RobotsUserAgentRuleType::Disallow => {
-                    api::result_text(context, "disallow")?
+            Some(Columns::RuleType) => api::result_text(context, rule_type_name(&rule.rule_type))?,
+            Some(Columns::Path) => match &rule.path {
+                RulePath::Borrowed(range) => {
+                    api::result_text(context, &self.robotstxt[range.clone()])?
                 }
+                RulePath::Escaped(path) => api::result_text(context, path.as_str())?,
+            },
+            Some(Columns::Agent) => match &self.filter.agent {
+                Some(agent) => api::result_text(context, agent.as_str())?,
+                None => api::result_null(context),
             },
-            Some(Columns::Path) => api::result_text(context, rule.value.as_str())?,
             _ => (),
         }
         Ok(())
@@ -0,0 +1,199 @@
+//! select * from robotstxt_sitemaps(:robotstxt)
+//! Lists the Sitemap URLs of a robots.txt file.
+
+use sqlite_loadable::prelude::*;
+use sqlite_loadable::{
+    api,
+    table::{BestIndexError, ConstraintOperator, IndexInfo, VTab, VTabArguments, VTabCursor},
+    Error, Result,
+};
+
+use crate::cache::SharedRobotsCache;
+use crate::utils::{range_in, GroupLine, GroupLines, GroupLinesState, RobotsLineKind};
+use std::{mem, ops::Range, os::raw::c_int, time::Instant};
+
+static CREATE_SQL: &str = "CREATE TABLE x(url text, source int, group_index int, robotstxt hidden)";
+enum Columns {
+    Url,
+    Source,
+    GroupIndex,
+    Robotstxt,
+}
+fn column(index: i32) -> Option<Columns> {
+    match index {
+        0 => Some(Columns::Url),
+        1 => Some(Columns::Source),
+        2 => Some(Columns::GroupIndex),
+        3 => Some(Columns::Robotstxt),
+        _ => None,
+    }
+}
+
+#[repr(C)]
+pub struct SitemapsTable {
+    base: sqlite3_vtab,
+    cache: SharedRobotsCache,
+}
+
+impl<'vtab> VTab<'vtab> for SitemapsTable {
+    type Aux = SharedRobotsCache;
+    type Cursor = SitemapsCursor;
+
+    fn connect(
+        _db: *mut sqlite3,
+        aux: Option<&Self::Aux>,
+        _args: VTabArguments,
+    ) -> Result<(String, SitemapsTable)> {
+        let base: sqlite3_vtab = unsafe { mem::zeroed() };
+        let cache = aux
+            .ok_or_else(|| Error::new_message("robotstxt_sitemaps requires a cache"))?
+            .clone();
+        let vtab = SitemapsTable { base, cache };
+        Ok((CREATE_SQL.to_owned(), vtab))
+    }
+    fn destroy(&self) -> Result<()> {
+        Ok(())
+    }
+
+    fn best_index(&self, mut info: IndexInfo) -> core::result::Result<(), BestIndexError> {
+        let mut has_robotstxt = false;
+        for mut constraint in info.constraints() {
+            if let Some(Columns::Robotstxt) = column(constraint.column_idx()) {
+                if constraint.usable() && constraint.op() == Some(ConstraintOperator::EQ) {
+                    constraint.set_omit(true);
+                    constraint.set_argv_index(1);
+                    has_robotstxt = true;
+                } else {
+                    return Err(BestIndexError::Constraint);
+                }
+            }
+        }
+        if !has_robotstxt {
+            return Err(BestIndexError::Error);
+        }
+        info.set_estimated_cost(1000.0);
+        info.set_estimated_rows(10);
+        info.set_idxnum(1);
+
+        Ok(())
+    }
+
+    fn open(&mut self) -> Result<SitemapsCursor> {
+        Ok(SitemapsCursor::new(self.cache.clone()))
+    }
+}
+
+/// The Sitemap line the cursor is currently on.
+struct CurrentSitemap {
+    line_number: u32,
+    /// Byte range of the URL in the cursor's copy of the robots.txt text
+    url: Range<usize>,
+    group_index: Option<u32>,
+}
+
+#[repr(C)]
+pub struct SitemapsCursor {
+    /// Base class. Must be first
+    base: sqlite3_vtab_cursor,
+    cache: SharedRobotsCache,
+    rowid: i64,
+    robotstxt: String,
+    lines: GroupLinesState,
+    current: Option<CurrentSitemap>,
+}
+impl SitemapsCursor {
+    fn new(cache: SharedRobotsCache) -> SitemapsCursor {
+        let base: sqlite3_vtab_cursor = unsafe { mem::zeroed() };
+        SitemapsCursor {
+            base,
+            cache,
+            rowid: 0,
+            robotstxt: String::new(),
+            lines: GroupLinesState::default(),
+            current: None,
+        }
+    }
+
+    /// Reads lines until the next Sitemap line or the end of the file.
+    fn advance(&mut self) {
+        let source = self.robotstxt.as_str();
+        let mut lines = GroupLines::resume(source, self.lines);
+        self.current = None;
+        for GroupLine {
+            line, group_index, ..
+        } in lines.by_ref()
+        {
+            if line.kind == RobotsLineKind::Sitemap {
+                self.current = Some(CurrentSitemap {
+                    line_number: line.line_number,
+                    url: range_in(source, &line.value),
+                    group_index,
+                });
+                break;
+            }
+        }
+        self.lines = lines.state();
+    }
+}
+
+impl VTabCursor for SitemapsCursor {
+    fn filter(
+        &mut self,
+        _idx_num: c_int,
+        _idx_str: Option<&str>,
+        values: &[*mut sqlite3_value],
+    ) -> Result<()> {
+        let start = Instant::now();
+        let robotstxt = api::value_blob(
+            values
+                .get(0)
+                .ok_or_else(|| Error::new_message("expected robotstxt argument"))?,
+        );
+        self.robotstxt.clear();
+        let limited = self.cache.borrow().limits.apply(robotstxt);
+        self.cache.borrow_mut().stats.record_limited(&limited);
+        self.robotstxt.push_str(&limited.text);
+        self.lines = GroupLinesState::default();
+        self.rowid = 0;
+        self.advance();
+        let parsed = self.robotstxt.len();
+        self.cache
+            .borrow_mut()
+            .stats
+            .record_parse(parsed, start.elapsed());
+        Ok(())
+    }
+
+    fn next(&mut self) -> Result<()> {
+        self.rowid += 1;
+        let start = Instant::now();
+        self.advance();
+        self.cache
+            .borrow_mut()
+            .stats
+            .record_parse_time(start.elapsed());
+        Ok(())
+    }
+
+    fn eof(&self) -> bool {
+        self.current.is_none()
+    }
+
+    fn column(&self, context: *mut sqlite3_context, i: c_int) -> Result<()> {
+        let sitemap = self.current.as_ref().unwrap();
+        match column(i) {
+            Some(Columns::Url) => api::result_text(context, &self.robotstxt[sitemap.url.clone()])?,
+            Some(Columns::Source) => api::result_int64(context, sitemap.line_number.into()),
+            Some(Columns::GroupIndex) => match sitemap.group_index {
+                Some(index) => api::result_int64(context, index.into()),
+                None => api::result_null(context),
+            },
+            _ => (),
+        }
+        Ok(())
+    }
+
+    fn rowid(&self) -> Result<i64> {
+        Ok(self.rowid)
+    }
+}
@@ -0,0 +1,188 @@
+//! select name, value from robotstxt_stats()
+//!
+//! Per-connection counters of parsing and matching work, reset with
+//! robotstxt_stats_reset().
+
+use sqlite_loadable::prelude::*;
+use sqlite_loadable::{
+    api,
+    table::{BestIndexError, IndexInfo, VTab, VTabArguments, VTabCursor},
+    Error, Result,
+};
+
+use crate::{cache::SharedRobotsCache, limits::Limited};
+use std::{mem, os::raw::c_int, time::Duration};
+
+static CREATE_SQL: &str = "CREATE TABLE x(name text, value int)";
+enum Columns {
+    Name,
+    Value,
+}
+fn column(index: i32) -> Option<Columns> {
+    match index {
+        0 => Some(Columns::Name),
+        1 => Some(Columns::Value),
+        _ => None,
+    }
+}
+
+/// Counters of the work done by the scalar functions and table functions that
+/// share a connection's cache. Updating them is a few additions per call.
+#[derive(Debug, Clone, Copy, Default)]
+pub(crate) struct Stats {
+    /// robots.txt files parsed and compiled, which cache hits avoid
+    pub(crate) parses: u64,
+    pub(crate) bytes_parsed: u64,
+    pub(crate) parse_nanos: u64,
+    /// Size of the largest robots.txt file parsed, in bytes
+    pub(crate) largest_document: u64,
+    /// Files cut short by the connection's limits
+    pub(crate) truncated: u64,
+    /// Files ignored because they were HTML pages
+    pub(crate) html_rejected: u64,
+    /// (user-agent, URL) pairs matched
+    pub(crate) matches: u64,
+    pub(crate) match_nanos: u64,
+}
+
+impl Stats {
+    pub(crate) fn record_parse(&mut self, bytes: usize, elapsed: Duration) {
+        self.parses += 1;
+        self.bytes_parsed += bytes as u64;
+        self.parse_nanos += elapsed.as_nanos() as u64;
+        self.largest_document = self.largest_document.max(bytes as u64);
+    }
+
+    /// Adds time spent parsing a file already counted by `record_parse()`,
+    /// for table functions that parse as their rows are read.
+    pub(crate) fn record_parse_time(&mut self, elapsed: Duration) {
+        self.parse_nanos += elapsed.as_nanos() as u64;
+    }
+
+    pub(crate) fn record_limited(&mut self, limited: &Limited) {
+        self.truncated += limited.truncated as u64;
+        self.html_rejected += limited.html as u64;
+    }
+
+    pub(crate) fn record_matches(&mut self, count: usize, elapsed: Duration) {
+        self.matches += count as u64;
+        self.match_nanos += elapsed.as_nanos() as u64;
+    }
+}
+
+/// The rows of robotstxt_stats(), read from the connection's cache.
+fn stats_rows(cache: &SharedRobotsCache) -> Vec<(&'static str, i64)> {
+    let cache = cache.borrow();
+    let stats = &cache.stats;
+    vec![
+        ("parses", stats.parses as i64),
+        ("bytes_parsed", stats.bytes_parsed as i64),
+        ("parse_nanos", stats.parse_nanos as i64),
+        ("largest_document", stats.largest_document as i64),
+        ("truncated", stats.truncated as i64),
+        ("html_rejected", stats.html_rejected as i64),
+        ("matches", stats.matches as i64),
+        ("match_nanos", stats.match_nanos as i64),
+        ("cache_hits", cache.hits as i64),
+        ("cache_misses", cache.misses as i64),
+        ("cache_evictions", cache.evictions as i64),
+        ("cache_shared_hits", cache.shared_hits as i64),
+        ("cache_entries", cache.len() as i64),
+        ("cache_bytes", cache.bytes() as i64),
+    ]
+}
+
+#[repr(C)]
+pub struct StatsTable {
+    base: sqlite3_vtab,
+    cache: SharedRobotsCache,
+}
+
+impl<'vtab> VTab<'vtab> for StatsTable {
+    type Aux = SharedRobotsCache;
+    type Cursor = StatsCursor;
+
+    fn connect(
+        _db: *mut sqlite3,
+        aux: Option<&Self::Aux>,
+        _args: VTabArguments,
+    ) -> Result<(String, StatsTable)> {
+        let base: sqlite3_vtab = unsafe { mem::zeroed() };
+        let cache = aux
+            .ok_or_else(|| Error::new_message("robotstxt_stats requires a cache"))?
+            .clone();
+        let vtab = StatsTable { base, cache };
+        Ok((CREATE_SQL.to_owned(), vtab))
+    }
+    fn destroy(&self) -> Result<()> {
+        Ok(())
+    }
+
+    fn best_index(&self, mut info: IndexInfo) -> core::result::Result<(), BestIndexError> {
+        info.set_estimated_cost(10.0);
+        info.set_estimated_rows(14);
+        info.set_idxnum(1);
+        Ok(())
+    }
+
+    fn open(&mut self) -> Result<StatsCursor> {
+        Ok(StatsCursor::new(self.cache.clone()))
+    }
+}
+
+#[repr(C)]
+pub struct StatsCursor {
+    /// Base class. Must be first
+    base: sqlite3_vtab_cursor,
+    cache: SharedRobotsCache,
+    rowid: i64,
+    rows: Vec<(&'static str, i64)>,
+}
+impl StatsCursor {
+    fn new(cache: SharedRobotsCache) -> StatsCursor {
+        let base: sqlite3_vtab_cursor = unsafe { mem::zeroed() };
+        StatsCursor {
+            base,
+            cache,
+            rowid: 0,
+            rows: vec![],
+        }
+    }
+}
+
+impl VTabCursor for StatsCursor {
+    fn filter(
+        &mut self,
+        _idx_num: c_int,
+        _idx_str: Option<&str>,
+        _values: &[*mut sqlite3_value],
+    ) -> Result<()> {
+        // a snapshot, so the counters don't move while the rows are read
+        self.rows = stats_rows(&self.cache);
+        self.rowid = 0;
+        Ok(())
+    }
+
+    fn next(&mut self) -> Result<()> {
+        self.rowid += 1;
+        Ok(())
+    }
+
+    fn eof(&self) -> bool {
+        self.rowid as usize >= self.rows.len()
+    }
+
+    fn column(&self, context: *mut sqlite3_context, i: c_int) -> Result<()> {
+        let (name, value) = self.rows[self.rowid as usize];
+        match column(i) {
+            Some(Columns::Name) => api::result_text(context, name)?,
+            Some(Columns::Value) => api::result_int64(context, value),
+            _ => (),
+        }
+        Ok(())
+    }
+
+    fn rowid(&self) -> Result<i64> {
+        Ok(self.rowid)
+    }
+}
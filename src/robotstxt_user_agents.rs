@@ -3,13 +3,15 @@
 
 use sqlite_loadable::prelude::*;
 use sqlite_loadable::{
-    api,
+    api::{self, ValueType},
     table::{BestIndexError, ConstraintOperator, IndexInfo, VTab, VTabArguments, VTabCursor},
     Error, Result,
 };
 
-use crate::utils::{parse, RobotsInfo};
-use std::{mem, os::raw::c_int};
+use crate::cache::SharedRobotsCache;
+use crate::utils::{parse, RobotsInfo, RobotsUserAgentRuleType};
+use serde_json::json;
+use std::{mem, os::raw::c_int, time::Instant};
 static CREATE_SQL: &str = "CREATE TABLE x(name text, source int, rules, robotstxt hidden)";
 enum Columns {
     Name,
@@ -30,19 +32,23 @@ fn column(index: i32) -> Option<Columns> {
 #[repr(C)]
 pub struct UserAgentsTable {
     base: sqlite3_vtab,
+    cache: SharedRobotsCache,
 }
 
 impl<'vtab> VTab<'vtab> for UserAgentsTable {
-    type Aux = ();
+    type Aux = SharedRobotsCache;
     type Cursor = UserAgentsCursor;
 
     fn connect(
         _db: *mut sqlite3,
-        _aux: Option<&Self::Aux>,
+        aux: Option<&Self::Aux>,
         _args: VTabArguments,
     ) -> Result<(String, UserAgentsTable)> {
         let base: sqlite3_vtab = unsafe { mem::zeroed() };
-        let vtab = UserAgentsTable { base };
+        let cache = aux
+            .ok_or_else(|| Error::new_message("robotstxt_user_agents requires a cache"))?
+            .clone();
+        let vtab = UserAgentsTable { base, cache };
         // TODO db.config(VTabConfig::Innocuous)?;
         Ok((CREATE_SQL.to_owned(), vtab))
     }
@@ -74,25 +80,34 @@ impl<'vtab> VTab<'vtab> for UserAgentsTable {
     }
 
     fn open(&mut self) -> Result<UserAgentsCursor> {
-        Ok(UserAgentsCursor::new())
+        Ok(UserAgentsCursor::new(self.cache.clone()))
     }
 }
 
+/// The robotstxt argument as it was passed, for the hidden column.
+enum Argument {
+    Null,
+    Text(String),
+    Blob(Vec<u8>),
+}
+
 #[repr(C)]
 pub struct UserAgentsCursor {
     /// Base class. Must be first
     base: sqlite3_vtab_cursor,
+    cache: SharedRobotsCache,
     rowid: i64,
-    robotstxt: String,
+    robotstxt: Argument,
     info: Option<RobotsInfo>,
 }
 impl UserAgentsCursor {
-    fn new() -> UserAgentsCursor {
+    fn new(cache: SharedRobotsCache) -> UserAgentsCursor {
         let base: sqlite3_vtab_cursor = unsafe { mem::zeroed() };
         UserAgentsCursor {
             base,
+            cache,
             rowid: 0,
-            robotstxt: String::new(),
+            robotstxt: Argument::Null,
             info: None,
         }
     }
@@ -105,10 +120,25 @@ impl VTabCursor for UserAgentsCursor {
         _idx_str: Option<&str>,
         values: &[*mut sqlite3_value],
     ) -> Result<()> {
-        let robotstxt = api::value_text(values.get(0).ok_or_else(|| Error::new_message("TODO"))?)
-            .map_err(|_| Error::new_message("TODO"))?;
-        self.robotstxt = robotstxt.to_owned();
-        self.info = Some(parse(robotstxt));
+        let value = values
+            .get(0)
+            .ok_or_else(|| Error::new_message("expected robotstxt argument"))?;
+        let robotstxt = api::value_blob(value);
+        let start = Instant::now();
+        let limited = self.cache.borrow().limits.apply(robotstxt);
+        self.info = Some(parse(&limited.text));
+        let mut cache = self.cache.borrow_mut();
+        cache.stats.record_limited(&limited);
+        cache
+            .stats
+            .record_parse(limited.text.len(), start.elapsed());
+        drop(cache);
+        // the hidden column returns the argument itself, not the limited text
+        self.robotstxt = match api::value_type(value) {
+            ValueType::Null => Argument::Null,
+            ValueType::Blob => Argument::Blob(robotstxt.to_vec()),
+            _ => Argument::Text(String::from_utf8_lossy(robotstxt).into_owned()),
+        };
         self.rowid = 0;
         Ok(())
     }
@@ -128,7 +158,28 @@ impl VTabCursor for UserAgentsCursor {
         match column(i) {
             Some(Columns::Name) => api::result_text(context, current.name.clone())?,
             Some(Columns::Source) => api::result_int64(context, current.line_number.into()),
-            Some(Columns::Robotstxt) => api::result_text(context, self.robotstxt.as_str())?,
+            Some(Columns::Rules) => api::result_json(
+                context,
+                current
+                    .rules
+                    .iter()
+                    .map(|rule| {
+                        json!({
+                            "source": rule.line_number,
+                            "rule_type": match rule.rule_type {
+                                RobotsUserAgentRuleType::Allow => "allow",
+                                RobotsUserAgentRuleType::Disallow => "disallow",
+                            },
+                            "path": rule.value,
+                        })
+                    })
+                    .collect(),
+            )?,
+            Some(Columns::Robotstxt) => match &self.robotstxt {
+                Argument::Null => api::result_null(context),
+                Argument::Text(text) => api::result_text(context, text.as_str())?,
+                Argument::Blob(blob) => api::result_blob(context, blob.as_slice()),
+            },
             _ => (),
         }
         Ok(())
@@ -0,0 +1,226 @@
+//! An optional process-wide cache of compiled robots.txt files, shared by
+//! every connection that loads the extension.
+//!
+//! Each connection keeps its own `RobotsCache`. When this cache is enabled
+//! with robotstxt_shared_cache_configure(), a miss in a connection's cache
+//! checks here before parsing, so a server opening many connections, like
+//! Datasette, parses a popular robots.txt file once per process. The cache
+//! is split into shards, each behind its own lock, and files are compiled
+//! outside of any lock.
+
+use std::{
+    collections::{BTreeMap, HashMap},
+    sync::{
+        atomic::{AtomicU64, AtomicUsize, Ordering},
+        Arc, Mutex, MutexGuard, OnceLock,
+    },
+};
+
+use crate::{cache::CacheKey, compiled::CompiledRobots};
+
+const SHARDS: usize = 16;
+
+struct SharedEntry {
+    /// The text `robots` was compiled from, to tell apart texts with the
+    /// same key
+    source: Box<str>,
+    robots: Arc<CompiledRobots>,
+    /// `source.len()` plus `robots.size_bytes()`, as of `trie_bytes`
+    size: usize,
+    /// `robots.trie_bytes()` when `size` was last updated
+    trie_bytes: usize,
+    last_used: u64,
+}
+
+/// One lock's worth of the cache, an LRU like `RobotsCache` with a
+/// `1/SHARDS` share of the budgets.
+#[derive(Default)]
+struct Shard {
+    entries: HashMap<CacheKey, SharedEntry>,
+    /// `last_used` tick -> key, oldest first
+    recency: BTreeMap<u64, CacheKey>,
+    bytes: usize,
+}
+
+impl Shard {
+    fn get_mut(&mut self, key: &CacheKey, source: &str) -> Option<&mut SharedEntry> {
+        self.entries
+            .get_mut(key)
+            .filter(|entry| *entry.source == *source)
+    }
+
+    /// Evicts least recently used entries until the shard fits its budgets,
+    /// returning how many were evicted.
+    fn evict(&mut self, max_entries: usize, max_bytes: usize) -> u64 {
+        let mut evicted = 0;
+        while self.entries.len() > max_entries || self.bytes > max_bytes {
+            let oldest = match self.recency.keys().next() {
+                Some(tick) => *tick,
+                None => break,
+            };
+            let key = self.recency.remove(&oldest).unwrap();
+            if let Some(entry) = self.entries.remove(&key) {
+                self.bytes -= entry.size;
+                evicted += 1;
+            }
+        }
+        evicted
+    }
+}
+
+/// The process-wide cache. It starts out disabled, with both budgets at 0.
+pub(crate) struct SharedCache {
+    shards: Vec<Mutex<Shard>>,
+    tick: AtomicU64,
+    max_entries: AtomicUsize,
+    max_bytes: AtomicUsize,
+    hits: AtomicU64,
+    misses: AtomicU64,
+    evictions: AtomicU64,
+}
+
+/// A snapshot of the shared cache's size and counters.
+#[derive(Debug, Clone, Copy)]
+pub(crate) struct SharedCacheStats {
+    pub(crate) entries: usize,
+    pub(crate) bytes: usize,
+    pub(crate) max_entries: usize,
+    pub(crate) max_bytes: usize,
+    pub(crate) hits: u64,
+    pub(crate) misses: u64,
+    pub(crate) evictions: u64,
+}
+
+static SHARED_CACHE: OnceLock<SharedCache> = OnceLock::new();
+
+/// The cache shared by every connection in the process.
+pub(crate) fn shared_cache() -> &'static SharedCache {
+    SHARED_CACHE.get_or_init(|| SharedCache {
+        shards: (0..SHARDS).map(|_| Mutex::default()).collect(),
+        tick: AtomicU64::new(0),
+        max_entries: AtomicUsize::new(0),
+        max_bytes: AtomicUsize::new(0),
+        hits: AtomicU64::new(0),
+        misses: AtomicU64::new(0),
+        evictions: AtomicU64::new(0),
+    })
+}
+
+impl SharedCache {
+    pub(crate) fn enabled(&self) -> bool {
+        self.max_entries.load(Ordering::Relaxed) > 0 && self.max_bytes.load(Ordering::Relaxed) > 0
+    }
+
+    /// The budgets of a single shard, the process-wide budgets split evenly.
+    fn shard_budgets(&self) -> (usize, usize) {
+        let max_entries = self.max_entries.load(Ordering::Relaxed);
+        let max_bytes = self.max_bytes.load(Ordering::Relaxed);
+        (max_entries.div_ceil(SHARDS), max_bytes.div_ceil(SHARDS))
+    }
+
+    fn shard(&self, key: &CacheKey) -> MutexGuard<'_, Shard> {
+        let shard = &self.shards[key.hash() as usize % SHARDS];
+        // a panic while holding the lock leaves the shard consistent enough
+        // to keep using, at worst with a wrong byte count
+        shard.lock().unwrap_or_else(|poisoned| poisoned.into_inner())
+    }
+
+    /// Returns the compiled form of `source`, whose key is `key`, or
+    /// `compile()`s it and caches the result. Concurrent misses for the same
+    /// file may both compile it, but only the first result is kept and
+    /// returned.
+    ///
+    /// Returns whether the file was found in the cache, too.
+    pub(crate) fn get_or_insert_with(
+        &self,
+        key: CacheKey,
+        source: &str,
+        compile: impl FnOnce() -> CompiledRobots,
+    ) -> (Arc<CompiledRobots>, bool) {
+        let tick = self.tick.fetch_add(1, Ordering::Relaxed) + 1;
+        {
+            let mut shard = self.shard(&key);
+            if let Some(entry) = shard.get_mut(&key, source) {
+                let robots = entry.robots.clone();
+                let last_used = std::mem::replace(&mut entry.last_used, tick);
+                // tries built since the last lookup count against the budget too
+                let trie_bytes = robots.trie_bytes();
+                let old_trie_bytes = std::mem::replace(&mut entry.trie_bytes, trie_bytes);
+                entry.size = entry.size - old_trie_bytes + trie_bytes;
+                shard.bytes = shard.bytes - old_trie_bytes + trie_bytes;
+                shard.recency.remove(&last_used);
+                shard.recency.insert(tick, key);
+                if trie_bytes != old_trie_bytes {
+                    let (max_entries, max_bytes) = self.shard_budgets();
+                    let evicted = shard.evict(max_entries, max_bytes);
+                    self.evictions.fetch_add(evicted, Ordering::Relaxed);
+                }
+                self.hits.fetch_add(1, Ordering::Relaxed);
+                return (robots, true);
+            }
+        }
+
+        self.misses.fetch_add(1, Ordering::Relaxed);
+        let robots = Arc::new(compile());
+        let trie_bytes = robots.trie_bytes();
+        let size = source.len() + robots.rules_size_bytes() + trie_bytes;
+        let (max_entries, max_bytes) = self.shard_budgets();
+        if max_entries == 0 || size > max_bytes {
+            return (robots, false);
+        }
+        let mut shard = self.shard(&key);
+        if let Some(entry) = shard.get_mut(&key, source) {
+            // another connection compiled the same file in the meantime
+            return (entry.robots.clone(), false);
+        }
+        let replaced = shard.entries.insert(
+            key,
+            SharedEntry {
+                source: source.into(),
+                robots: robots.clone(),
+                size,
+                trie_bytes,
+                last_used: tick,
+            },
+        );
+        // a different text with the same key
+        if let Some(replaced) = replaced {
+            shard.recency.remove(&replaced.last_used);
+            shard.bytes -= replaced.size;
+        }
+        shard.recency.insert(tick, key);
+        shard.bytes += size;
+        let evicted = shard.evict(max_entries, max_bytes);
+        self.evictions.fetch_add(evicted, Ordering::Relaxed);
+        (robots, false)
+    }
+
+    /// Changes the process-wide budgets, evicting entries that no longer fit.
+    /// Budgets of 0 disable the cache and empty it.
+    pub(crate) fn resize(&self, max_entries: usize, max_bytes: usize) {
+        self.max_entries.store(max_entries, Ordering::Relaxed);
+        self.max_bytes.store(max_bytes, Ordering::Relaxed);
+        let (max_entries, max_bytes) = self.shard_budgets();
+        for shard in &self.shards {
+            let mut shard = shard.lock().unwrap_or_else(|poisoned| poisoned.into_inner());
+            let evicted = shard.evict(max_entries, max_bytes);
+            self.evictions.fetch_add(evicted, Ordering::Relaxed);
+        }
+    }
+
+    pub(crate) fn stats(&self) -> SharedCacheStats {
+        let (entries, bytes) = self.shards.iter().fold((0, 0), |(entries, bytes), shard| {
+            let shard = shard.lock().unwrap_or_else(|poisoned| poisoned.into_inner());
+            (entries + shard.entries.len(), bytes + shard.bytes)
+        });
+        SharedCacheStats {
+            entries,
+            bytes,
+            max_entries: self.max_entries.load(Ordering::Relaxed),
+            max_bytes: self.max_bytes.load(Ordering::Relaxed),
+            hits: self.hits.load(Ordering::Relaxed),
+            misses: self.misses.load(Ordering::Relaxed),
+            evictions: self.evictions.load(Ordering::Relaxed),
+        }
+    }
+}
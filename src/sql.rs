@@ -0,0 +1,139 @@
+//! A minimal prepared statement wrapper, for virtual tables that keep their
+//! data in shadow tables.
+
+use sqlite_loadable::ext::{
+    sqlite3ext_bind_blob, sqlite3ext_bind_int64, sqlite3ext_bind_text, sqlite3ext_column_blob,
+    sqlite3ext_column_bytes, sqlite3ext_column_int64, sqlite3ext_column_text,
+    sqlite3ext_finalize, sqlite3ext_prepare_v2, sqlite3ext_step, sqlite3_stmt,
+};
+use sqlite_loadable::prelude::*;
+use sqlite_loadable::{Error, Result};
+use std::{
+    ffi::CString,
+    os::raw::{c_char, c_void},
+    ptr,
+};
+
+const SQLITE_OK: i32 = 0;
+const SQLITE_ROW: i32 = 100;
+const SQLITE_DONE: i32 = 101;
+
+pub(crate) struct Statement {
+    stmt: *mut sqlite3_stmt,
+    sql: String,
+}
+
+impl Statement {
+    pub(crate) fn prepare(db: *mut sqlite3, sql: &str) -> Result<Statement> {
+        let c_sql = CString::new(sql)?;
+        let mut stmt: *mut sqlite3_stmt = ptr::null_mut();
+        let rc = unsafe { sqlite3ext_prepare_v2(db, c_sql.as_ptr(), -1, &mut stmt, ptr::null_mut()) };
+        if rc != SQLITE_OK || stmt.is_null() {
+            return Err(Error::new_message(format!(
+                "error preparing `{}`: code {}",
+                sql, rc
+            )));
+        }
+        Ok(Statement {
+            stmt,
+            sql: sql.to_owned(),
+        })
+    }
+
+    fn check_bind(&self, rc: i32) -> Result<()> {
+        if rc != SQLITE_OK {
+            return Err(Error::new_message(format!(
+                "error binding parameter of `{}`: code {}",
+                self.sql, rc
+            )));
+        }
+        Ok(())
+    }
+
+    pub(crate) fn bind_text(&mut self, position: i32, text: &str) -> Result<()> {
+        let rc = unsafe {
+            sqlite3ext_bind_text(
+                self.stmt,
+                position,
+                text.as_ptr() as *const c_char,
+                text.len() as i32,
+            )
+        };
+        self.check_bind(rc)
+    }
+
+    pub(crate) fn bind_blob(&mut self, position: i32, blob: &[u8]) -> Result<()> {
+        let rc = unsafe {
+            sqlite3ext_bind_blob(
+                self.stmt,
+                position,
+                blob.as_ptr() as *const c_void,
+                blob.len() as i32,
+            )
+        };
+        self.check_bind(rc)
+    }
+
+    pub(crate) fn bind_int64(&mut self, position: i32, value: i64) -> Result<()> {
+        let rc = unsafe { sqlite3ext_bind_int64(self.stmt, position, value) };
+        self.check_bind(rc)
+    }
+
+    /// Steps to the next row, returning false once the statement is done.
+    pub(crate) fn step(&mut self) -> Result<bool> {
+        match unsafe { sqlite3ext_step(self.stmt) } {
+            SQLITE_ROW => Ok(true),
+            SQLITE_DONE => Ok(false),
+            rc => Err(Error::new_message(format!(
+                "error running `{}`: code {}",
+                self.sql, rc
+            ))),
+        }
+    }
+
+    /// Runs a statement that returns no rows.
+    pub(crate) fn execute(&mut self) -> Result<()> {
+        while self.step()? {}
+        Ok(())
+    }
+
+    pub(crate) fn column_int64(&self, column: i32) -> i64 {
+        unsafe { sqlite3ext_column_int64(self.stmt, column) }
+    }
+
+    pub(crate) fn column_blob(&self, column: i32) -> &[u8] {
+        unsafe {
+            let blob = sqlite3ext_column_blob(self.stmt, column) as *const u8;
+            let len = sqlite3ext_column_bytes(self.stmt, column) as usize;
+            if blob.is_null() {
+                &[]
+            } else {
+                std::slice::from_raw_parts(blob, len)
+            }
+        }
+    }
+
+    pub(crate) fn column_text(&self, column: i32) -> Result<&str> {
+        unsafe {
+            let text = sqlite3ext_column_text(self.stmt, column);
+            let len = sqlite3ext_column_bytes(self.stmt, column) as usize;
+            if text.is_null() {
+                return Ok("");
+            }
+            Ok(std::str::from_utf8(std::slice::from_raw_parts(text, len))?)
+        }
+    }
+}
+
+impl Drop for Statement {
+    fn drop(&mut self) {
+        unsafe {
+            sqlite3ext_finalize(self.stmt);
+        }
+    }
+}
+
+/// Runs `sql`, which must not return rows.
+pub(crate) fn execute(db: *mut sqlite3, sql: &str) -> Result<()> {
+    Statement::prepare(db, sql)?.execute()
+}
@@ -0,0 +1,224 @@
+//! A matcher for the rules that apply to one user-agent, where literal
+//! prefix patterns are stored in a byte trie so a path is matched against all
+//! of them in a single walk. Patterns with a `*` wildcard or a trailing `$`
+//! anchor are kept aside and checked one by one, like `evaluate()` does.
+
+use crate::compiled::{pattern_matches, RuleRef};
+
+const ENDS_ALLOW: u8 = 1;
+const ENDS_DISALLOW: u8 = 2;
+
+#[derive(Debug, Clone, Default)]
+struct TrieNode {
+    /// Children sorted by byte, for binary search
+    children: Vec<(u8, u32)>,
+    /// Which rule types have a pattern ending at this node
+    ends: u8,
+}
+
+#[derive(Debug, Clone)]
+struct OtherRule {
+    allow: bool,
+    pattern: Vec<u8>,
+    wildcard: bool,
+}
+
+/// The Allow/Disallow rules that apply to one user-agent, indexed for
+/// matching many paths.
+#[derive(Debug, Clone)]
+pub(crate) struct RuleTrie {
+    nodes: Vec<TrieNode>,
+    others: Vec<OtherRule>,
+}
+
+impl RuleTrie {
+    /// Indexes `rules`, which should be the rules of every group that names
+    /// the user-agent, or of the `*` groups when none does.
+    pub(crate) fn new<'a, I>(rules: I) -> RuleTrie
+    where
+        I: IntoIterator<Item = RuleRef<'a>>,
+    {
+        let mut trie = RuleTrie {
+            nodes: vec![TrieNode::default()],
+            others: vec![],
+        };
+        for rule in rules {
+            if rule.wildcard || rule.pattern.last() == Some(&b'$') {
+                trie.others.push(OtherRule {
+                    allow: rule.allow,
+                    pattern: rule.pattern.to_vec(),
+                    wildcard: rule.wildcard,
+                });
+                continue;
+            }
+            let mut node = 0;
+            for byte in rule.pattern {
+                node = trie.child_or_insert(node, *byte);
+            }
+            trie.nodes[node].ends |= if rule.allow {
+                ENDS_ALLOW
+            } else {
+                ENDS_DISALLOW
+            };
+        }
+        trie
+    }
+
+    /// Indexes the rules that decide for a user-agent, given the groups that
+    /// apply to it and whether each names it specifically. As in `evaluate()`,
+    /// specific groups replace the `*` groups entirely.
+    pub(crate) fn for_groups<'a, G, R>(groups: G) -> RuleTrie
+    where
+        G: IntoIterator<Item = (bool, R)>,
+        R: IntoIterator<Item = RuleRef<'a>>,
+    {
+        let groups: Vec<(bool, R)> = groups.into_iter().collect();
+        let any_specific = groups.iter().any(|(specific, _)| *specific);
+        RuleTrie::new(
+            groups
+                .into_iter()
+                .filter(|(specific, _)| *specific || !any_specific)
+                .flat_map(|(_, rules)| rules),
+        )
+    }
+
+    fn child(&self, node: usize, byte: u8) -> Option<usize> {
+        let children = &self.nodes[node].children;
+        children
+            .binary_search_by_key(&byte, |(b, _)| *b)
+            .ok()
+            .map(|i| children[i].1 as usize)
+    }
+
+    fn child_or_insert(&mut self, node: usize, byte: u8) -> usize {
+        match self.nodes[node]
+            .children
+            .binary_search_by_key(&byte, |(b, _)| *b)
+        {
+            Ok(i) => self.nodes[node].children[i].1 as usize,
+            Err(i) => {
+                let child = self.nodes.len();
+                self.nodes.push(TrieNode::default());
+                self.nodes[node].children.insert(i, (byte, child as u32));
+                child
+            }
+        }
+    }
+
+    /// Approximate heap footprint, counted in the caches' byte budgets.
+    pub(crate) fn size_bytes(&self) -> usize {
+        let mut size = std::mem::size_of::<RuleTrie>()
+            + self.nodes.capacity() * std::mem::size_of::<TrieNode>()
+            + self.others.capacity() * std::mem::size_of::<OtherRule>();
+        for node in &self.nodes {
+            size += node.children.capacity() * std::mem::size_of::<(u8, u32)>();
+        }
+        for rule in &self.others {
+            size += rule.pattern.capacity();
+        }
+        size
+    }
+
+    /// The lengths of the longest matching Allow and Disallow patterns, or
+    /// -1 when none matches. Lengths are the rules' match priorities.
+    pub(crate) fn priorities(&self, path: &[u8]) -> (i64, i64) {
+        let (mut allow, mut disallow) = (-1, -1);
+        let mut node = 0;
+        let mut depth = 0;
+        loop {
+            let ends = self.nodes[node].ends;
+            if ends & ENDS_ALLOW != 0 {
+                allow = depth;
+            }
+            if ends & ENDS_DISALLOW != 0 {
+                disallow = depth;
+            }
+            match path.get(depth as usize).and_then(|byte| self.child(node, *byte)) {
+                Some(child) => {
+                    node = child;
+                    depth += 1;
+                }
+                None => break,
+            }
+        }
+        for rule in &self.others {
+            let priority = if rule.allow { &mut allow } else { &mut disallow };
+            if rule.pattern.len() as i64 > *priority
+                && pattern_matches(path, &rule.pattern, rule.wildcard)
+            {
+                *priority = rule.pattern.len() as i64;
+            }
+        }
+        (allow, disallow)
+    }
+
+    /// Same outcome as `evaluate()` over the groups the rules came from.
+    pub(crate) fn allowed(&self, path: &str) -> bool {
+        let (allow, disallow) = self.priorities(path.as_bytes());
+        // an empty pattern alone, with priority 0, doesn't decide anything
+        allow <= 0 && disallow <= 0 || allow >= disallow
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use crate::{
+        compiled::tests::assert_matches_reference,
+        compiled_blob::{self, CompiledRobotsView},
+    };
+
+    // tries normally only match files with TRIE_MIN_RULES rules or more, so
+    // these build them directly for every example file
+
+    #[test]
+    fn trie_matches_default_matcher() {
+        assert_matches_reference(|robots, agent, path| robots.rule_trie(agent).allowed(path));
+    }
+
+    #[test]
+    fn blob_trie_matches_default_matcher() {
+        assert_matches_reference(|robots, agent, path| {
+            let blob = compiled_blob::encode(robots);
+            let view = CompiledRobotsView::new(&blob).unwrap();
+            view.rule_trie(agent).allowed(path)
+        });
+    }
+
+    #[test]
+    fn trie_bytes_are_counted() {
+        let robots = crate::compiled::CompiledRobots::compile(
+            "User-agent: *\nDisallow: /a\nAllow: /a/b\nDisallow: /*.x$\n",
+        );
+        let before = robots.size_bytes();
+        assert_eq!(robots.trie_bytes(), 0);
+        let trie = robots.rule_trie("FooBot");
+        assert!(robots.trie_bytes() >= trie.size_bytes());
+        assert_eq!(robots.size_bytes(), before + robots.trie_bytes());
+        // user-agents are looked up case-insensitively
+        assert!(std::sync::Arc::ptr_eq(&trie, &robots.rule_trie("foobot")));
+        assert_eq!(robots.size_bytes(), before + robots.trie_bytes());
+    }
+
+    #[test]
+    fn large_blobs_match_through_tries() {
+        let mut source = String::from("User-agent: *\n");
+        for i in 0..crate::compiled::TRIE_MIN_RULES {
+            source.push_str(&format!("Disallow: /{}/\nAllow: /{}/public\n", i, i));
+        }
+        let robots = crate::compiled::CompiledRobots::compile(&source);
+        let blob = compiled_blob::encode(&robots);
+        let view = CompiledRobotsView::new(&blob).unwrap();
+        assert_eq!(view.rule_count(), robots.rule_count());
+
+        let tries = crate::compiled::AgentTries::default();
+        for path in ["/", "/3/", "/3/public", "/255/x", "/256/"] {
+            assert_eq!(
+                view.allowed_path(Some(&tries), "FooBot", path),
+                view.allowed_path(None, "FooBot", path),
+                "{}",
+                path
+            );
+        }
+        assert!(tries.bytes() > 0);
+    }
+}
@@ -1,4 +1,4 @@
-use robotstxt::RobotsParseHandler;
+use std::{borrow::Cow, mem, ops::Range, rc::Rc};
 
 #[derive(Debug, Clone)]
 pub(crate) enum RobotsUserAgentRuleType {
@@ -16,68 +16,401 @@ pub(crate) struct RobotsUserAgentRule {
 pub(crate) struct RobotsUserAgentInfo {
     pub(crate) name: String,
     pub(crate) line_number: u32,
-    pub(crate) rules: Vec<RobotsUserAgentRule>,
+    /// The rules of the agent's group, shared by every agent in that group.
+    pub(crate) rules: Rc<[RobotsUserAgentRule]>,
 }
 #[derive(Debug, Default, Clone)]
 pub(crate) struct RobotsInfo {
     pub(crate) user_agents: Vec<RobotsUserAgentInfo>,
-    current_user_agent: Option<RobotsUserAgentInfo>,
 }
 
-impl RobotsInfo {}
+/// Consecutive `User-agent` lines form a group, which every following
+/// Allow/Disallow rule applies to. The next `User-agent` line after a rule
+/// starts a new group.
+#[derive(Default)]
+struct RobotsInfoBuilder {
+    user_agents: Vec<RobotsUserAgentInfo>,
+    group_user_agents: Vec<(String, u32)>,
+    group_rules: Vec<RobotsUserAgentRule>,
+    seen_separator: bool,
+}
 
-impl RobotsParseHandler for RobotsInfo {
-    fn handle_robots_start(&mut self) {}
+impl RobotsInfoBuilder {
+    fn close_group(&mut self) {
+        let rules: Rc<[RobotsUserAgentRule]> = mem::take(&mut self.group_rules).into();
+        for (name, line_number) in self.group_user_agents.drain(..) {
+            self.user_agents.push(RobotsUserAgentInfo {
+                name,
+                line_number,
+                rules: rules.clone(),
+            });
+        }
+        self.seen_separator = false;
+    }
+}
 
-    fn handle_robots_end(&mut self) {
-        if let Some(prev) = self.current_user_agent.take() {
-            self.user_agents.push(prev);
+pub(crate) fn parse(source: &str) -> RobotsInfo {
+    let mut builder = RobotsInfoBuilder::default();
+    for line in RobotsLines::new(source) {
+        let rule_type = match line.kind {
+            RobotsLineKind::UserAgent => {
+                if builder.seen_separator {
+                    builder.close_group();
+                }
+                builder
+                    .group_user_agents
+                    .push((line.value.into_owned(), line.line_number));
+                continue;
+            }
+            RobotsLineKind::Allow => RobotsUserAgentRuleType::Allow,
+            RobotsLineKind::Disallow => RobotsUserAgentRuleType::Disallow,
+            _ => continue,
+        };
+        // rules before the first User-agent line apply to no one
+        if builder.group_user_agents.is_empty() {
+            continue;
         }
+        builder.seen_separator = true;
+        builder.group_rules.push(RobotsUserAgentRule {
+            rule_type,
+            value: line.value.into_owned(),
+            line_number: line.line_number,
+        });
+    }
+    builder.close_group();
+    RobotsInfo {
+        user_agents: builder.user_agents,
     }
+}
+
+/// Google's reference parser truncates lines longer than this many bytes.
+pub(crate) const MAX_LINE_LENGTH: usize = 2083 * 8 - 1;
 
-    fn handle_user_agent(&mut self, line_num: u32, user_agent: &str) {
-        let current = RobotsUserAgentInfo {
-            name: user_agent.to_owned(),
-            line_number: line_num,
-            rules: vec![],
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub(crate) enum RobotsLineKind {
+    UserAgent,
+    Allow,
+    Disallow,
+    Sitemap,
+    Unknown,
+}
+
+impl RobotsLineKind {
+    fn from_key(key: &str) -> RobotsLineKind {
+        let starts_with = |prefix: &str| {
+            key.len() >= prefix.len() && key.as_bytes()[..prefix.len()].eq_ignore_ascii_case(prefix.as_bytes())
         };
-        if let Some(prev) = self.current_user_agent.take() {
-            self.user_agents.push(prev);
+        // matches robotstxt's key parsing, including its accepted typos
+        if ["user-agent", "useragent", "user agent"].into_iter().any(starts_with) {
+            RobotsLineKind::UserAgent
+        } else if starts_with("allow") {
+            RobotsLineKind::Allow
+        } else if ["disallow", "dissallow", "dissalow", "disalow", "diasllow", "disallaw"]
+            .into_iter()
+            .any(starts_with)
+        {
+            RobotsLineKind::Disallow
+        } else if starts_with("sitemap") || starts_with("site-map") {
+            RobotsLineKind::Sitemap
+        } else {
+            RobotsLineKind::Unknown
         }
-        self.current_user_agent = Some(current);
     }
+}
 
-    fn handle_allow(&mut self, line_num: u32, value: &str) {
-        if let Some(current) = self.current_user_agent.as_mut() {
-            current.rules.push(RobotsUserAgentRule {
-                rule_type: RobotsUserAgentRuleType::Allow,
-                value: value.to_owned(),
-                line_number: line_num,
-            });
+/// A single `key: value` line of a robots.txt file. `key` and `value` borrow
+/// from the source text, unless the value needed percent-escaping.
+#[derive(Debug, Clone)]
+pub(crate) struct RobotsLine<'a> {
+    pub(crate) line_number: u32,
+    pub(crate) kind: RobotsLineKind,
+    pub(crate) key: &'a str,
+    pub(crate) value: Cow<'a, str>,
+}
+
+/// Where a `RobotsLines` iterator is in its source text. It holds no borrows,
+/// so it can be stored next to the text it refers to and resumed later.
+#[derive(Debug, Clone, Copy, Default)]
+pub(crate) struct RobotsLinesState {
+    position: usize,
+    line_number: u32,
+    finished: bool,
+}
+
+/// Lazily splits a robots.txt file into `key: value` lines, following the
+/// same rules as `robotstxt::parse_robotstxt` but without copying the text.
+#[derive(Clone)]
+pub(crate) struct RobotsLines<'a> {
+    source: &'a str,
+    state: RobotsLinesState,
+}
+
+impl<'a> RobotsLines<'a> {
+    pub(crate) fn new(source: &'a str) -> RobotsLines<'a> {
+        RobotsLines::resume(source, RobotsLinesState::default())
+    }
+
+    /// Continues from a state saved with `state()`, over the same `source`.
+    pub(crate) fn resume(source: &'a str, state: RobotsLinesState) -> RobotsLines<'a> {
+        // byte order marks shouldn't appear in robots.txt files, but do
+        let source = source.strip_prefix('\u{feff}').unwrap_or(source);
+        RobotsLines { source, state }
+    }
+
+    pub(crate) fn state(&self) -> RobotsLinesState {
+        self.state
+    }
+
+    /// The next physical line, without its terminator. `\n`, `\r` and `\r\n`
+    /// all end a line.
+    fn next_raw_line(&mut self) -> Option<(u32, &'a str)> {
+        if self.state.finished {
+            return None;
         }
+        let rest = &self.source[self.state.position..];
+        let (line, consumed) = match rest.find(|c| c == '\n' || c == '\r') {
+            Some(end) if rest[end..].starts_with("\r\n") => (&rest[..end], end + 2),
+            Some(end) => (&rest[..end], end + 1),
+            None => {
+                self.state.finished = true;
+                (rest, rest.len())
+            }
+        };
+        self.state.position += consumed;
+        self.state.line_number += 1;
+        Some((self.state.line_number, truncate_line(line)))
     }
-    fn handle_disallow(&mut self, line_num: u32, value: &str) {
-        if let Some(current) = self.current_user_agent.as_mut() {
-            current.rules.push(RobotsUserAgentRule {
-                rule_type: RobotsUserAgentRuleType::Disallow,
-                value: value.to_owned(),
-                line_number: line_num,
-            });
+}
+
+impl<'a> Iterator for RobotsLines<'a> {
+    type Item = RobotsLine<'a>;
+
+    fn next(&mut self) -> Option<RobotsLine<'a>> {
+        loop {
+            let (line_number, line) = self.next_raw_line()?;
+            if let Some((key, value)) = split_key_value(line) {
+                let kind = RobotsLineKind::from_key(key);
+                let value = match kind {
+                    RobotsLineKind::Allow | RobotsLineKind::Disallow => escape_pattern(value),
+                    _ => Cow::Borrowed(value),
+                };
+                return Some(RobotsLine {
+                    line_number,
+                    kind,
+                    key,
+                    value,
+                });
+            }
         }
     }
+}
+
+/// Where a `GroupLines` iterator is in its source text, to resume it later.
+#[derive(Debug, Clone, Copy, Default)]
+pub(crate) struct GroupLinesState {
+    lines: RobotsLinesState,
+    group_index: Option<u32>,
+    seen_separator: bool,
+}
 
-    fn handle_sitemap(&mut self, _line_num: u32, _value: &str) {
-        //println!("sitemap {} {}", line_num, value);
+/// A line of a robots.txt file and the group of `User-agent` lines it
+/// belongs to.
+pub(crate) struct GroupLine<'a> {
+    pub(crate) line: RobotsLine<'a>,
+    /// Index of the group, numbered like `robotstxt_match_details()` numbers
+    /// them, or `None` before the first `User-agent` line
+    pub(crate) group_index: Option<u32>,
+    /// Whether the line is the first `User-agent` line of its group
+    pub(crate) starts_group: bool,
+}
+
+/// `RobotsLines` that also says which group each line belongs to. Like in
+/// Google's reference parser, a `User-agent` line starts a new group only
+/// after an Allow/Disallow rule; other lines don't end a group.
+#[derive(Clone)]
+pub(crate) struct GroupLines<'a> {
+    lines: RobotsLines<'a>,
+    group_index: Option<u32>,
+    seen_separator: bool,
+}
+
+impl<'a> GroupLines<'a> {
+    pub(crate) fn resume(source: &'a str, state: GroupLinesState) -> GroupLines<'a> {
+        GroupLines {
+            lines: RobotsLines::resume(source, state.lines),
+            group_index: state.group_index,
+            seen_separator: state.seen_separator,
+        }
+    }
+
+    pub(crate) fn state(&self) -> GroupLinesState {
+        GroupLinesState {
+            lines: self.lines.state(),
+            group_index: self.group_index,
+            seen_separator: self.seen_separator,
+        }
     }
 
-    // Any other unrecognized name/v pairs.
-    fn handle_unknown_action(&mut self, _line_num: u32, _action: &str, _value: &str) {
-        //println!("unkown {} {} {}", line_num, action, value);
+    /// The values of the current group's `User-agent` lines after the last
+    /// line read, without moving past them. A group's `User-agent` lines all
+    /// come before its first rule, so this reads no further than that.
+    pub(crate) fn rest_of_group_user_agents(&self) -> impl Iterator<Item = &'a str> {
+        self.lines
+            .clone()
+            .take_while(|line| {
+                !matches!(line.kind, RobotsLineKind::Allow | RobotsLineKind::Disallow)
+            })
+            .filter(|line| line.kind == RobotsLineKind::UserAgent)
+            .filter_map(|line| match line.value {
+                Cow::Borrowed(value) => Some(value),
+                Cow::Owned(_) => None,
+            })
     }
 }
 
-pub(crate) fn parse(source: &str) -> RobotsInfo {
-    let mut info = RobotsInfo::default();
-    robotstxt::parse_robotstxt(source, &mut info);
-    info
+impl<'a> Iterator for GroupLines<'a> {
+    type Item = GroupLine<'a>;
+
+    fn next(&mut self) -> Option<GroupLine<'a>> {
+        let line = self.lines.next()?;
+        let mut starts_group = false;
+        match line.kind {
+            RobotsLineKind::UserAgent => {
+                if self.seen_separator || self.group_index.is_none() {
+                    self.group_index = Some(self.group_index.map_or(0, |index| index + 1));
+                    self.seen_separator = false;
+                    starts_group = true;
+                }
+            }
+            RobotsLineKind::Allow | RobotsLineKind::Disallow => {
+                self.seen_separator = self.group_index.is_some();
+            }
+            _ => (),
+        }
+        Some(GroupLine {
+            line,
+            group_index: self.group_index,
+            starts_group,
+        })
+    }
+}
+
+/// The byte range of `slice` within `source`, which it must borrow from.
+pub(crate) fn range_in(source: &str, slice: &str) -> Range<usize> {
+    let start = slice.as_ptr() as usize - source.as_ptr() as usize;
+    start..start + slice.len()
+}
+
+fn truncate_line(line: &str) -> &str {
+    &line[..floor_char_boundary(line, MAX_LINE_LENGTH)]
+}
+
+/// The largest index no greater than `index` that doesn't split a character.
+pub(crate) fn floor_char_boundary(text: &str, index: usize) -> usize {
+    if index >= text.len() {
+        return text.len();
+    }
+    let mut end = index;
+    while !text.is_char_boundary(end) {
+        end -= 1;
+    }
+    end
+}
+
+/// The length of the prefix of `source` that holds its first `max_rules`
+/// Allow/Disallow lines, when it has more than that.
+pub(crate) fn rules_prefix_len(source: &str, max_rules: usize) -> Option<usize> {
+    let mut lines = RobotsLines::new(source);
+    let bom = source.len() - lines.source.len();
+    let mut rules = 0;
+    loop {
+        let start = lines.state.position;
+        let line = lines.next()?;
+        if matches!(line.kind, RobotsLineKind::Allow | RobotsLineKind::Disallow) {
+            rules += 1;
+            if rules > max_rules {
+                return Some(bom + start);
+            }
+        }
+    }
+}
+
+/// Splits `<key>[ \t]*:[ \t]*<value>`, ignoring comments. Like Google's
+/// parser, whitespace is accepted in place of a missing colon, as long as the
+/// line has exactly two words.
+fn split_key_value(line: &str) -> Option<(&str, &str)> {
+    let line = match line.find('#') {
+        Some(comment) => &line[..comment],
+        None => line,
+    };
+    let line = line.trim();
+    let (key, value) = match line.find(':') {
+        Some(separator) => (&line[..separator], &line[separator + 1..]),
+        None => {
+            let separator = line.find(|c| c == ' ' || c == '\t')?;
+            let value = line[separator..].trim_start();
+            if value.contains(|c| c == ' ' || c == '\t') {
+                return None;
+            }
+            (&line[..separator], value)
+        }
+    };
+    Some((key.trim(), value.trim()))
+}
+
+pub(crate) const UTF8_BOM: &[u8] = b"\xef\xbb\xbf";
+
+/// Decodes the bytes of a robots.txt file, borrowing them when they are valid
+/// UTF-8. Otherwise only the lines that aren't valid UTF-8 are decoded as
+/// Latin-1, so that a stray byte can't make the whole file unreadable. A
+/// leading byte order mark is dropped.
+pub(crate) fn decode_robotstxt(bytes: &[u8]) -> Cow<'_, str> {
+    let bytes = bytes.strip_prefix(UTF8_BOM).unwrap_or(bytes);
+    if let Ok(text) = std::str::from_utf8(bytes) {
+        return Cow::Borrowed(text);
+    }
+    let mut text = String::with_capacity(bytes.len() + bytes.len() / 2);
+    for line in bytes.split_inclusive(|byte| *byte == b'\n' || *byte == b'\r') {
+        match std::str::from_utf8(line) {
+            Ok(line) => text.push_str(line),
+            Err(_) => text.extend(line.iter().map(|byte| char::from(*byte))),
+        }
+    }
+    Cow::Owned(text)
+}
+
+/// Percent-escapes non-ASCII bytes and upper-cases existing `%xx` escapes, as
+/// robotstxt does for Allow/Disallow values. Borrows when nothing changes.
+pub(crate) fn escape_pattern(value: &str) -> Cow<'_, str> {
+    let bytes = value.as_bytes();
+    let is_escape = |i: usize| {
+        bytes[i] == b'%'
+            && bytes.get(i + 1).map_or(false, u8::is_ascii_hexdigit)
+            && bytes.get(i + 2).map_or(false, u8::is_ascii_hexdigit)
+    };
+    let needs_escaping = (0..bytes.len()).any(|i| {
+        !bytes[i].is_ascii()
+            || (is_escape(i) && (bytes[i + 1].is_ascii_lowercase() || bytes[i + 2].is_ascii_lowercase()))
+    });
+    if !needs_escaping {
+        return Cow::Borrowed(value);
+    }
+
+    let mut escaped = String::with_capacity(value.len() * 3);
+    let mut i = 0;
+    while i < bytes.len() {
+        if is_escape(i) {
+            escaped.push('%');
+            escaped.push(bytes[i + 1].to_ascii_uppercase() as char);
+            escaped.push(bytes[i + 2].to_ascii_uppercase() as char);
+            i += 3;
+        } else if !bytes[i].is_ascii() {
+            escaped.push_str(&format!("%{:02X}", bytes[i]));
+            i += 1;
+        } else {
+            escaped.push(bytes[i] as char);
+            i += 1;
+        }
+    }
+    Cow::Owned(escaped)
 }
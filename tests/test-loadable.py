@@ -1,3 +1,4 @@
+import json
 import sqlite3
 import unittest
 from pathlib import Path
@@ -44,13 +45,35 @@ def execute_all(sql, args=None):
 
 
 FUNCTIONS = [
+    "robotstxt_allowed_agents",
+    "robotstxt_cache_configure",
+    "robotstxt_cache_stats",
+    "robotstxt_compile",
+    "robotstxt_crawl_delay",
     "robotstxt_debug",
+    "robotstxt_group_compile",
+    "robotstxt_limits",
+    "robotstxt_limits_configure",
+    "robotstxt_match_details",
     "robotstxt_matches",
+    "robotstxt_matches_any",
+    "robotstxt_matches_path",
+    "robotstxt_matches_url",
+    "robotstxt_path",
+    "robotstxt_shared_cache_configure",
+    "robotstxt_shared_cache_stats",
+    "robotstxt_stats_reset",
     "robotstxt_version",
 ]
 
 MODULES = [
+    "robotstxt_corpus_stats",
+    "robotstxt_directives",
+    "robotstxt_index",
+    "robotstxt_matches_batch",
     "robotstxt_rules",
+    "robotstxt_sitemaps",
+    "robotstxt_stats",
     "robotstxt_user_agents",
 ]
 
@@ -95,19 +118,488 @@ class TestRobotstxt(unittest.TestCase):
             robotstxt_matches(GOOGLE_ROBOTSTXT, "Twitterbot", "/groups"), 0
         )
 
+    def test_robotstxt_group_compile(self):
+        db.execute(
+            "create temp table rules as select 'google' as handle, * from robotstxt_rules(?)",
+            [GOOGLE_ROBOTSTXT],
+        )
+        try:
+            compiled = db.execute(
+                """
+                  select robotstxt_group_compile(
+                    json_group_array(json_array(user_agent, rule_type, path, source))
+                  )
+                  from rules
+                  group by handle
+                """
+            ).fetchone()[0]
+            paths = ["/", "/search", "/groups", "/maps/reserve", "/books?id=1", "/m/", "/compare"]
+            for agent in ["Twitterbot", "facebookexternalhit", "AdsBot-Google", "mybot"]:
+                for path in paths:
+                    from_rows, from_text = db.execute(
+                        "select robotstxt_matches(?, ?, ?), robotstxt_matches(?, ?, ?)",
+                        [compiled, agent, path, GOOGLE_ROBOTSTXT, agent, path],
+                    ).fetchone()
+                    self.assertEqual(from_rows, from_text, (agent, path))
+        finally:
+            db.execute("drop table rules")
+
+        group_compile = lambda rows: db.execute(
+            "select robotstxt_group_compile(?)", [json.dumps(rows)]
+        ).fetchone()[0]
+        # a policy override as rows: mybot gets its own group, without the * rules
+        compiled = group_compile(
+            [
+                ["*", "disallow", "/private"],
+                ["*", "Allow", "/private/café"],
+                ["mybot", None, None],
+            ]
+        )
+        matches = lambda agent, path: db.execute(
+            "select robotstxt_matches(?, ?, ?)", [compiled, agent, path]
+        ).fetchone()[0]
+        self.assertEqual(matches("otherbot", "/private/x"), 0)
+        self.assertEqual(matches("otherbot", "/private/caf%C3%A9"), 1)
+        self.assertEqual(matches("mybot", "/private/x"), 1)
+        self.assertEqual(
+            json.loads(
+                db.execute(
+                    "select robotstxt_match_details(?, 'otherbot', '/private/x')", [compiled]
+                ).fetchone()[0]
+            )["rule"],
+            {"line": 1, "type": "disallow", "pattern": "/private", "priority": 8},
+        )
+        self.assertEqual(group_compile([]), db.execute("select robotstxt_compile('')").fetchone()[0])
+
+        with self.assertRaisesRegex(sqlite3.OperationalError, "expected 'allow' or 'disallow'"):
+            group_compile([["*", "crawl-delay", "10"]])
+        with self.assertRaisesRegex(sqlite3.OperationalError, "row 2 of rules"):
+            group_compile([["*", "allow", "/"], ["*", "allow"]])
+        with self.assertRaisesRegex(sqlite3.OperationalError, "not a JSON array"):
+            group_compile({"*": "/"})
+
+    def test_robotstxt_path(self):
+        robotstxt_path = lambda url: db.execute(
+            "select robotstxt_path(?)", [url]
+        ).fetchone()[0]
+        self.assertEqual(robotstxt_path("https://example.com/a/b?c=d&e#f"), "/a/b?c=d&e")
+        self.assertEqual(robotstxt_path("https://example.com"), "/")
+        self.assertEqual(robotstxt_path("https://example.com?q=1"), "/?q=1")
+        self.assertEqual(robotstxt_path("//example.com/a;b"), "/a;b")
+        self.assertEqual(robotstxt_path("/already/a/path"), "/already/a/path")
+        self.assertEqual(robotstxt_path("https://example.com/caf%c3%a9"), "/caf%c3%a9")
+
+    def test_robotstxt_matches_path(self):
+        urls = [
+            "https://www.google.com/search?q=robots",
+            "https://www.google.com/groups",
+            "https://www.google.com/?hl=en",
+            "http://www.google.com/maps/reserve/api",
+            "https://www.google.com/books?id=1#top",
+        ]
+        # same verdicts as matching the full URLs, for text and compiled BLOBs
+        for robotstxt in [GOOGLE_ROBOTSTXT, "compiled"]:
+            differences = execute_all(
+                """
+                  with robots as (
+                    select case when ? = 'compiled' then robotstxt_compile(?) else ? end as robotstxt
+                  )
+                  select value as url
+                  from json_each(?), robots
+                  where robotstxt_matches(?, 'Twitterbot', value)
+                    != robotstxt_matches_path(robots.robotstxt, 'Twitterbot', robotstxt_path(value))
+                """,
+                [robotstxt, GOOGLE_ROBOTSTXT, robotstxt, json.dumps(urls), GOOGLE_ROBOTSTXT],
+            )
+            self.assertEqual(differences, [])
+        self.assertEqual(
+            db.execute(
+                "select robotstxt_matches_path(?, 'Twitterbot', '/groups')", [GOOGLE_ROBOTSTXT]
+            ).fetchone()[0],
+            0,
+        )
+        with self.assertRaisesRegex(sqlite3.OperationalError, "robotstxt_path"):
+            db.execute(
+                "select robotstxt_matches_path(?, 'Twitterbot', 'https://www.google.com/groups')",
+                [GOOGLE_ROBOTSTXT],
+            )
+
+    def test_robotstxt_matches_url(self):
+        matches_url = lambda url, robotstxt_url="https://www.google.com/robots.txt": db.execute(
+            "select robotstxt_matches_url(?, 'Twitterbot', ?, ?)",
+            [GOOGLE_ROBOTSTXT, url, robotstxt_url],
+        ).fetchone()[0]
+        self.assertEqual(matches_url("https://www.google.com/groups"), 0)
+        self.assertEqual(matches_url("https://WWW.Google.com:443/search?q=1"), 1)
+        self.assertEqual(matches_url("https://www.google.com./groups"), 0)
+        # other hosts, schemes and ports aren't covered by this robots.txt
+        self.assertEqual(matches_url("https://maps.google.com/groups"), None)
+        self.assertEqual(matches_url("http://www.google.com/groups"), None)
+        self.assertEqual(matches_url("https://www.google.com:8443/groups"), None)
+        self.assertEqual(matches_url("/groups"), None)
+        self.assertEqual(matches_url("http://www.google.com/groups", "http://www.google.com:80/robots.txt"), 0)
+        with self.assertRaisesRegex(sqlite3.OperationalError, "absolute URL"):
+            matches_url("https://www.google.com/groups", "www.google.com")
+
+    def test_robotstxt_matches_trie(self):
+        # files with many rules are matched through a trie, which must agree
+        # with the linear matcher behind robotstxt_match_details(). Both are
+        # checked against the reference matcher by the Rust unit tests.
+        large = "User-agent: *\n" + "".join(
+            f"Disallow: /d{i}/\nAllow: /d{i}/ok\nDisallow: /*.x{i}$\nDisallow: /p{i}*q\n"
+            for i in range(1000)
+        )
+        robotstxts = [large, GOOGLE_ROBOTSTXT] + [
+            path.read_text("utf-8")
+            for path in sorted((Path(__file__).parent / "examples").glob("*.robots.txt"))
+        ]
+        for robotstxt in robotstxts:
+            disagreements = execute_all(
+                """
+                  with paths as (
+                    select distinct path from robotstxt_rules(:robotstxt)
+                    union select replace(replace(path, '*', 'x'), '$', '') || suffix.value
+                    from robotstxt_rules(:robotstxt), json_each('["", "/", "ok", ".x1", "?q"]') as suffix
+                  ),
+                  agents as (
+                    select distinct name as user_agent from robotstxt_user_agents(:robotstxt)
+                    union select 'NoSuchBot'
+                  )
+                  select user_agent, path
+                  from agents, paths
+                  where robotstxt_matches(:robotstxt, user_agent, path)
+                    != json_extract(robotstxt_match_details(:robotstxt, user_agent, path), '$.allowed')
+                """,
+                {"robotstxt": robotstxt},
+            )
+            self.assertEqual(disagreements, [])
+
+    def test_robotstxt_blob_input(self):
+        # robots.txt bodies can be BLOBs, with a byte order mark or bytes
+        # that aren't valid UTF-8, which are read as Latin-1
+        latin1 = b"\xef\xbb\xbf" + "User-agent: *\nDisallow: /café\nAllow: /caf\n".encode(
+            "latin-1"
+        )
+        matches = lambda robotstxt, path: db.execute(
+            "select robotstxt_matches(?, 'bot', ?)", [robotstxt, path]
+        ).fetchone()[0]
+        self.assertEqual(matches(GOOGLE_ROBOTSTXT.encode(), "/groups"), 0)
+        self.assertEqual(matches(latin1, "/caf%C3%A9"), 0)
+        self.assertEqual(matches(latin1, "/cafe"), 1)
+        self.assertEqual(
+            execute_all("select user_agent, path from robotstxt_rules(?)", [latin1]),
+            [
+                {"user_agent": "*", "path": "/caf%C3%A9"},
+                {"user_agent": "*", "path": "/caf"},
+            ],
+        )
+        self.assertEqual(
+            execute_all("select name, source from robotstxt_user_agents(?)", [latin1]),
+            [{"name": "*", "source": 1}],
+        )
+        # TEXT values with invalid UTF-8 don't fail either
+        self.assertEqual(
+            db.execute(
+                "select robotstxt_matches(cast(? as text), 'bot', '/caf%C3%A9')", [latin1]
+            ).fetchone()[0],
+            0,
+        )
+        self.assertEqual(
+            db.execute(
+                "select robotstxt_matches(robotstxt_compile(?), 'bot', '/caf%C3%A9')",
+                [latin1],
+            ).fetchone()[0],
+            0,
+        )
+
+    def test_robotstxt_cache_stats(self):
+        cache_stats = lambda: json.loads(
+            db.execute("select robotstxt_cache_stats()").fetchone()[0]
+        )
+        before = cache_stats()
+        # a non-constant robots.txt argument, so every row goes through the cache
+        db.execute(
+            "select robotstxt_matches(json_extract(value, '$[0]'), 'Twitterbot', json_extract(value, '$[1]')) from json_each(?)",
+            [
+                json.dumps(
+                    [
+                        [GOOGLE_ROBOTSTXT + "\n# stats", "/search"],
+                        [GOOGLE_ROBOTSTXT + "\n# stats", "/groups"],
+                        [GOOGLE_ROBOTSTXT + "\n# stats", "/"],
+                    ]
+                )
+            ],
+        ).fetchall()
+        after = cache_stats()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 2)
+        self.assertGreater(after["bytes"], 0)
+
+    def test_robotstxt_cache_configure(self):
+        cache_stats = lambda: json.loads(
+            db.execute("select robotstxt_cache_stats()").fetchone()[0]
+        )
+        db.execute("select robotstxt_cache_configure(1, 1000000)")
+        db.execute("select robotstxt_matches('User-agent: *', 'a', '/')")
+        db.execute("select robotstxt_matches('User-agent: b', 'a', '/')")
+        stats = cache_stats()
+        self.assertEqual(stats["entries"], 1)
+        self.assertEqual(stats["max_entries"], 1)
+        self.assertEqual(stats["max_bytes"], 1000000)
+
+        db.execute("select robotstxt_cache_configure(0, 0)")
+        self.assertEqual(cache_stats()["entries"], 0)
+        self.assertEqual(
+            db.execute(
+                "select robotstxt_matches('User-agent: *\nDisallow: /', 'a', '/')"
+            ).fetchone()[0],
+            0,
+        )
+        self.assertEqual(cache_stats()["entries"], 0)
+
+        with self.assertRaisesRegex(sqlite3.OperationalError, "negative"):
+            db.execute("select robotstxt_cache_configure(-1, 0)")
+
+        db.execute("select robotstxt_cache_configure(1024, 64 * 1024 * 1024)")
+
+    def test_robotstxt_matches_auxdata(self):
+        cache_stats = lambda: json.loads(
+            db.execute("select robotstxt_cache_stats()").fetchone()[0]
+        )
+        paths = ["/search", "/groups", "/", "/search/about"] * 25
+        before = cache_stats()
+        results = db.execute(
+            "select robotstxt_matches(?, 'Twitterbot', value) from json_each(?)",
+            [GOOGLE_ROBOTSTXT + "\n# auxdata", json.dumps(paths)],
+        ).fetchall()
+        after = cache_stats()
+        self.assertEqual([row[0] for row in results[:4]], [1, 0, 1, 1])
+        # parsed once for the whole statement, then reused through auxdata
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 0)
+
+    def test_robotstxt_compile(self):
+        compiled = db.execute(
+            "select robotstxt_compile(?)", [GOOGLE_ROBOTSTXT]
+        ).fetchone()[0]
+        self.assertIsInstance(compiled, bytes)
+        self.assertEqual(compiled[:4], b"RTXC")
+
+        robotstxt_matches = lambda *args: db.execute(
+            "select robotstxt_matches(?, ?, ?)", args
+        ).fetchone()[0]
+        for agent, path in [
+            ("Twitterbot", "/search"),
+            ("Twitterbot", "/groups"),
+            ("AdsBot-Google", "/maps/api/js?"),
+            ("*", "/?hl=en&gws_rd=ssl"),
+            ("*", "/search/about"),
+        ]:
+            self.assertEqual(
+                robotstxt_matches(compiled, agent, path),
+                robotstxt_matches(GOOGLE_ROBOTSTXT, agent, path),
+            )
+        self.assertEqual(robotstxt_matches(compiled, "Twitterbot", "/groups"), 0)
+
+        with self.assertRaisesRegex(sqlite3.OperationalError, "unsupported"):
+            robotstxt_matches(b"RTXC\xff" + compiled[5:], "Twitterbot", "/")
+        with self.assertRaisesRegex(sqlite3.OperationalError, "truncated"):
+            robotstxt_matches(compiled[:100], "Twitterbot", "/")
+
+    def test_robotstxt_matches_any(self):
+        robotstxt_matches_any = lambda *args: db.execute(
+            "select robotstxt_matches_any(?, ?, ?)", args
+        ).fetchone()[0]
+        agents = json.dumps(["Twitterbot", "facebookexternalhit"])
+        self.assertEqual(robotstxt_matches_any(GOOGLE_ROBOTSTXT, agents, "/search"), 1)
+        self.assertEqual(robotstxt_matches_any(GOOGLE_ROBOTSTXT, agents, "/groups"), 0)
+        self.assertEqual(robotstxt_matches_any(GOOGLE_ROBOTSTXT, "[]", "/search"), 0)
+        with self.assertRaisesRegex(sqlite3.OperationalError, "JSON array of strings"):
+            robotstxt_matches_any(GOOGLE_ROBOTSTXT, "Twitterbot", "/search")
+
+    def test_robotstxt_allowed_agents(self):
+        robotstxt_allowed_agents = lambda *args: json.loads(
+            db.execute("select robotstxt_allowed_agents(?, ?, ?)", args).fetchone()[0]
+        )
+        robotstxt = "User-agent: *\nDisallow: /private\n\nUser-agent: legacybot\nDisallow: /"
+        agents = json.dumps(["newbot", "LegacyBot", "otherbot"])
+        self.assertEqual(
+            robotstxt_allowed_agents(robotstxt, agents, "/public"),
+            ["newbot", "otherbot"],
+        )
+        self.assertEqual(robotstxt_allowed_agents(robotstxt, agents, "/private/x"), [])
+        compiled = db.execute("select robotstxt_compile(?)", [robotstxt]).fetchone()[0]
+        self.assertEqual(
+            robotstxt_allowed_agents(compiled, agents, "/public"),
+            ["newbot", "otherbot"],
+        )
+
+    def test_robotstxt_crawl_delay(self):
+        robotstxt_crawl_delay = lambda *args: db.execute(
+            "select robotstxt_crawl_delay(?, ?)", args
+        ).fetchone()[0]
+        github = (
+            Path(__file__).parent / "examples" / "github.com.robots.txt"
+        ).read_text("utf-8")
+        self.assertEqual(robotstxt_crawl_delay(github, "baidu"), 1.0)
+        self.assertEqual(robotstxt_crawl_delay(GOOGLE_ROBOTSTXT, "Twitterbot"), None)
+
+        robotstxt = "User-agent: *\nCrawl-delay: 5\nDisallow: /private\n\nUser-agent: slowbot\nCrawl-delay: 0.5\nDisallow: /\n\nUser-agent: fastbot\nDisallow: /"
+        self.assertEqual(robotstxt_crawl_delay(robotstxt, "SlowBot"), 0.5)
+        self.assertEqual(robotstxt_crawl_delay(robotstxt, "otherbot"), 5.0)
+        # a specific group without a delay doesn't inherit the * group's
+        self.assertEqual(robotstxt_crawl_delay(robotstxt, "fastbot"), None)
+        self.assertEqual(
+            robotstxt_crawl_delay("User-agent: *\nCrawl-delay: soon", "a"), None
+        )
+
+        compiled = db.execute("select robotstxt_compile(?)", [robotstxt]).fetchone()[0]
+        self.assertEqual(robotstxt_crawl_delay(compiled, "slowbot"), 0.5)
+        self.assertEqual(robotstxt_crawl_delay(compiled, "otherbot"), 5.0)
+        self.assertEqual(robotstxt_crawl_delay(compiled, "fastbot"), None)
+        # BLOBs keep the exact delay, not whole milliseconds
+        robotstxt = "User-agent: *\nCrawl-delay: 0.0001"
+        compiled = db.execute("select robotstxt_compile(?)", [robotstxt]).fetchone()[0]
+        self.assertEqual(robotstxt_crawl_delay(compiled, "a"), 0.0001)
+        self.assertEqual(
+            robotstxt_crawl_delay(compiled, "a"), robotstxt_crawl_delay(robotstxt, "a")
+        )
+
+    def test_robotstxt_match_details(self):
+        robotstxt_match_details = lambda *args: json.loads(
+            db.execute("select robotstxt_match_details(?, ?, ?)", args).fetchone()[0]
+        )
+        self.assertEqual(
+            robotstxt_match_details(GOOGLE_ROBOTSTXT, "Twitterbot", "/groups/x"),
+            {
+                "allowed": False,
+                "path": "/groups/x",
+                "specific": True,
+                "rule": {"line": 291, "type": "disallow", "pattern": "/groups", "priority": 7},
+                "group": {"index": 2, "user_agents": ["Twitterbot"], "global": False},
+            },
+        )
+        self.assertEqual(
+            robotstxt_match_details(
+                GOOGLE_ROBOTSTXT, "MyBot", "https://www.google.com/search?q=x#top"
+            ),
+            {
+                "allowed": False,
+                "path": "/search?q=x",
+                "specific": False,
+                "rule": {"line": 2, "type": "disallow", "pattern": "/search", "priority": 7},
+                "group": {"index": 0, "user_agents": [], "global": True},
+            },
+        )
+        self.assertEqual(
+            robotstxt_match_details(GOOGLE_ROBOTSTXT, "Twitterbot", "/about"),
+            {
+                "allowed": True,
+                "path": "/about",
+                "specific": True,
+                "rule": None,
+                "group": None,
+            },
+        )
+        # compiled BLOBs are matched in place, with the same details
+        compiled = db.execute("select robotstxt_compile(?)", [GOOGLE_ROBOTSTXT]).fetchone()[0]
+        for user_agent, url in [
+            ("Twitterbot", "/groups/x"),
+            ("MyBot", "https://www.google.com/search?q=x#top"),
+            ("Twitterbot", "/about"),
+        ]:
+            self.assertEqual(
+                robotstxt_match_details(compiled, user_agent, url),
+                robotstxt_match_details(GOOGLE_ROBOTSTXT, user_agent, url),
+            )
+
+    def test_robotstxt_matches_batch(self):
+        robotstxt_matches_batch = lambda *args: execute_all(
+            "select * from robotstxt_matches_batch(?, ?, ?)", args
+        )
+        self.assertEqual(
+            robotstxt_matches_batch(
+                GOOGLE_ROBOTSTXT,
+                "Twitterbot",
+                json.dumps(
+                    [
+                        "/search",
+                        "/groups/foo",
+                        "/about",
+                        "https://www.google.com/search?q=robots",
+                    ]
+                ),
+            ),
+            # fmt: off
+            [
+                {"url": "/search", "allowed": 1, "matching_rule_line": 290, "matching_rule_type": "allow"},
+                {"url": "/groups/foo", "allowed": 0, "matching_rule_line": 291, "matching_rule_type": "disallow"},
+                {"url": "/about", "allowed": 1, "matching_rule_line": None, "matching_rule_type": None},
+                {"url": "https://www.google.com/search?q=robots", "allowed": 1, "matching_rule_line": 290, "matching_rule_type": "allow"},
+            ],
+            # fmt: on
+        )
+        self.assertEqual(
+            robotstxt_matches_batch(
+                GOOGLE_ROBOTSTXT, "MyBot", "/search/about\n/search\r\n\n"
+            ),
+            # fmt: off
+            [
+                {"url": "/search/about", "allowed": 1, "matching_rule_line": 3, "matching_rule_type": "allow"},
+                {"url": "/search", "allowed": 0, "matching_rule_line": 2, "matching_rule_type": "disallow"},
+            ],
+            # fmt: on
+        )
+        self.assertEqual(
+            robotstxt_matches_batch(
+                db.execute("select robotstxt_compile(?)", [GOOGLE_ROBOTSTXT]).fetchone()[0],
+                "MyBot",
+                '["/search"]',
+            ),
+            [{"url": "/search", "allowed": 0, "matching_rule_line": 2, "matching_rule_type": "disallow"}],
+        )
+        self.assertEqual(robotstxt_matches_batch(GOOGLE_ROBOTSTXT, "MyBot", "[]"), [])
+        with self.assertRaisesRegex(sqlite3.OperationalError, "JSON array"):
+            robotstxt_matches_batch(GOOGLE_ROBOTSTXT, "MyBot", "[1, 2]")
+
     def test_robotstxt_user_agents(self):
         robotstxt_user_agents = lambda *args: execute_all(
-            "select * from  robotstxt_user_agents(?)", args
+            "select name, source, json_array_length(rules) as rules from robotstxt_user_agents(?)",
+            args,
         )
         self.assertEqual(
             robotstxt_user_agents(GOOGLE_ROBOTSTXT),
             [
-                {"name": "*", "rules": None, "source": 1},
-                {"name": "AdsBot-Google", "rules": None, "source": 280},
-                {"name": "Twitterbot", "rules": None, "source": 288},
-                {"name": "facebookexternalhit", "rules": None, "source": 295},
+                {"name": "*", "rules": 276, "source": 1},
+                {"name": "AdsBot-Google", "rules": 5, "source": 280},
+                {"name": "Twitterbot", "rules": 5, "source": 288},
+                {"name": "facebookexternalhit", "rules": 5, "source": 295},
             ],
         )
+        # consecutive User-agent lines share the same rules
+        self.assertEqual(
+            execute_all(
+                "select name, source, rules from robotstxt_user_agents(?)",
+                ["User-agent: a\nUser-agent: b\nDisallow: /x\n\nUser-agent: c"],
+            ),
+            [
+                {"name": "a", "source": 1, "rules": '[{"path":"/x","rule_type":"disallow","source":3}]'},
+                {"name": "b", "source": 2, "rules": '[{"path":"/x","rule_type":"disallow","source":3}]'},
+                {"name": "c", "source": 5, "rules": "[]"},
+            ],
+        )
+        # the hidden column is the argument, even when the limits cut it
+        db.execute("select robotstxt_limits_configure(10, 0, 0)")
+        try:
+            for robotstxt in ["User-agent: a\nDisallow: /x", b"User-agent: a\nDisallow: /x"]:
+                self.assertEqual(
+                    db.execute(
+                        "select robotstxt from robotstxt_user_agents(?)", [robotstxt]
+                    ).fetchone(),
+                    (robotstxt,),
+                )
+        finally:
+            db.execute("select robotstxt_limits_configure(500 * 1024, 2083 * 8 - 1, 0)")
 
     def test_robotstxt_rules(self):
         robotstxt_rules = lambda *args: execute_all(
@@ -421,13 +913,476 @@ Disallow:
 
 Allow: /editorial/wp-admin/admin-ajax.php
 '''),
-[{'path': '', 'rule_type': 'disallow', 'source': 5, 'user_agent': 'grapeshot'},
+[{'path': '', 'rule_type': 'disallow', 'source': 5, 'user_agent': '*'},
+  {'path': '', 'rule_type': 'disallow', 'source': 5, 'user_agent': 'grapeshot'},
+  {'path': '/editorial/wp-admin/admin-ajax.php',
+   'rule_type': 'allow',
+   'source': 7,
+   'user_agent': '*'},
   {'path': '/editorial/wp-admin/admin-ajax.php',
    'rule_type': 'allow',
    'source': 7,
    'user_agent': 'grapeshot'}]
         )
 
+        # paths are percent-escaped like robotstxt_matches sees them
+        self.assertEqual(
+            robotstxt_rules("User-agent: a\nDisallow: /café\nAllow: /%aa"),
+            [
+                {"user_agent": "a", "source": 2, "rule_type": "disallow", "path": "/caf%C3%A9"},
+                {"user_agent": "a", "source": 3, "rule_type": "allow", "path": "/%AA"},
+            ],
+        )
+        wikipedia = (
+            Path(__file__).parent / "examples" / "en.wikipedia.org.robots.txt"
+        ).read_text("utf-8")
+        self.assertEqual(
+            execute_all(
+                "select source from robotstxt_rules(?) limit 3", [wikipedia]
+            ),
+            [{"source": 12}, {"source": 16}, {"source": 20}],
+        )
+
+        # user_agent and rule_type constraints are applied while parsing
+        self.assertEqual(
+            execute_all(
+                "select source, path from robotstxt_rules(?) where user_agent = 'Twitterbot' and rule_type = 'allow'",
+                [GOOGLE_ROBOTSTXT],
+            ),
+            [{"source": 289, "path": "/imgres"}, {"source": 290, "path": "/search"}],
+        )
+        # = compares exactly, whatever the query plan, while the agent argument
+        # is case-insensitive like the matcher
+        for sql in [
+            "select count(*) from robotstxt_rules(?) where user_agent = 'twitterbot'",
+            "select count(*) from robotstxt_rules(?) where +user_agent = 'twitterbot'",
+            "select count(*) from robotstxt_rules(?) where user_agent = null",
+            "select count(*) from robotstxt_rules(?, null)",
+        ]:
+            self.assertEqual(db.execute(sql, [GOOGLE_ROBOTSTXT]).fetchone()[0], 0, sql)
+        self.assertEqual(
+            execute_all(
+                "select user_agent, agent, source, path from robotstxt_rules(?, 'twitterbot') where rule_type = 'allow'",
+                [GOOGLE_ROBOTSTXT],
+            ),
+            [
+                {"user_agent": "Twitterbot", "agent": "twitterbot", "source": 289, "path": "/imgres"},
+                {"user_agent": "Twitterbot", "agent": "twitterbot", "source": 290, "path": "/search"},
+            ],
+        )
+        self.assertEqual(
+            execute_all(
+                "select user_agent, count(*) as rules from robotstxt_rules(?) where user_agent in ('Twitterbot', 'facebookexternalhit') group by 1 order by 1",
+                [GOOGLE_ROBOTSTXT],
+            ),
+            [
+                {"user_agent": "Twitterbot", "rules": 5},
+                {"user_agent": "facebookexternalhit", "rules": 5},
+            ],
+        )
+        self.assertEqual(
+            execute_all(
+                "select distinct user_agent from robotstxt_rules(?) where user_agent like 'adsbot%'",
+                [GOOGLE_ROBOTSTXT],
+            ),
+            [{"user_agent": "AdsBot-Google"}],
+        )
+        # filtering out some agents of a group keeps the group's boundaries
+        self.assertEqual(
+            execute_all(
+                "select user_agent, source from robotstxt_rules(?) where user_agent = 'b'",
+                ["User-agent: a\nUser-agent: b\nDisallow: /x\nUser-agent: c\nAllow: /y"],
+            ),
+            [{"user_agent": "b", "source": 3}],
+        )
+
+    def test_robotstxt_sitemaps(self):
+        robotstxt_sitemaps = lambda *args: execute_all(
+            "select * from robotstxt_sitemaps(?)", args
+        )
+        self.assertEqual(
+            robotstxt_sitemaps(GOOGLE_ROBOTSTXT),
+            [{"url": "https://www.google.com/sitemap.xml", "source": 302, "group_index": 3}],
+        )
+        self.assertEqual(
+            robotstxt_sitemaps(
+                "Sitemap: /a.xml\nUser-agent: *\nsite-map: /b.xml # comment\nDisallow: /\nUser-agent: x\nSitemap: /c.xml"
+            ),
+            [
+                {"url": "/a.xml", "source": 1, "group_index": None},
+                {"url": "/b.xml", "source": 3, "group_index": 0},
+                {"url": "/c.xml", "source": 6, "group_index": 1},
+            ],
+        )
+        nytimes = (
+            Path(__file__).parent / "examples" / "nytimes.com.robots.txt"
+        ).read_text("utf-8")
+        self.assertEqual(
+            execute_all("select count(*) as n from robotstxt_sitemaps(?)", [nytimes]),
+            [{"n": 11}],
+        )
+
+    def test_robotstxt_directives(self):
+        robotstxt_directives = lambda *args: execute_all(
+            "select * from robotstxt_directives(?)", args
+        )
+        github = (
+            Path(__file__).parent / "examples" / "github.com.robots.txt"
+        ).read_text("utf-8")
+        self.assertEqual(
+            robotstxt_directives(github),
+            [
+                {
+                    "directive": "crawl-delay",
+                    "value": "1",
+                    "source": 4,
+                    "group_index": 0,
+                    "user_agents": '["baidu"]',
+                }
+            ],
+        )
+        self.assertEqual(
+            robotstxt_directives(
+                "Host: example.com\nUser-agent: a\nUser-agent: b\nCrawl-Delay: 10\nRequest-rate: 1/5\nDisallow: /x\nSitemap: /s.xml\nUser-agent: c\nNoindex: /y"
+            ),
+            [
+                {"directive": "host", "value": "example.com", "source": 1, "group_index": None, "user_agents": None},
+                {"directive": "crawl-delay", "value": "10", "source": 4, "group_index": 0, "user_agents": '["a","b"]'},
+                {"directive": "request-rate", "value": "1/5", "source": 5, "group_index": 0, "user_agents": '["a","b"]'},
+                {"directive": "noindex", "value": "/y", "source": 9, "group_index": 1, "user_agents": '["c"]'},
+            ],
+        )
+        # a directive's group includes the User-agent lines after it
+        self.assertEqual(
+            robotstxt_directives(
+                "User-agent: a\nCrawl-delay: 1\nUser-agent: b\nDisallow: /\nUser-agent: c\nCrawl-delay: 2"
+            ),
+            [
+                {"directive": "crawl-delay", "value": "1", "source": 2, "group_index": 0, "user_agents": '["a","b"]'},
+                {"directive": "crawl-delay", "value": "2", "source": 6, "group_index": 1, "user_agents": '["c"]'},
+            ],
+        )
+
+    def test_robotstxt_index(self):
+        db.execute("create virtual table temp.robots using robotstxt_index(agent='Twitterbot')")
+        allowed = lambda host, path: db.execute(
+            "select allowed from temp.robots where host = ? and path = ?", [host, path]
+        ).fetchone()
+        db.execute(
+            "insert into temp.robots(host, robotstxt) values (?, ?)",
+            ["google.com", GOOGLE_ROBOTSTXT],
+        )
+        self.assertEqual(allowed("google.com", "/search")[0], 1)
+        self.assertEqual(allowed("google.com", "/groups")[0], 0)
+        self.assertEqual(allowed("GOOGLE.com", "/groups?q=1")[0], 0)
+        self.assertIsNone(allowed("example.com", "/"))
+
+        # re-inserting a host replaces its rules
+        db.execute(
+            "insert into temp.robots(host, robotstxt) values (?, ?)",
+            ["google.com", "User-agent: *\nDisallow: /search"],
+        )
+        self.assertEqual(allowed("google.com", "/search")[0], 0)
+        self.assertEqual(allowed("google.com", "/groups")[0], 1)
+
+        db.execute(
+            "insert into temp.robots(host, robotstxt) values ('example.com', robotstxt_compile(?))",
+            ["User-agent: Twitterbot\nDisallow: /private\nAllow: /private/ok$"],
+        )
+        self.assertEqual(allowed("example.com", "/private/x")[0], 0)
+        self.assertEqual(allowed("example.com", "/private/ok")[0], 1)
+        self.assertEqual(
+            execute_all(
+                "select host, allowed from temp.robots where path = '/search' order by host"
+            ),
+            [{"host": "example.com", "allowed": 1}, {"host": "google.com", "allowed": 0}],
+        )
+
+        # a rolled back insert doesn't leave its rules behind in memory
+        db.commit()
+        db.execute("begin")
+        db.execute(
+            "insert into temp.robots(host, robotstxt) values (?, ?)",
+            ["example.com", "User-agent: *\nDisallow: /"],
+        )
+        self.assertEqual(allowed("example.com", "/private/ok")[0], 0)
+        db.rollback()
+        self.assertEqual(allowed("example.com", "/private/ok")[0], 1)
+        self.assertEqual(allowed("example.com", "/private/x")[0], 0)
+
+        db.execute("delete from temp.robots where host = 'google.com'")
+        self.assertIsNone(allowed("google.com", "/search"))
+        with self.assertRaisesRegex(sqlite3.OperationalError, "UPDATE"):
+            db.execute("update temp.robots set robotstxt = '' where host = 'example.com'")
+        with self.assertRaisesRegex(sqlite3.OperationalError, "agent"):
+            db.execute("create virtual table temp.x using robotstxt_index()")
+        db.execute("drop table temp.robots")
+
+    def test_robotstxt_limits_configure(self):
+        rules = lambda robotstxt: [
+            row["path"]
+            for row in execute_all("select path from robotstxt_rules(?)", [robotstxt])
+        ]
+        matches = lambda robotstxt, path: db.execute(
+            "select robotstxt_matches(?, 'bot', ?)", [robotstxt, path]
+        ).fetchone()[0]
+        robotstxt = "User-agent: *\nDisallow: /a\nDisallow: /bbbbbbbbbb\nDisallow: /c\n"
+
+        # HTML pages served as robots.txt are treated as empty files
+        html = "<!DOCTYPE html>\n<html>\nUser-agent: *\nDisallow: /\n</html>"
+        self.assertEqual(matches(html, "/x"), 1)
+        self.assertEqual(rules(html), [])
+        self.assertEqual(
+            execute_all("select * from robotstxt_user_agents(?)", [html]), []
+        )
+
+        try:
+            db.execute("select robotstxt_limits_configure(0, 0, 2)")
+            self.assertEqual(rules(robotstxt), ["/a", "/bbbbbbbbbb"])
+            self.assertEqual(matches(robotstxt, "/c"), 1)
+
+            db.execute("select robotstxt_limits_configure(39, 0, 0)")
+            self.assertEqual(rules(robotstxt), ["/a", "/b"])
+            self.assertEqual(matches(robotstxt, "/bx"), 0)
+            self.assertEqual(matches(robotstxt, "/c"), 1)
+
+            db.execute("select robotstxt_limits_configure(0, 15, 0)")
+            self.assertEqual(rules(robotstxt), ["/a", "/bbbb", "/c"])
+            self.assertEqual(
+                db.execute(
+                    "select robotstxt_matches(robotstxt_compile(?), 'bot', '/bbbbx')",
+                    [robotstxt],
+                ).fetchone()[0],
+                0,
+            )
+
+            with self.assertRaisesRegex(sqlite3.OperationalError, "max_rules must not be negative"):
+                db.execute("select robotstxt_limits_configure(0, 0, -1)")
+
+            # the limits only affect oversized files, so these stay usable in
+            # indexes and generated columns
+            SQLITE_DETERMINISTIC = 0x800
+            for name in ["robotstxt_matches", "robotstxt_compile", "robotstxt_crawl_delay"]:
+                flags = db.execute(
+                    "select flags from pragma_function_list where name = ?", [name]
+                ).fetchone()[0]
+                self.assertEqual(flags & SQLITE_DETERMINISTIC, SQLITE_DETERMINISTIC, name)
+        finally:
+            db.execute("select robotstxt_limits_configure(500 * 1024, 2083 * 8 - 1, 0)")
+        self.assertEqual(rules(robotstxt), ["/a", "/bbbbbbbbbb", "/c"])
+
+    def test_robotstxt_limits(self):
+        limits = lambda: json.loads(db.execute("select robotstxt_limits()").fetchone()[0])
+        self.assertEqual(
+            limits(), {"max_bytes": 500 * 1024, "max_line_length": 2083 * 8 - 1, "max_rules": 0}
+        )
+        try:
+            db.execute("select robotstxt_limits_configure(1000, 0, 10)")
+            self.assertEqual(limits(), {"max_bytes": 1000, "max_line_length": 0, "max_rules": 10})
+        finally:
+            db.execute("select robotstxt_limits_configure(500 * 1024, 2083 * 8 - 1, 0)")
+
+    def test_robotstxt_shared_cache_configure(self):
+        shared_stats = lambda: json.loads(
+            db.execute("select robotstxt_shared_cache_stats()").fetchone()[0]
+        )
+        robotstxt = GOOGLE_ROBOTSTXT + "\n# shared cache"
+        matches = lambda conn, path: conn.execute(
+            "select robotstxt_matches(?, 'Twitterbot', ?)", [robotstxt, path]
+        ).fetchone()[0]
+        other = connect(EXT_PATH)
+        try:
+            self.assertEqual(
+                db.execute("select robotstxt_shared_cache_configure(100, 10000000)").fetchone()[0],
+                1,
+            )
+            before = shared_stats()
+            self.assertEqual(matches(db, "/search"), 0)
+            # parsed by the first connection, so the second one finds it compiled
+            self.assertEqual(matches(other, "/search"), 0)
+            self.assertEqual(matches(other, "/"), 1)
+            after = shared_stats()
+            self.assertEqual(after["misses"] - before["misses"], 1)
+            self.assertEqual(after["hits"] - before["hits"], 1)
+            self.assertGreaterEqual(after["entries"], 1)
+            self.assertEqual(
+                json.loads(other.execute("select robotstxt_cache_stats()").fetchone()[0])[
+                    "shared_hits"
+                ],
+                1,
+            )
+
+            db.execute("select robotstxt_shared_cache_configure(0, 0)")
+            self.assertEqual(shared_stats()["entries"], 0)
+            self.assertEqual(matches(db, "/groups"), 1)
+            self.assertEqual(shared_stats()["misses"], after["misses"])
+            with self.assertRaisesRegex(sqlite3.OperationalError, "must not be negative"):
+                db.execute("select robotstxt_shared_cache_configure(-1, 0)")
+
+            # process-wide, so views and triggers can't call it
+            db.execute(
+                "create view configure_shared_cache as select robotstxt_shared_cache_configure(1, 1)"
+            )
+            try:
+                with self.assertRaisesRegex(sqlite3.OperationalError, "unsafe use"):
+                    db.execute("select * from configure_shared_cache").fetchall()
+            finally:
+                db.execute("drop view configure_shared_cache")
+        finally:
+            db.execute("select robotstxt_shared_cache_configure(0, 0)")
+            other.close()
+
+    def test_robotstxt_shared_cache_stats(self):
+        stats = json.loads(db.execute("select robotstxt_shared_cache_stats()").fetchone()[0])
+        self.assertEqual(
+            sorted(stats),
+            ["bytes", "entries", "evictions", "hits", "max_bytes", "max_entries", "misses"],
+        )
+        # off until robotstxt_shared_cache_configure() is called
+        self.assertEqual(stats["max_entries"], 0)
+        self.assertEqual(stats["entries"], 0)
+
+    def test_robotstxt_corpus_stats(self):
+        db.execute("create temp table corpus(robotstxt)")
+        db.executemany(
+            "insert into corpus values (?)",
+            [
+                ["User-agent: *\nDisallow: /\n\nUser-agent: GoodBot\nAllow: /\n"],
+                ["User-agent: *\nDisallow: /private\nDisallow: /tmp\n"],
+                ["User-agent: GPTBot\nUser-agent: CCBot\nDisallow: /\n\nUser-agent: *\nDisallow: /private\n"],
+                ["User-agent: gptbot\nDisallow:\n"],
+                [None],
+                ["<html><body>Not found</body></html>"],
+            ],
+        )
+        try:
+            rows = execute_all(
+                "select * from robotstxt_corpus_stats((select json_group_array(robotstxt) from corpus))"
+            )
+            by_statistic = lambda statistic: {
+                row["value"]: row for row in rows if row["statistic"] == statistic
+            }
+            counts = lambda row: (
+                row["count"],
+                row["fully_blocked"],
+                row["partially_blocked"],
+                row["allowed"],
+            )
+            self.assertEqual(by_statistic("files")[None]["count"], 6)
+            self.assertEqual(by_statistic("html_rejected")[None]["count"], 1)
+            agents = by_statistic("agent")
+            self.assertEqual(counts(agents["*"]), (6, 1, 2, 3))
+            self.assertEqual(counts(agents["gptbot"]), (2, 1, 0, 1))
+            self.assertEqual(counts(agents["ccbot"]), (1, 1, 0, 0))
+            self.assertEqual(counts(agents["goodbot"]), (1, 0, 0, 1))
+            self.assertEqual(by_statistic("disallow")["/"]["count"], 2)
+            self.assertEqual(by_statistic("disallow")["/private"]["count"], 2)
+            self.assertEqual(by_statistic("allow")["/"]["count"], 1)
+            self.assertIsNone(by_statistic("disallow")["/"]["fully_blocked"])
+            self.assertEqual(by_statistic("group_rules")[2]["count"], 1)
+            self.assertEqual(by_statistic("group_agents")[2]["count"], 1)
+
+            # the same agents checked in every file, * groups included
+            agents = {
+                row["value"]: counts(row)
+                for row in execute_all(
+                    """
+                      select * from robotstxt_corpus_stats(
+                        (select json_group_array(robotstxt) from corpus),
+                        '["GPTBot", "OtherBot"]'
+                      )
+                      where statistic = 'agent'
+                    """
+                )
+            }
+            self.assertEqual(agents, {"GPTBot": (6, 2, 1, 3), "OtherBot": (6, 1, 2, 3)})
+
+            with self.assertRaisesRegex(sqlite3.OperationalError, "JSON array"):
+                db.execute(
+                    "select * from robotstxt_corpus_stats((select json_group_array(robotstxt) from corpus), 'GPTBot')"
+                ).fetchall()
+            # the corpus is data, never a query to run
+            with self.assertRaisesRegex(sqlite3.OperationalError, "corpus is not a JSON array"):
+                db.execute(
+                    "select * from robotstxt_corpus_stats('delete from corpus')"
+                ).fetchall()
+            self.assertEqual(db.execute("select count(*) from corpus").fetchone()[0], 6)
+        finally:
+            db.execute("drop table corpus")
+
+    def test_robotstxt_stats(self):
+        stats = lambda: {
+            row["name"]: row["value"]
+            for row in execute_all("select name, value from robotstxt_stats()")
+        }
+        db.execute("select robotstxt_stats_reset()")
+        robotstxt = GOOGLE_ROBOTSTXT + "\n# stats table"
+        db.execute(
+            "select robotstxt_matches(json_extract(value, '$[0]'), 'Twitterbot', json_extract(value, '$[1]')) from json_each(?)",
+            [json.dumps([[robotstxt, "/search"], [robotstxt, "/groups"]])],
+        ).fetchall()
+        db.execute(
+            "select robotstxt_allowed_agents(?, '[\"a\", \"b\", \"c\"]', '/')",
+            [robotstxt],
+        ).fetchall()
+        after = stats()
+        self.assertEqual(after["parses"], 1)
+        self.assertEqual(after["bytes_parsed"], len(robotstxt.encode()))
+        self.assertEqual(after["largest_document"], len(robotstxt.encode()))
+        self.assertEqual(after["matches"], 5)
+        self.assertEqual(after["cache_misses"], 1)
+        self.assertEqual(after["cache_hits"], 2)
+        self.assertGreater(after["parse_nanos"], 0)
+        self.assertGreaterEqual(after["match_nanos"], 0)
+
+        # table functions parse their argument on every query
+        for table in [
+            "robotstxt_rules",
+            "robotstxt_user_agents",
+            "robotstxt_sitemaps",
+            "robotstxt_directives",
+        ]:
+            db.execute("select robotstxt_stats_reset()")
+            db.execute(f"select * from {table}(?)", [robotstxt]).fetchall()
+            parsed = stats()
+            self.assertEqual(parsed["parses"], 1, table)
+            self.assertEqual(parsed["bytes_parsed"], len(robotstxt.encode()), table)
+            self.assertGreater(parsed["parse_nanos"], 0, table)
+        self.assertEqual(
+            list(after),
+            [
+                "parses",
+                "bytes_parsed",
+                "parse_nanos",
+                "largest_document",
+                "truncated",
+                "html_rejected",
+                "matches",
+                "match_nanos",
+                "cache_hits",
+                "cache_misses",
+                "cache_evictions",
+                "cache_shared_hits",
+                "cache_entries",
+                "cache_bytes",
+            ],
+        )
+
+    def test_robotstxt_stats_reset(self):
+        db.execute("select robotstxt_matches(?, 'bot', '/')", [GOOGLE_ROBOTSTXT]).fetchall()
+        self.assertEqual(db.execute("select robotstxt_stats_reset()").fetchone()[0], 1)
+        self.assertEqual(
+            execute_all(
+                "select name from robotstxt_stats() where value != 0 and name not like 'cache_%'"
+            ),
+            [],
+        )
+        # cached files are kept
+        self.assertEqual(
+            execute_all("select value > 0 as kept from robotstxt_stats() where name = 'cache_entries'"),
+            [{"kept": 1}],
+        )
+
 
 class TestCoverage(unittest.TestCase):
     def test_coverage(self):